@@ -0,0 +1,292 @@
+# api/circuit_breaker.py
+"""
+Circuit breaker for calls to upstream services.
+
+  closed    -> calls go through; the circuit opens after `failure_threshold`
+               consecutive failures, or when over the last `window_s` (at
+               least `min_calls` calls) the error rate reaches `error_rate` or
+               the share of calls slower than `slow_call_s` reaches `slow_rate`
+  open      -> calls fail fast with CircuitOpen until `reset_timeout_s` passes
+  half_open -> up to `half_open_max` trial calls go through; a success closes
+               the circuit, a failure re-opens it
+
+With a `probe` (an async callable returning True when the service answers),
+the first caller after `reset_timeout_s` starts the probe in the background
+and still fails fast; only a successful probe lets trial calls through, so
+users never pay for finding out the service is still down.
+
+Usage:
+
+    ticket = breaker.before_call()     # raises CircuitOpen while open
+    t0 = time.perf_counter()
+    try:
+        try:
+            resp = await call()
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success(time.perf_counter() - t0)
+    finally:
+        breaker.release(ticket)        # a half-open slot the call never recorded
+
+A half-open trial slot is held from before_call() until the call is
+recorded; a trial that is cancelled (client gone, wait_for) or raises
+something the caller does not record must give it back with release(), or
+the breaker would stay half-open with no slots left.
+
+State is per process; each uvicorn worker trips independently.
+
+upstream_breaker(url) returns the shared breaker for the URL's host (Graph,
+the SharePoint upload host, the Entra token endpoint, Genius), configured
+from UPSTREAM_BREAKER_* and probing the host itself.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from .config import (
+    UPSTREAM_BREAKER_ERROR_RATE,
+    UPSTREAM_BREAKER_FAILURES,
+    UPSTREAM_BREAKER_MIN_CALLS,
+    UPSTREAM_BREAKER_PROBE_TIMEOUT_S,
+    UPSTREAM_BREAKER_RESET_S,
+    UPSTREAM_BREAKER_SLOW_CALL_S,
+    UPSTREAM_BREAKER_SLOW_RATE,
+    UPSTREAM_BREAKER_WINDOW_S,
+)
+
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpen(Exception):
+    def __init__(self, name: str, retry_after: float) -> None:
+        super().__init__(f"{name} is unavailable (circuit open)")
+        self.name = name
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        *,
+        failure_threshold: int = 5,
+        reset_timeout_s: float = 30.0,
+        half_open_max: int = 1,
+        window_s: float = 0.0,  # 0: consecutive failures only
+        min_calls: int = 10,
+        error_rate: float = 0.5,
+        slow_call_s: float = 0.0,  # 0: latency not considered
+        slow_rate: float = 0.8,
+        probe: Optional[Callable[[], Awaitable[bool]]] = None,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout_s = reset_timeout_s
+        self.half_open_max = max(1, half_open_max)
+        self.window_s = window_s
+        self.min_calls = max(1, min_calls)
+        self.error_rate = error_rate
+        self.slow_call_s = slow_call_s
+        self.slow_rate = slow_rate
+        self.probe = probe
+
+        self.state = CLOSED
+        self._failures = 0  # consecutive
+        self._opened_at = 0.0
+        self._probes = 0  # in flight while half-open
+        self._epoch = 0  # bumped on every transition: tickets of a past state
+        self._probe_task: Optional[asyncio.Task] = None
+        self._calls: deque = deque()  # (t, failed, slow) within window_s
+        self.reason = ""
+
+        self.total_failures = 0
+        self.total_slow = 0
+        self.total_rejected = 0
+        self.times_opened = 0
+
+    # --- state machine ---
+    def before_call(self) -> Optional[int]:
+        """
+        Reserve a call or raise CircuitOpen. Returns the ticket to pass to
+        release() once the call is over (None unless it took a trial slot).
+        """
+        if self.state == OPEN:
+            remaining = self._opened_at + self.reset_timeout_s - time.monotonic()
+            if remaining > 0:
+                self.total_rejected += 1
+                raise CircuitOpen(self.name, remaining)
+            if self.probe is not None:
+                self._start_probe()
+                self.total_rejected += 1
+                raise CircuitOpen(self.name, 1)
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_max:
+                self.total_rejected += 1
+                raise CircuitOpen(self.name, self.reset_timeout_s)
+            self._probes += 1
+            return self._epoch
+        return None
+
+    def release(self, ticket: Optional[int]) -> None:
+        """Give back a trial slot whose call ended without being recorded."""
+        if ticket is not None and ticket == self._epoch and self._probes > 0:
+            self._probes -= 1  # recorded calls moved the epoch on already
+
+    def record_success(self, latency_s: Optional[float] = None) -> None:
+        slow = bool(self.slow_call_s and latency_s and latency_s >= self.slow_call_s)
+        self._failures = 0
+        self._record(False, slow)
+        if self.state == HALF_OPEN:
+            if slow:
+                self._open(f"slow trial call ({latency_s:.1f}s)")
+            else:
+                self._transition(CLOSED)
+
+    def record_failure(self, latency_s: Optional[float] = None) -> None:
+        slow = bool(self.slow_call_s and latency_s and latency_s >= self.slow_call_s)
+        self._failures += 1
+        self.total_failures += 1
+        self._record(True, slow)
+        if self.state == HALF_OPEN:
+            self._open("trial call failed")
+        elif self._failures >= self.failure_threshold:
+            self._open(f"{self._failures} consecutive failures")
+
+    def _record(self, failed: bool, slow: bool) -> None:
+        self.total_slow += slow
+        if not self.window_s:
+            return
+        now = time.monotonic()
+        self._calls.append((now, failed, slow))
+        while self._calls and self._calls[0][0] < now - self.window_s:
+            self._calls.popleft()
+        n = len(self._calls)
+        if self.state != CLOSED or n < self.min_calls:
+            return
+        failed_n = sum(1 for _, f, _ in self._calls if f)
+        slow_n = sum(1 for _, _, s in self._calls if s)
+        if failed_n / n >= self.error_rate:
+            self._open(f"{failed_n}/{n} calls failed in {self.window_s:.0f}s")
+        elif self.slow_call_s and slow_n / n >= self.slow_rate:
+            self._open(f"{slow_n}/{n} calls slower than {self.slow_call_s:.1f}s")
+
+    def _open(self, reason: str) -> None:
+        self.reason = reason
+        if self.state == OPEN:  # failed probe: restart the timer
+            self._opened_at = time.monotonic()
+            return
+        self._transition(OPEN)
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        detail = f" ({self.reason})" if state == OPEN and self.reason else ""
+        logger.warning(f"[BREAKER] {self.name}: {self.state} -> {state}{detail}")
+        self.state = state
+        self._probes = 0
+        self._epoch += 1
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            self.times_opened += 1
+        elif state == CLOSED:
+            self._failures = 0
+            self._calls.clear()
+            self.reason = ""
+
+    # --- probe ---
+    def _start_probe(self) -> None:
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.get_running_loop().create_task(self._run_probe())
+
+    async def _run_probe(self) -> None:
+        t0 = time.perf_counter()
+        try:
+            ok = await self.probe()
+        except Exception as e:
+            logger.debug(f"[BREAKER] {self.name}: probe error {e!r}")
+            ok = False
+        latency = time.perf_counter() - t0
+        if self.state != OPEN:
+            return
+        if ok and not (self.slow_call_s and latency >= self.slow_call_s):
+            self._transition(HALF_OPEN)  # real calls confirm before closing
+        else:
+            self._open("probe failed" if not ok else f"slow probe ({latency:.1f}s)")
+
+    def snapshot(self) -> dict:
+        n = len(self._calls)
+        snap = {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "failures": self.total_failures,
+            "rejected": self.total_rejected,
+            "times_opened": self.times_opened,
+        }
+        if self.window_s:
+            snap["window_calls"] = n
+            snap["window_error_rate"] = (
+                round(sum(1 for _, f, _ in self._calls if f) / n, 3) if n else 0.0
+            )
+        if self.slow_call_s:
+            snap["slow"] = self.total_slow
+        if self.state == OPEN:
+            snap["reason"] = self.reason
+            snap["retry_in_s"] = round(
+                max(0.0, self._opened_at + self.reset_timeout_s - time.monotonic()), 1
+            )
+        return snap
+
+
+# ---------------------------------------------------------------------------- #
+# One breaker per upstream host
+def is_upstream_failure(resp: httpx.Response) -> bool:
+    """5xx counts against the host, except a 503 throttle (it has Retry-After)."""
+    if resp.status_code == 503 and "Retry-After" in resp.headers:
+        return False
+    return resp.status_code >= 500
+
+
+_upstreams: Dict[str, CircuitBreaker] = {}
+
+
+def _host_probe(base_url: str) -> Callable[[], Awaitable[bool]]:
+    async def probe() -> bool:
+        # any answer below 500 (401/404 included) means the host is serving
+        async with httpx.AsyncClient(timeout=UPSTREAM_BREAKER_PROBE_TIMEOUT_S) as c:
+            resp = await c.head(base_url)
+        return resp.status_code < 500
+
+    return probe
+
+
+def upstream_breaker(url) -> CircuitBreaker:
+    """The breaker for `url`'s host (created on first use)."""
+    u = httpx.URL(str(url))
+    host = u.host
+    if host not in _upstreams:
+        _upstreams[host] = CircuitBreaker(
+            host,
+            failure_threshold=UPSTREAM_BREAKER_FAILURES,
+            reset_timeout_s=UPSTREAM_BREAKER_RESET_S,
+            window_s=UPSTREAM_BREAKER_WINDOW_S,
+            min_calls=UPSTREAM_BREAKER_MIN_CALLS,
+            error_rate=UPSTREAM_BREAKER_ERROR_RATE,
+            slow_call_s=UPSTREAM_BREAKER_SLOW_CALL_S,
+            slow_rate=UPSTREAM_BREAKER_SLOW_RATE,
+            probe=_host_probe(f"{u.scheme}://{u.netloc.decode('ascii')}/"),
+        )
+    return _upstreams[host]
+
+
+def upstream_snapshot() -> dict:
+    return {host: b.snapshot() for host, b in _upstreams.items()}
@@ -38,6 +38,25 @@ _missing = [
 if _missing:
     raise RuntimeError(f"Missing required env vars: {', '.join(_missing)}")
 
+# Upstream circuit breakers, one per host (Graph, SharePoint, Entra, Genius)
+UPSTREAM_BREAKER_FAILURES = int(os.getenv("UPSTREAM_BREAKER_FAILURES", 5))
+UPSTREAM_BREAKER_RESET_S = float(os.getenv("UPSTREAM_BREAKER_RESET_S", 15))
+UPSTREAM_BREAKER_WINDOW_S = float(os.getenv("UPSTREAM_BREAKER_WINDOW_S", 60))
+UPSTREAM_BREAKER_MIN_CALLS = int(os.getenv("UPSTREAM_BREAKER_MIN_CALLS", 10))
+UPSTREAM_BREAKER_ERROR_RATE = float(os.getenv("UPSTREAM_BREAKER_ERROR_RATE", 0.5))
+# metadata calls slower than this count as slow (bulk uploads are not timed)
+UPSTREAM_BREAKER_SLOW_CALL_S = float(os.getenv("UPSTREAM_BREAKER_SLOW_CALL_S", 5))
+UPSTREAM_BREAKER_SLOW_RATE = float(os.getenv("UPSTREAM_BREAKER_SLOW_RATE", 0.8))
+UPSTREAM_BREAKER_PROBE_TIMEOUT_S = float(
+    os.getenv("UPSTREAM_BREAKER_PROBE_TIMEOUT_S", 3)
+)
+
+# Request tracing (api/tracing.py): share of /api requests that get spans,
+# a Server-Timing header and a [TRACE] log line (X-Trace: 1 always does)
+TRACE_SAMPLE_RATE = float(
+    os.getenv("TRACE_SAMPLE_RATE", 0.01 if APP_MODE == "prod" else 1.0)
+)
+
 # Directory setup
 BASE_DIR = Path(__file__).resolve().parent.parent
 STATIC_DIR = BASE_DIR / "static"
@@ -46,6 +65,16 @@ CADDY_DATA_DIR = BASE_DIR / "caddy-data"
 # Create directories if they don't exist
 STATIC_DIR.mkdir(exist_ok=True)
 
+# Prometheus metrics (api/metrics.py): one set of value files per worker in a
+# shared directory, summed at scrape time. prometheus_client reads the env
+# var when first imported, so it is set here, before any import of it.
+METRICS_DIR = Path(
+    os.getenv("PROMETHEUS_MULTIPROC_DIR", str(BASE_DIR / "logs/server/state/metrics"))
+)
+METRICS_DIR.mkdir(parents=True, exist_ok=True)
+os.environ["PROMETHEUS_MULTIPROC_DIR"] = str(METRICS_DIR)
+EVENT_LOOP_LAG_INTERVAL_S = float(os.getenv("EVENT_LOOP_LAG_INTERVAL_S", 0.5))
+
 # Logger name
 APP_LOGGER = os.getenv("APP_LOGGER", "api")
 
@@ -0,0 +1,110 @@
+# api/file_lock.py
+"""
+Inter-process file lock shared by the uvicorn workers (and the vision worker
+processes) of one machine.
+
+    with FileLock(path, timeout_s=30):
+        ...  # one process at a time
+
+    lock = FileLock(path, timeout_s=30)
+    await lock.acquire_async()  # on the event loop: polls without a thread
+    try: ...
+    finally: lock.release()
+
+Uses fcntl.flock on POSIX and msvcrt.locking on Windows (production runs
+there, see server/). The lock file itself is never deleted; its content is
+irrelevant. Acquisition polls, so it can time out on both platforms, and the
+OS releases the lock if the holder dies.
+"""
+
+import os
+import time
+import asyncio
+from pathlib import Path
+from typing import Optional
+
+if os.name == "nt":
+    import msvcrt
+
+    def _try_lock(fd: int) -> bool:
+        try:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def _unlock(fd: int) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _try_lock(fd: int) -> bool:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def _unlock(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class FileLock:
+    def __init__(
+        self, path, timeout_s: Optional[float] = None, poll_s: float = 0.05
+    ) -> None:
+        self.path = Path(path)
+        self.timeout_s = timeout_s
+        self.poll_s = poll_s
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Take the lock; False if `blocking` is off and another process has it."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = None if self.timeout_s is None else time.monotonic() + self.timeout_s
+        while not _try_lock(fd):
+            if not blocking:
+                os.close(fd)
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                os.close(fd)
+                raise TimeoutError(f"Timed out waiting for lock {self.path}")
+            time.sleep(self.poll_s)
+        self._fd = fd
+        return True
+
+    async def acquire_async(self, blocking: bool = True) -> bool:
+        """
+        `acquire` for coroutines. Each attempt is a non-blocking syscall made
+        on the loop and the wait is an asyncio.sleep, so a cancelled waiter
+        never ends up holding the lock (as a thread still waiting in
+        `acquire` would once the caller has gone).
+        """
+        deadline = None if self.timeout_s is None else time.monotonic() + self.timeout_s
+        while not self.acquire(blocking=False):
+            if not blocking:
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Timed out waiting for lock {self.path}")
+            await asyncio.sleep(self.poll_s)
+        return True
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        try:
+            _unlock(self._fd)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
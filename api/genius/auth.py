@@ -5,6 +5,9 @@ Minimal Genius ERP auth helper.
 - Adds Authorization header to all Genius requests
 - On 401, re-logs in once and retries
 - Reuses a single AsyncClient (fast connection pooling)
+- Fails fast (CircuitOpen) while the Genius host's circuit breaker is open
+- Login and every call are spans of a traced request (api/tracing.py), and
+  are counted and timed in /api/metrics
 
 Required env vars:
   GENIUS_HOST           e.g., "https://genius.company.com" (no trailing slash)
@@ -14,11 +17,16 @@ Required env vars:
 """
 
 import os
+import time
 import logging
 from typing import Optional
 import anyio
 import httpx
 
+from ..circuit_breaker import is_upstream_failure, upstream_breaker
+from ..metrics import count_response, observe_upstream
+from ..tracing import span
+
 # ---- Minimal required configuration via env ----
 GENIUS_HOST = os.getenv("GENIUS_HOST")
 GENIUS_COMPANY_CODE = os.getenv("GENIUS_COMPANY_CODE")
@@ -44,9 +52,11 @@ class _GeniusAuth:
             timeout=httpx.Timeout(4.0),
             headers={"Accept": "application/json"},
         )
+        self._breaker = upstream_breaker(self._base_url)
         self._token: Optional[str] = None
         self._login_lock = anyio.Lock()
 
+    @span("genius.login")
     async def _login(self) -> str:
         """
         POST /api/auth with minimal payload. Token is returned in 'Result'.
@@ -57,7 +67,7 @@ class _GeniusAuth:
             "Password": self._password,
         }
 
-        resp = await self._client.post("/api/auth", json=payload)
+        resp = await self._send("POST", "/api/auth", json=payload)
         if resp.status_code != 200:
             raise httpx.HTTPStatusError(
                 "Genius login failed", request=resp.request, response=resp
@@ -71,6 +81,32 @@ class _GeniusAuth:
         self._client.headers["Authorization"] = f"Bearer {token}"
         return token
 
+    @span("genius.call")
+    async def _send(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """One call through the host's circuit breaker."""
+        ticket = self._breaker.before_call()
+        t0 = time.perf_counter()
+        try:
+            try:
+                resp = await self._client.request(method, path, **kwargs)
+            except Exception:
+                self._breaker.record_failure()
+                count_response(self._breaker.name, "error")
+                raise
+            latency = time.perf_counter() - t0
+            if is_upstream_failure(resp):
+                self._breaker.record_failure(latency)
+            else:
+                self._breaker.record_success(latency)
+        finally:
+            self._breaker.release(ticket)  # cancelled: give back a trial slot
+        count_response(self._breaker.name, resp.status_code)
+        # op: the entity (or "auth"), not the full path
+        observe_upstream(
+            self._breaker.name, path.rstrip("/").rsplit("/", 1)[-1], latency
+        )
+        return resp
+
     async def _ensure_token(self) -> None:
         if self._token:
             # Header should already be present; keep it cheap.
@@ -85,7 +121,7 @@ class _GeniusAuth:
         Retries once on 401 by re-logging in.
         """
         await self._ensure_token()
-        resp = await self._client.request(method, path, **kwargs)
+        resp = await self._send(method, path, **kwargs)
         if resp.status_code != 401:
             return resp
 
@@ -95,7 +131,7 @@ class _GeniusAuth:
             self._token = None
             self._client.headers.pop("Authorization", None)
             await self._login()
-        return await self._client.request(method, path, **kwargs)
+        return await self._send(method, path, **kwargs)
 
     async def aclose(self) -> None:
         await self._client.aclose()
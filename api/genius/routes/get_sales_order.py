@@ -3,6 +3,7 @@ import logging
 from collections import OrderedDict
 from fastapi import APIRouter, HTTPException
 
+from ...tracing import span
 from ..auth import genius_get
 from ..schemas import Item, SOResponse
 
@@ -50,10 +51,11 @@ def validate_items(lines):
 @router.get("/sales-order/{order_no}", response_model=SOResponse)
 async def sales_order(order_no: str):
 
-    items_res = await genius_get(
-        "/api/data/fetch/salesOrderDetailEntity",
-        params={"filter": f"SalesOrderHeaderCode={order_no}"},
-    )
+    async with span("so.lines"):
+        items_res = await genius_get(
+            "/api/data/fetch/salesOrderDetailEntity",
+            params={"filter": f"SalesOrderHeaderCode={order_no}"},
+        )
 
     if items_res.status_code != 200:
         logger.warning(
@@ -74,10 +76,11 @@ async def sales_order(order_no: str):
         logger.warning(f"Genius 404: Order {order_no} not found in Genius")
         raise HTTPException(404, f"Order {order_no} not found in Genius")
 
-    cust_name_res = await genius_get(
-        "/api/data/fetch/salesOrderHeaderEntity",
-        params={"filter": f"Code={order_no}"},
-    )
+    async with span("so.customer"):
+        cust_name_res = await genius_get(
+            "/api/data/fetch/salesOrderHeaderEntity",
+            params={"filter": f"Code={order_no}"},
+        )
 
     if cust_name_res.status_code != 200:
         logger.warning(
@@ -48,6 +48,11 @@ class TopPrependFileHandler(logging.Handler):
                 self._prepend_locked(self._buf)
                 self._buf.clear()
 
+    @property
+    def pending_lines(self) -> int:
+        """Session lines buffered, not yet written."""
+        return len(self._buf)
+
     # --- logging.Handler API ---
     def emit(self, record: logging.LogRecord) -> None:  # type: ignore[override]
         try:
@@ -7,11 +7,14 @@ TODO:
 """
 
 import os
+import asyncio
 import logging
+import shutil
 import uvicorn
 from contextlib import asynccontextmanager
 from datetime import datetime
-from fastapi import FastAPI, Response
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 
 # Import configuration and setup modules
@@ -24,9 +27,13 @@ from .config import (
     WORKERS,
     STATIC_DIR,
     CADDY_DATA_DIR,
+    METRICS_DIR,
     get_uvicorn_config,
 )
 from .auth import add_auth_to_router
+from .circuit_breaker import CircuitOpen, upstream_snapshot
+from .metrics import CONTENT_TYPE_LATEST, render as render_metrics
+from .metrics import start_metrics, stop_metrics
 from .middleware import setup_middleware
 from .internal_logging.setup import setup_logging, SERVER_LOGS_DIR
 
@@ -36,9 +43,13 @@ app_logger = logging.getLogger(APP_LOGGER)
 
 # Import routers
 from .genius import router as genius_router
-from .sharepoint import router as sharepoint_router
+from .sharepoint import router as sharepoint_router, start_sharepoint, stop_sharepoint
+from .sharepoint.drive_index import drive_index
+from .sharepoint.ingest import ingest_spool
+from .sharepoint.thumbs import thumb_cache
+from .sharepoint.graph_http import graph
 from .log_endpoints import router as logging_router
-from .vision import router as vision_router
+from .vision import router as vision_router, start_vision, stop_vision
 
 
 @asynccontextmanager
@@ -56,9 +67,16 @@ async def lifespan(app: FastAPI):
     else:
         app_logger.info("Running in single worker mode")
 
+    await start_metrics()
+    await start_vision()
+    await start_sharepoint()
+
     yield  # Server runs
 
     # Shutdown
+    await stop_sharepoint()
+    await stop_vision()
+    await stop_metrics()
     app_logger.info(f"QC Photos App API shutting down (PID: {pid})")
 
 
@@ -80,6 +98,16 @@ app.include_router(add_auth_to_router(logging_router))
 app.include_router(add_auth_to_router(sharepoint_router))
 
 
+@app.exception_handler(CircuitOpen)
+async def circuit_open_handler(request: Request, exc: CircuitOpen):
+    """An upstream (Graph, SharePoint, Genius) is down: fail fast, say when to retry"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"{exc} - retry in {exc.retry_after}s"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 # ========== PUBLIC ENDPOINTS (No Auth Required) ==========
 @app.get("/api/health")
 async def health_check():
@@ -92,9 +120,21 @@ async def health_check():
         "services": {"vision": "active", "logging": "active", "genius_proxy": "active"},
         "directories": {"static": str(STATIC_DIR), "logs": str(SERVER_LOGS_DIR)},
         "auth": "enabled",
+        "graph": graph.snapshot(),
+        "drive_index": drive_index.snapshot(),
+        "thumbs": thumb_cache.snapshot(),
+        "ingest": ingest_spool.snapshot(),
+        "upstreams": upstream_snapshot(),
     }
 
 
+@app.get("/api/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics, summed over all workers - PUBLIC (no auth required)"""
+    body = await asyncio.to_thread(render_metrics)
+    return Response(content=body, media_type=CONTENT_TYPE_LATEST)
+
+
 @app.get("/api/crt")
 async def get_ca_certificate():
     """Endpoint to download Caddy's internal CA certificate - PUBLIC"""
@@ -136,6 +176,10 @@ if __name__ == "__main__":
 
     uvicorn_options = get_uvicorn_config()
 
+    # metric files of the last run's workers (their pids may be reused)
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
+    METRICS_DIR.mkdir(parents=True, exist_ok=True)
+
     if APP_MODE == "prod":
         app_logger.info(f"Production mode: Starting {WORKERS} worker(s)")
     else:
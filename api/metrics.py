@@ -0,0 +1,209 @@
+# api/metrics.py
+"""
+Prometheus metrics, summed over every uvicorn worker.
+
+prometheus_client runs in multiprocess mode: each worker writes its values
+to files in METRICS_DIR (PROMETHEUS_MULTIPROC_DIR, set in config.py before
+prometheus_client is imported), and /api/metrics reads them all. The
+supervisor (`python -m api.main`) clears the directory before any worker
+starts; a worker marks its live gauges dead on shutdown.
+
+    qc_http_requests_total{method,route,status}        route = path template
+    qc_http_request_duration_seconds{method,route}     histogram
+    qc_http_requests_in_progress
+    qc_upstream_request_duration_seconds{host,op}      whole call, retries included
+    qc_upstream_responses_total{host,status}           per attempt ("error": no response)
+    qc_upstream_retries_total{host,op}
+    qc_upstream_throttled_total{host}                  429 / throttling 503
+    qc_cache_lookups_total{cache,result}               thumbs, vision, stats
+    qc_event_loop_lag_seconds                          histogram, plus _max gauge
+    qc_log_buffered_lines                              session log lines not yet written
+
+Hit ratio, e.g.:
+    sum by (cache) (rate(qc_cache_lookups_total{result!="miss"}[5m]))
+      / sum by (cache) (rate(qc_cache_lookups_total[5m]))
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Optional, Union
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import EVENT_LOOP_LAG_INTERVAL_S
+from .internal_logging.top_prepend import TopPrependFileHandler
+
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+HTTP_REQUESTS = Counter(
+    "qc_http_requests_total", "HTTP requests", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "qc_http_request_duration_seconds",
+    "HTTP request latency",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_IN_PROGRESS = Gauge(
+    "qc_http_requests_in_progress",
+    "HTTP requests being served",
+    multiprocess_mode="livesum",
+)
+UPSTREAM_LATENCY = Histogram(
+    "qc_upstream_request_duration_seconds",
+    "Upstream call latency (retries included)",
+    ["host", "op"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_RESPONSES = Counter(
+    "qc_upstream_responses_total", "Upstream attempts by status", ["host", "status"]
+)
+UPSTREAM_RETRIES = Counter(
+    "qc_upstream_retries_total", "Upstream retries", ["host", "op"]
+)
+UPSTREAM_THROTTLED = Counter(
+    "qc_upstream_throttled_total", "Upstream throttling responses", ["host"]
+)
+CACHE_LOOKUPS = Counter(
+    "qc_cache_lookups_total", "Cache lookups by result", ["cache", "result"]
+)
+LOOP_LAG = Histogram(
+    "qc_event_loop_lag_seconds", "Event loop scheduling delay", buckets=LAG_BUCKETS
+)
+LOOP_LAG_MAX = Gauge(
+    "qc_event_loop_lag_max_seconds",
+    "Last event loop delay, worst worker",
+    multiprocess_mode="livemax",
+)
+LOG_BUFFERED = Gauge(
+    "qc_log_buffered_lines",
+    "Session log lines buffered, not yet written",
+    multiprocess_mode="livesum",
+)
+
+
+# ---------------------------------------------------------------------------- #
+def observe_upstream(host: str, op: str, seconds: float) -> None:
+    UPSTREAM_LATENCY.labels(host, op).observe(seconds)
+
+
+def count_response(host: str, status: Union[int, str]) -> None:
+    UPSTREAM_RESPONSES.labels(host, str(status)).inc()
+
+
+def count_retry(host: str, op: str) -> None:
+    UPSTREAM_RETRIES.labels(host, op).inc()
+
+
+def count_throttled(host: str) -> None:
+    UPSTREAM_THROTTLED.labels(host).inc()
+
+
+def cache_lookup(cache: str, result: str) -> None:
+    """result: hit, miss, or e.g. revalidated (served without a download)."""
+    CACHE_LOOKUPS.labels(cache, result).inc()
+
+
+def render() -> bytes:
+    """Every worker's values, summed (reads METRICS_DIR: run in a thread)."""
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+# ---------------------------------------------------------------------------- #
+def _route(scope: Scope) -> str:
+    """Path template, so ids and order numbers do not become label values."""
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "unmatched")
+    return "unmatched" if scope["path"].startswith("/api/") else "static"
+
+
+class MetricsMiddleware:
+    """Counts and times every HTTP request."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        t0 = time.perf_counter()
+
+        async def send_counted(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_counted)
+        finally:
+            HTTP_IN_PROGRESS.dec()
+            route = _route(scope)  # set by the router once matched
+            HTTP_REQUESTS.labels(scope["method"], route, str(status)).inc()
+            HTTP_LATENCY.labels(scope["method"], route).observe(
+                time.perf_counter() - t0
+            )
+
+
+# ---------------------------------------------------------------------------- #
+def _buffered_log_lines() -> int:
+    loggers = [logging.getLogger()] + [
+        lg
+        for lg in logging.Logger.manager.loggerDict.values()
+        if isinstance(lg, logging.Logger)
+    ]
+    return sum(
+        h.pending_lines
+        for lg in loggers
+        for h in lg.handlers
+        if isinstance(h, TopPrependFileHandler)
+    )
+
+
+async def _watch_loop(interval_s: float) -> None:
+    """How late a sleep wakes up = how long the loop was busy elsewhere."""
+    while True:
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval_s)
+        lag = max(0.0, time.perf_counter() - t0 - interval_s)
+        LOOP_LAG.observe(lag)
+        LOOP_LAG_MAX.set(lag)
+        LOG_BUFFERED.set(_buffered_log_lines())
+
+
+_watcher: Optional[asyncio.Task] = None
+
+
+async def start_metrics() -> None:
+    global _watcher
+    _watcher = asyncio.create_task(_watch_loop(EVENT_LOOP_LAG_INTERVAL_S))
+
+
+async def stop_metrics() -> None:
+    if _watcher is not None:
+        _watcher.cancel()
+    try:
+        multiprocess.mark_process_dead(os.getpid())  # drop this worker's gauges
+    except OSError as e:
+        logger.warning(f"[METRICS] could not clear worker gauges: {e}")
@@ -7,7 +7,63 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+from starlette.types import Message, Receive, Scope, Send
 from .config import FORCE_HTTPS
+from .metrics import MetricsMiddleware
+from .tracing import TraceMiddleware
+
+# Already-compressed payloads: gzip only burns CPU and can grow them.
+# Starlette's GZipMiddleware only skips text/event-stream.
+GZIP_EXCLUDED_CONTENT_TYPES = (
+    "text/event-stream",
+    "image/",
+    "video/",
+    "audio/",
+    "application/zip",
+    "application/gzip",
+    "application/pdf",
+)
+
+
+class _SkipCompressedMixin:
+    """Marks excluded media types at response start, before any body is sent."""
+
+    async def send_with_compression(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            await super().send_with_compression(message)
+            # attribute read by IdentityResponder for every body message
+            if content_type.startswith(GZIP_EXCLUDED_CONTENT_TYPES):
+                self.content_type_is_excluded = True
+            return
+        await super().send_with_compression(message)
+
+
+class _GZipResponder(_SkipCompressedMixin, GZipResponder):
+    pass
+
+
+class _IdentityResponder(_SkipCompressedMixin, IdentityResponder):
+    pass
+
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that also leaves images and other compressed media alone."""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if "gzip" in Headers(scope=scope).get("Accept-Encoding", ""):
+            responder = _GZipResponder(
+                self.app, self.minimum_size, compresslevel=self.compresslevel
+            )
+        else:
+            responder = _IdentityResponder(self.app, self.minimum_size)
+        await responder(scope, receive, send)
 
 
 def setup_middleware(app: FastAPI) -> None:
@@ -22,12 +78,18 @@ def setup_middleware(app: FastAPI) -> None:
         CORSMiddleware,
         allow_origins=["*"],
         allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        allow_headers=["Authorization", "Content-Type", "X-Requested-With"],
+        allow_headers=["Authorization", "Content-Type", "X-Requested-With", "X-Trace"],
         allow_credentials=True,  # Important for Authorization header
     )
 
-    # Compression middleware
-    app.add_middleware(GZipMiddleware, minimum_size=1_000)
+    # Compression middleware (skips images / already-compressed media)
+    app.add_middleware(SelectiveGZipMiddleware, minimum_size=1_000)
+
+    # Per-request spans -> Server-Timing header + [TRACE] log (sampled)
+    app.add_middleware(TraceMiddleware)
+
+    # Request count / latency per route -> /api/metrics
+    app.add_middleware(MetricsMiddleware)
 
     # HTTPS redirect (only if explicitly requested)
     if FORCE_HTTPS:
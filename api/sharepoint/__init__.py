@@ -2,6 +2,10 @@ import os
 from fastapi import APIRouter
 from .routes.check import router as check_router
 from .routes.upload import router as upload_router
+from .routes.ingest import router as ingest_router
+from .routes.stats import router as stats_router
+from .routes.thumbs import router as thumbs_router
+from .setup import start_sharepoint, stop_sharepoint
 
 _missing = [
     k
@@ -21,5 +25,8 @@ if _missing:
 router = APIRouter(prefix="/api/sharepoint", tags=["sharepoint"])
 router.include_router(check_router)
 router.include_router(upload_router)
+router.include_router(ingest_router)
+router.include_router(stats_router)
+router.include_router(thumbs_router)
 
-__all__ = ["router"]
+__all__ = ["router", "start_sharepoint", "stop_sharepoint"]
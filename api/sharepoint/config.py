@@ -1,5 +1,61 @@
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 SP_UPLOAD_SESSION_DIR = BASE_DIR / "logs/server"
 SP_UPLOAD_SESSION_DIR.mkdir(parents=True, exist_ok=True)
+
+# State shared by the uvicorn workers of this machine (small files + locks)
+SP_STATE_DIR = Path(os.getenv("SP_STATE_DIR", str(SP_UPLOAD_SESSION_DIR / "state")))
+SP_STATE_DIR.mkdir(parents=True, exist_ok=True)
+
+# Graph throttling: AIMD in-flight window shared by all workers (throttle.py)
+GRAPH_MAX_INFLIGHT = int(os.getenv("GRAPH_MAX_INFLIGHT", 16))
+GRAPH_MIN_INFLIGHT = int(os.getenv("GRAPH_MIN_INFLIGHT", 1))
+GRAPH_THROTTLE_DECREASE = float(os.getenv("GRAPH_THROTTLE_DECREASE", 0.5))
+# one 429 burst shrinks the window once, not once per in-flight request
+GRAPH_THROTTLE_COOLDOWN_S = float(os.getenv("GRAPH_THROTTLE_COOLDOWN_S", 2))
+GRAPH_DEFAULT_RETRY_AFTER_S = float(os.getenv("GRAPH_DEFAULT_RETRY_AFTER_S", 1))
+GRAPH_THROTTLE_SYNC_S = float(os.getenv("GRAPH_THROTTLE_SYNC_S", 0.5))
+
+# Graph client (graph_http.py)
+GRAPH_TIMEOUT_S = float(os.getenv("GRAPH_TIMEOUT_S", 10))
+GRAPH_MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES", 3))
+GRAPH_SLOW_REQUEST_S = float(os.getenv("GRAPH_SLOW_REQUEST_S", 2))
+
+# Graph access token, shared by the workers (graph_auth.py)
+GRAPH_TOKEN_CACHE = SP_STATE_DIR / "graph_token.json"
+GRAPH_TOKEN_REFRESH_AT = float(os.getenv("GRAPH_TOKEN_REFRESH_AT", 0.8))
+
+# /check children listing: page size for @odata.nextLink paging
+CHECK_PAGE_SIZE = int(os.getenv("CHECK_PAGE_SIZE", 200))
+
+# Local index of the photo library, kept current from the drive delta feed
+DRIVE_INDEX_ENABLED = os.getenv("DRIVE_INDEX_ENABLED", "1") == "1"
+DRIVE_INDEX_DB = SP_STATE_DIR / "drive_index.sqlite3"
+DRIVE_INDEX_INTERVAL_S = float(os.getenv("DRIVE_INDEX_INTERVAL_S", 30))
+# /check and the folder ensure trust the index up to this age, else go live
+DRIVE_INDEX_MAX_AGE_S = float(os.getenv("DRIVE_INDEX_MAX_AGE_S", 120))
+# write-through of uploads: wait this long for the sync's write lock, else skip
+DRIVE_INDEX_WRITE_TIMEOUT_S = float(os.getenv("DRIVE_INDEX_WRITE_TIMEOUT_S", 0.25))
+
+# Thumbnail proxy (thumbs.py): disk cache shared by the workers, LRU past the cap
+THUMB_CACHE_DIR = Path(os.getenv("THUMB_CACHE_DIR", str(SP_STATE_DIR / "thumbs")))
+THUMB_CACHE_MAX_MB = float(os.getenv("THUMB_CACHE_MAX_MB", 512))
+# a cached thumbnail is re-checked against its item's eTag after this long
+THUMB_REVALIDATE_S = float(os.getenv("THUMB_REVALIDATE_S", 300))
+THUMB_CLIENT_MAX_AGE_S = int(os.getenv("THUMB_CLIENT_MAX_AGE_S", 3600))
+THUMB_FETCH_CONCURRENCY = int(os.getenv("THUMB_FETCH_CONCURRENCY", 8))
+
+# Resumable tablet uploads (ingest.py): spool shared by the workers
+INGEST_SPOOL_DIR = Path(os.getenv("INGEST_SPOOL_DIR", str(SP_STATE_DIR / "ingest")))
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", 1024 * 1024))  # client hint
+INGEST_MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", 250 * 1024 * 1024))
+# forwarded to the Graph upload session in slices of this size (x 320 KiB)
+INGEST_FORWARD_SLICE = int(os.getenv("INGEST_FORWARD_SLICE", 10 * 327680))
+INGEST_TTL_S = float(os.getenv("INGEST_TTL_S", 24 * 3600))
+
+# /upload pipeline: parallel file uploads per request, and whether the folder
+# ensure is replaced by path-based PUTs (Graph creates missing folders)
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", 4))
+UPLOAD_PATH_PUT = os.getenv("UPLOAD_PATH_PUT", "0") == "1"
@@ -0,0 +1,705 @@
+"""
+Local SQLite index of the QC photo library (the GRAPH_ROOT_PATH tree).
+
+One uvicorn worker (whoever holds the index lock) pulls the drive's delta
+feed every DRIVE_INDEX_INTERVAL_S:
+
+- the first pull enumerates the whole drive; later pulls cost a request or
+  two and return only what changed (new photos, renames, moves, deletions);
+- Graph only offers delta on the drive root for SharePoint, and does not
+  send paths, so scope is kept by parent id: an item is indexed when its
+  parent is the root folder or an indexed folder (the feed lists parents
+  before children);
+- a folder moved in from outside arrives without its contents: the next
+  pull is then a full resync, as is a 410 from Graph (expired delta link).
+
+Every worker reads the same file (WAL mode: readers never wait for the
+sync). `/check` and the folder ensure answer from it when the last sync is
+recent enough (DRIVE_INDEX_MAX_AGE_S, or the caller's bound), and fall back
+to live Graph otherwise. Folders and files created through the API are
+written through with `record()`, so a fresh upload shows up before the next
+pull; `/check` records what it lists live. The write-through runs in a
+thread on its own connection and waits at most DRIVE_INDEX_WRITE_TIMEOUT_S
+for the sync's write lock: a write that loses is skipped (logged), the next
+pull brings the item in anyway.
+
+The aggregates behind /api/sharepoint/stats (per customer, per order, per
+day) read `folder_totals`, a per-folder rollup of its files that every write
+keeps current for the folders it touches (rebuilt after a full sync), so a
+library-wide query sums one row per order instead of every photo. They run
+off the event loop on per-thread connections and are cached per worker until
+the index changes (a `version` bumped by every write).
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from ..file_lock import FileLock
+from ..metrics import cache_lookup
+from .config import (
+    DRIVE_INDEX_DB,
+    DRIVE_INDEX_ENABLED,
+    DRIVE_INDEX_INTERVAL_S,
+    DRIVE_INDEX_MAX_AGE_S,
+    DRIVE_INDEX_WRITE_TIMEOUT_S,
+)
+from .graph_http import graph
+
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+DELTA_FIELDS = (
+    "id,name,size,webUrl,eTag,lastModifiedDateTime,file,folder,parentReference,deleted"
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id          TEXT PRIMARY KEY,
+    parent_id   TEXT,
+    name        TEXT NOT NULL,
+    name_key    TEXT NOT NULL,
+    is_folder   INTEGER NOT NULL,
+    child_count INTEGER,
+    size        INTEGER,
+    mime        TEXT,
+    hash        TEXT,
+    web_url     TEXT,
+    etag        TEXT,
+    modified    TEXT,
+    gen         INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS items_by_parent ON items (parent_id, name_key);
+CREATE INDEX IF NOT EXISTS files_by_parent
+    ON items (parent_id, mime, size, modified) WHERE is_folder = 0;
+CREATE INDEX IF NOT EXISTS files_by_modified
+    ON items (modified, mime) WHERE is_folder = 0;
+-- per-folder rollup of the files directly inside (kept by _roll_up)
+CREATE TABLE IF NOT EXISTS folder_totals (
+    id            TEXT PRIMARY KEY,
+    files         INTEGER NOT NULL,
+    photos        INTEGER NOT NULL,
+    photo_bytes   INTEGER NOT NULL,
+    bytes         INTEGER NOT NULL,
+    last_modified TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def _row(item: dict, gen: int) -> tuple:
+    file = item.get("file") or {}
+    hashes = file.get("hashes") or {}
+    folder = item.get("folder")
+    return (
+        item["id"],
+        (item.get("parentReference") or {}).get("id"),
+        item.get("name") or "",
+        (item.get("name") or "").casefold(),
+        1 if folder is not None else 0,
+        folder.get("childCount") if folder is not None else None,
+        item.get("size") or 0,
+        file.get("mimeType"),
+        hashes.get("quickXorHash")
+        or hashes.get("sha1Hash")
+        or hashes.get("sha256Hash"),
+        item.get("webUrl"),
+        item.get("eTag"),
+        item.get("lastModifiedDateTime"),
+        gen,
+    )
+
+
+_UPSERT = """
+INSERT INTO items (id, parent_id, name, name_key, is_folder, child_count, size,
+                   mime, hash, web_url, etag, modified, gen)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    parent_id=excluded.parent_id, name=excluded.name, name_key=excluded.name_key,
+    is_folder=excluded.is_folder, child_count=excluded.child_count,
+    size=excluded.size, mime=excluded.mime, hash=excluded.hash,
+    web_url=excluded.web_url, etag=excluded.etag, modified=excluded.modified,
+    gen=excluded.gen
+"""
+
+_DELETE_SUBTREE = """
+WITH RECURSIVE sub(id) AS (
+    SELECT ? UNION ALL SELECT items.id FROM items JOIN sub ON items.parent_id = sub.id
+)
+DELETE FROM {table} WHERE id IN (SELECT id FROM sub)
+"""
+
+_BUMP = """
+INSERT INTO meta (key, value) VALUES ('version', '1')
+ON CONFLICT(key) DO UPDATE SET value = CAST(CAST(value AS INTEGER) + 1 AS TEXT)
+"""
+
+_ROLL_UP = """
+INSERT OR REPLACE INTO folder_totals
+SELECT d.id,
+       COUNT(f.id),
+       COALESCE(SUM(f.mime LIKE 'image/%'), 0),
+       COALESCE(SUM(CASE WHEN f.mime LIKE 'image/%' THEN f.size END), 0),
+       COALESCE(SUM(f.size), 0),
+       MAX(f.modified)
+FROM items d LEFT JOIN items f ON f.parent_id = d.id AND f.is_folder = 0
+WHERE d.is_folder = 1 {where}
+GROUP BY d.id
+"""
+
+
+def _roll_up(db: sqlite3.Connection, folder_ids: Optional[set] = None) -> None:
+    """Recompute folder_totals for these folders (None: all of them)."""
+    if folder_ids is None:
+        db.execute("DELETE FROM folder_totals")
+        db.execute(_ROLL_UP.format(where=""))
+        return
+    ids = json.dumps([i for i in folder_ids if i])
+    db.execute(
+        "DELETE FROM folder_totals WHERE id IN (SELECT value FROM json_each(?))",
+        (ids,),
+    )
+    db.execute(
+        _ROLL_UP.format(where="AND d.id IN (SELECT value FROM json_each(?))"), (ids,)
+    )
+
+
+def _delete_subtree(db: sqlite3.Connection, item_id: str) -> None:
+    db.execute(_DELETE_SUBTREE.format(table="folder_totals"), (item_id,))
+    db.execute(_DELETE_SUBTREE.format(table="items"), (item_id,))
+
+
+# root -> customer folders -> order folders -> files (photos, QC workbook)
+_SCOPE = """
+WITH customers AS (
+    SELECT id, name FROM items
+    WHERE parent_id = :root AND is_folder = 1
+      AND (:customer IS NULL OR name_key = :customer)
+), orders AS (
+    SELECT o.id, o.name, o.parent_id AS customer_id, c.name AS customer,
+           COALESCE(t.files, 0) AS files,
+           COALESCE(t.photos, 0) AS photos,
+           COALESCE(t.photo_bytes, 0) AS photo_bytes,
+           COALESCE(t.bytes, 0) AS bytes,
+           t.last_modified
+    FROM customers c
+    JOIN items o ON o.parent_id = c.id AND o.is_folder = 1
+    LEFT JOIN folder_totals t ON t.id = o.id
+)
+"""
+
+_CUSTOMER_STATS = _SCOPE + """
+SELECT c.name AS customer,
+       COALESCE(a.orders, 0) AS orders,
+       COALESCE(a.orders_without_photos, 0) AS orders_without_photos,
+       COALESCE(a.photos, 0) AS photos,
+       COALESCE(a.photo_bytes, 0) AS photo_bytes,
+       COALESCE(a.bytes, 0) AS bytes,
+       a.last_modified
+FROM customers c LEFT JOIN (
+    SELECT customer_id,
+           COUNT(*) AS orders,
+           SUM(photos = 0) AS orders_without_photos,
+           SUM(photos) AS photos,
+           SUM(photo_bytes) AS photo_bytes,
+           SUM(bytes) AS bytes,
+           MAX(last_modified) AS last_modified
+    FROM orders GROUP BY customer_id
+) a ON a.customer_id = c.id
+ORDER BY c.name COLLATE NOCASE
+"""
+
+_ORDER_STATS = _SCOPE + """
+SELECT id AS folder_id, name AS folder, customer, files, photos, photo_bytes,
+       bytes, last_modified, COUNT(*) OVER () AS total
+FROM orders
+WHERE NOT :without_photos OR photos = 0
+ORDER BY customer COLLATE NOCASE, name COLLATE NOCASE
+LIMIT :limit OFFSET :offset
+"""
+
+# driven by the modification-date index: only the files in range are read
+_DAY_STATS = """
+SELECT substr(f.modified, 1, 10) AS day,
+       COUNT(*) AS photos,
+       SUM(f.size) AS photo_bytes,
+       COUNT(DISTINCT f.parent_id) AS orders,
+       COUNT(DISTINCT o.parent_id) AS customers
+FROM items f
+JOIN items o ON o.id = f.parent_id AND o.is_folder = 1
+JOIN items c ON c.id = o.parent_id AND c.is_folder = 1
+WHERE f.is_folder = 0 AND f.mime LIKE 'image/%'
+  AND f.modified >= :since AND f.modified < :until
+  AND c.parent_id = :root AND (:customer IS NULL OR c.name_key = :customer)
+GROUP BY day
+ORDER BY day
+"""
+
+
+class DriveIndex:
+    def __init__(
+        self,
+        db_path,
+        drive_id: str,
+        root_path: str,
+        *,
+        enabled: bool = True,
+        interval_s: float = 30.0,
+        max_age_s: float = 120.0,
+        write_timeout_s: float = 0.25,
+    ) -> None:
+        self.db_path = Path(db_path)
+        self.drive_id = drive_id
+        self.root_path = root_path.strip("/")
+        self.enabled = enabled
+        self.interval_s = interval_s
+        self.max_age_s = max_age_s
+        self.write_timeout_s = write_timeout_s
+
+        self._db: Optional[sqlite3.Connection] = None  # reads on the event loop
+        self._writer: Optional[sqlite3.Connection] = None  # write-through
+        self._write_lock = threading.Lock()
+        self.write_skips = 0
+        self._sync_db: Optional[sqlite3.Connection] = None  # leader's pulls
+        self._leader: Optional[FileLock] = None
+        self._task: Optional[asyncio.Task] = None
+        self.pulls = 0
+        self.pull_requests = 0
+        self.last_pull_ms = 0.0
+        self.hits = 0
+        self.misses = 0  # stale or unavailable: answered live
+
+        self._local = threading.local()  # aggregate readers, one per thread
+        self._readers: List[sqlite3.Connection] = []
+        self._cache: OrderedDict = OrderedDict()  # (query, params) -> (version, rows)
+        self._cache_lock = threading.Lock()
+        self.agg_queries = 0
+        self.agg_cached = 0
+
+    # --- connections ---
+    def _connect(self, timeout: float = 5.0) -> sqlite3.Connection:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(self.db_path, timeout=timeout, check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(_SCHEMA)
+        return db
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = self._connect()
+        return self._db
+
+    def _meta(self, key: str, db: Optional[sqlite3.Connection] = None):
+        row = (
+            (db or self._conn())
+            .execute("SELECT value FROM meta WHERE key = ?", (key,))
+            .fetchone()
+        )
+        return json.loads(row[0]) if row else None
+
+    @staticmethod
+    def _set_meta(db: sqlite3.Connection, **values) -> None:
+        db.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [(k, json.dumps(v)) for k, v in values.items()],
+        )
+
+    # --- reads (any worker, on the event loop: they take microseconds) ---
+    def age_s(self) -> Optional[float]:
+        """Seconds since the last completed pull; None if never synced."""
+        if not self.enabled:
+            return None
+        try:
+            synced_at = self._meta("synced_at")
+            scope = self._meta("scope")
+        except sqlite3.Error:
+            return None
+        if synced_at is None or scope != [self.drive_id, self.root_path]:
+            return None
+        return max(0.0, time.time() - synced_at)
+
+    def fresh(self, max_age_s: Optional[float] = None) -> Optional[float]:
+        """The index age if it is within the bound, else None (go live)."""
+        bound = self.max_age_s if max_age_s is None else max_age_s
+        age = self.age_s()
+        if age is None or age > bound:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return age
+
+    def _child(self, parent_id: str, name: str) -> Optional[sqlite3.Row]:
+        return (
+            self._conn()
+            .execute(
+                "SELECT * FROM items WHERE parent_id = ? AND name_key = ?",
+                (parent_id, name.strip().casefold()),
+            )
+            .fetchone()
+        )
+
+    def find_folder(self, *names: str) -> Optional[sqlite3.Row]:
+        """The folder at root/<names...>, or None."""
+        row_id = self._meta("root_id")
+        row = None
+        for name in names:
+            row = self._child(row_id, name) if row_id else None
+            if row is None or not row["is_folder"]:
+                return None
+            row_id = row["id"]
+        return row
+
+    def item(self, item_id: str) -> Optional[sqlite3.Row]:
+        return (
+            self._conn()
+            .execute("SELECT * FROM items WHERE id = ?", (item_id,))
+            .fetchone()
+        )
+
+    def children(self, folder_id: str) -> List[sqlite3.Row]:
+        return (
+            self._conn()
+            .execute(
+                "SELECT * FROM items WHERE parent_id = ? ORDER BY name_key",
+                (folder_id,),
+            )
+            .fetchall()
+        )
+
+    async def record(self, items: Iterable[dict]) -> None:
+        """Write through items Graph just returned (created folders, uploads)."""
+        if self.enabled:
+            await asyncio.to_thread(self._record, list(items))
+
+    def _record(self, items: List[dict]) -> None:
+        with self._write_lock:  # one write-through at a time per worker
+            try:
+                if self._writer is None:
+                    self._writer = self._connect(self.write_timeout_s)
+                db = self._writer
+                root_id = self._meta("root_id", db)
+                gen = self._meta("gen", db) or 0
+                with db:
+                    touched: set = set()
+                    for item in items:
+                        parent = (item.get("parentReference") or {}).get("id")
+                        in_scope = (
+                            parent == root_id
+                            or db.execute(
+                                "SELECT 1 FROM items WHERE id = ?", (parent,)
+                            ).fetchone()
+                        )
+                        if item.get("id") and in_scope:
+                            old = db.execute(
+                                "SELECT parent_id FROM items WHERE id = ?",
+                                (item["id"],),
+                            ).fetchone()
+                            db.execute(_UPSERT, _row(item, gen))
+                            touched.update((item["id"], parent, old and old[0]))
+                    if touched:
+                        _roll_up(db, touched)
+                        db.execute(_BUMP)
+            except sqlite3.Error as e:  # the next pull catches up anyway
+                self.write_skips += 1
+                logger.warning(
+                    f"[INDEX] write-through of {len(items)} item(s) skipped: {e!r}"
+                )
+
+    # --- aggregates (run in a worker thread) ---
+    def _reader(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._connect()
+            db.execute("PRAGMA query_only = ON")
+            self._local.db = db
+            self._readers.append(db)
+        return db
+
+    def _aggregate(self, sql: str, **params) -> List[dict]:
+        """Rows of an aggregate query, cached until the index changes."""
+        db = self._reader()
+        version = self._meta("version", db) or 0
+        key = (sql, tuple(sorted(params.items())))
+        with self._cache_lock:
+            self.agg_queries += 1
+            hit = self._cache.get(key)
+            if hit is not None and hit[0] == version:
+                self._cache.move_to_end(key)
+                self.agg_cached += 1
+                cache_lookup("stats", "hit")
+                return hit[1]
+        cache_lookup("stats", "miss")
+        rows = [
+            dict(r)
+            for r in db.execute(sql, {"root": self._meta("root_id", db), **params})
+        ]
+        with self._cache_lock:
+            self._cache[key] = (version, rows)
+            self._cache.move_to_end(key)
+            while len(self._cache) > 256:
+                self._cache.popitem(last=False)
+        return rows
+
+    @staticmethod
+    def _key(customer: Optional[str]) -> Optional[str]:
+        return customer.strip().casefold() if customer else None
+
+    def customer_stats(self, customer: Optional[str] = None) -> List[dict]:
+        """Orders, photos and bytes per customer folder."""
+        return self._aggregate(_CUSTOMER_STATS, customer=self._key(customer))
+
+    def order_stats(
+        self,
+        customer: Optional[str] = None,
+        *,
+        without_photos: bool = False,
+        limit: int = 100,
+        offset: int = 0,
+    ) -> Tuple[int, List[dict]]:
+        """(matching order count, one page of per-order totals)."""
+        rows = self._aggregate(
+            _ORDER_STATS,
+            customer=self._key(customer),
+            without_photos=without_photos,
+            limit=limit,
+            offset=offset,
+        )
+        if rows:
+            return rows[0]["total"], rows
+        if offset:  # past the end: still report the total
+            total, _ = self.order_stats(
+                customer, without_photos=without_photos, limit=1, offset=0
+            )
+            return total, []
+        return 0, []
+
+    def day_stats(
+        self, since: str, until: str, customer: Optional[str] = None
+    ) -> List[dict]:
+        """Photos per day (UTC, by last modification) in [since, until)."""
+        return self._aggregate(
+            _DAY_STATS, since=since, until=until, customer=self._key(customer)
+        )
+
+    # --- delta pulls (leader only) ---
+    async def _resolve_root(self) -> dict:
+        ep = (
+            f"/drives/{self.drive_id}/root:/{self.root_path}"
+            if self.root_path
+            else f"/drives/{self.drive_id}/root"
+        )
+        resp = await graph.request(
+            "GET", ep, op="index.root", params={"$select": DELTA_FIELDS}
+        )
+        resp.raise_for_status()
+        return resp.json()
+
+    def _apply(self, db: sqlite3.Connection, items: List[dict], gen: int, seen: set):
+        root_id = self._meta("root_id", db)
+        with db:
+            touched: set = set()  # folders whose rollup changes
+            for item in items:
+                if item["id"] == root_id:
+                    continue
+                parent = (item.get("parentReference") or {}).get("id")
+                known = db.execute(
+                    "SELECT is_folder, parent_id FROM items WHERE id = ?", (item["id"],)
+                ).fetchone()
+                in_scope = (
+                    parent == root_id
+                    or db.execute(
+                        "SELECT 1 FROM items WHERE id = ? AND is_folder = 1", (parent,)
+                    ).fetchone()
+                )
+                if "deleted" in item or not in_scope:
+                    if known:  # deleted, or moved out of the QC tree
+                        _delete_subtree(db, item["id"])
+                        touched.add(known["parent_id"])
+                    continue
+                db.execute(_UPSERT, _row(item, gen))
+                touched.update((item["id"], parent, known and known["parent_id"]))
+                if item.get("folder") is not None and not known:
+                    seen.add(item["id"])
+            if touched:
+                _roll_up(db, touched)
+                db.execute(_BUMP)
+
+    def _finish(self, db, *, gen, full, delta_link, new_folders) -> bool:
+        """Commit the pull; True if a moved-in folder needs a full resync."""
+        with db:
+            if full:  # everything the enumeration did not see is gone
+                db.execute(
+                    "DELETE FROM items WHERE gen < ? AND id != ?",
+                    (gen, self._meta("root_id", db)),
+                )
+                while db.execute(
+                    "DELETE FROM items WHERE parent_id IS NOT NULL AND parent_id "
+                    "NOT IN (SELECT id FROM items) AND id != ?",
+                    (self._meta("root_id", db),),
+                ).rowcount:
+                    pass
+            if full or self._meta("rolled_up", db) is None:
+                _roll_up(db)
+                self._set_meta(db, rolled_up=True)
+                db.execute(_BUMP)
+            self._set_meta(db, delta_link=delta_link, synced_at=time.time())
+        if full:
+            return False
+        for fid in new_folders:  # folders moved in arrive without contents
+            row = db.execute(
+                "SELECT child_count, (SELECT COUNT(*) FROM items c WHERE "
+                "c.parent_id = items.id) AS have FROM items WHERE id = ?",
+                (fid,),
+            ).fetchone()
+            if row and (row["child_count"] or 0) > row["have"]:
+                return True
+        return False
+
+    async def pull(self) -> None:
+        """One delta round (a full enumeration the first time)."""
+        db = self._sync_db
+        t0 = time.perf_counter()
+        delta_link = self._meta("delta_link", db)
+        if self._meta("scope", db) != [self.drive_id, self.root_path]:
+            delta_link = None
+        full = delta_link is None
+        gen = (self._meta("gen", db) or 0) + (1 if full else 0)
+        if full:
+            root = await self._resolve_root()
+            with db:
+                db.execute(_UPSERT, _row({**root, "parentReference": {}}, gen))
+                self._set_meta(
+                    db,
+                    root_id=root["id"],
+                    gen=gen,
+                    scope=[self.drive_id, self.root_path],
+                )
+            logger.info(f"[INDEX] full sync of /{self.root_path} started")
+
+        endpoint = delta_link or f"/drives/{self.drive_id}/root/delta"
+        params = None if delta_link else {"$select": DELTA_FIELDS}
+        new_folders: set = set()
+        requests = 0
+        while True:
+            resp = await graph.request(
+                "GET", endpoint, op="index.delta", params=params, timeout=30.0
+            )
+            requests += 1
+            if resp.status_code == 410:  # delta link expired: start over
+                logger.warning("[INDEX] delta link expired, full resync")
+                await asyncio.to_thread(self._set_meta_sync, delta_link=None)
+                return
+            resp.raise_for_status()
+            page = resp.json()
+            await asyncio.to_thread(
+                self._apply, db, page.get("value") or [], gen, new_folders
+            )
+            if "@odata.nextLink" in page:
+                endpoint, params = page["@odata.nextLink"], None
+                continue
+            resync = await asyncio.to_thread(
+                self._finish,
+                db,
+                gen=gen,
+                full=full,
+                delta_link=page.get("@odata.deltaLink"),
+                new_folders=new_folders,
+            )
+            break
+
+        self.pulls += 1
+        self.pull_requests += requests
+        self.last_pull_ms = (time.perf_counter() - t0) * 1000
+        if full:
+            count = db.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+            logger.info(
+                f"[INDEX] full sync done: {count} items, {requests} requests, "
+                f"{self.last_pull_ms / 1000:.1f}s"
+            )
+        if resync:
+            logger.info("[INDEX] folder moved into the library, full resync")
+            await asyncio.to_thread(self._set_meta_sync, delta_link=None)
+
+    def _set_meta_sync(self, **values) -> None:
+        with self._sync_db:
+            self._set_meta(self._sync_db, **values)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if self._leader is None:
+                    lock = FileLock(self.db_path.with_suffix(".lock"))
+                    if await asyncio.to_thread(lock.acquire, False):
+                        self._leader = lock
+                        self._sync_db = await asyncio.to_thread(self._connect)
+                        logger.info("[INDEX] this worker keeps the drive index")
+                if self._leader is not None:
+                    await self.pull()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[INDEX] pull failed: {e!r}")
+            await asyncio.sleep(self.interval_s)
+
+    # --- lifecycle ---
+    def start(self) -> None:
+        if self.enabled and self.drive_id and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        with self._write_lock:
+            for db in (self._sync_db, self._db, self._writer, *self._readers):
+                if db is not None:
+                    db.close()
+            self._sync_db = self._db = self._writer = None
+        self._readers.clear()
+        self._local = threading.local()
+        self._cache.clear()
+        if self._leader is not None:
+            self._leader.release()
+            self._leader = None
+
+    def snapshot(self) -> dict:
+        age = self.age_s()
+        return {
+            "enabled": self.enabled,
+            "leader": self._leader is not None,
+            "age_s": round(age, 1) if age is not None else None,
+            "max_age_s": self.max_age_s,
+            "pulls": self.pulls,
+            "pull_requests": self.pull_requests,
+            "last_pull_ms": round(self.last_pull_ms, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "write_skips": self.write_skips,
+            "aggregates": self.agg_queries,
+            "aggregates_cached": self.agg_cached,
+        }
+
+
+drive_index = DriveIndex(
+    DRIVE_INDEX_DB,
+    os.getenv("GRAPH_DRIVE_ID", "").strip(),
+    os.getenv("GRAPH_ROOT_PATH", ""),
+    enabled=DRIVE_INDEX_ENABLED,
+    interval_s=DRIVE_INDEX_INTERVAL_S,
+    max_age_s=DRIVE_INDEX_MAX_AGE_S,
+    write_timeout_s=DRIVE_INDEX_WRITE_TIMEOUT_S,
+)
@@ -1,30 +1,185 @@
-import os, time
+"""
+Client-credentials token for Microsoft Graph, shared by all uvicorn workers.
+
+- Single flight: within a worker, concurrent callers wait on one refresh.
+- Shared: the token lives in GRAPH_TOKEN_CACHE (SP_STATE_DIR, owner-only
+  permissions). A worker that needs a new token takes a FileLock, re-reads the
+  file (another worker may have just refreshed it) and only then asks Entra,
+  so a restart of N workers costs one login, not N.
+- Proactive: past GRAPH_TOKEN_REFRESH_AT of its lifetime (0.8) the token is
+  refreshed in the background while callers keep using the current one; they
+  only wait when it is missing or about to expire.
+- force=True (after a 401): the rejected token is dropped, unless the file
+  already holds a newer one.
+"""
+
+import os, json, time, asyncio, logging
+from pathlib import Path
+from typing import Optional
+
 import httpx
 
+from ..circuit_breaker import is_upstream_failure, upstream_breaker
+from ..file_lock import FileLock
+from ..metrics import count_response, observe_upstream
+from ..tracing import span
+from .config import GRAPH_TOKEN_CACHE, GRAPH_TOKEN_REFRESH_AT
+
 TENANT_ID = os.getenv("ENTRA_TENANT_ID", "")
 CLIENT_ID = os.getenv("ENTRA_CLIENT_ID", "")
 CLIENT_SECRET = os.getenv("ENTRA_CLIENT_SECRET", "")
 SCOPE = os.getenv("GRAPH_SCOPE", "https://graph.microsoft.com/.default")
 
-_TOKEN = {"access_token": None, "exp": 0}
+EXPIRY_MARGIN_S = 60  # never hand out a token closer than this to expiry
+
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+
+class TokenBroker:
+    def __init__(self, cache_path, refresh_at: float = 0.8) -> None:
+        self.cache_path = Path(cache_path)
+        self.refresh_at = refresh_at
+        self._token: dict = {}  # access_token, issued_at, expires_at
+        self._lock: Optional[asyncio.Lock] = None
+        self._background: Optional[asyncio.Task] = None
+        self.fetched = 0  # logins done by this worker
+        self.shared = 0  # tokens picked up from another worker
+
+    # --- token state ---
+    def _usable(self, tok: dict) -> bool:
+        return bool(tok.get("access_token")) and (
+            tok.get("expires_at", 0) - time.time() > EXPIRY_MARGIN_S
+        )
+
+    def _due(self, tok: dict) -> bool:
+        """Past the proactive refresh point."""
+        life = tok.get("expires_at", 0) - tok.get("issued_at", 0)
+        return time.time() >= tok.get("issued_at", 0) + life * self.refresh_at
+
+    # --- shared file ---
+    def _read(self) -> dict:
+        try:
+            return json.loads(self.cache_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, tok: dict) -> None:
+        tmp = self.cache_path.with_name(self.cache_path.name + ".tmp")
+        # owner-only from creation (os.chmod is a no-op for this on Windows,
+        # where the state directory's ACL is what protects it)
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(tok, f)
+        os.replace(tmp, self.cache_path)
+
+    # --- Entra ---
+    async def _fetch(self) -> dict:
+        url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/v2.0/token"
+        form = {
+            "grant_type": "client_credentials",
+            "client_id": CLIENT_ID,
+            "client_secret": CLIENT_SECRET,
+            "scope": SCOPE,
+        }
+        breaker = upstream_breaker(url)
+        ticket = breaker.before_call()
+        async with httpx.AsyncClient(timeout=6.0) as client:
+            t0 = time.perf_counter()
+            try:
+                try:
+                    r = await client.post(url, data=form)
+                except Exception:
+                    breaker.record_failure()
+                    count_response(breaker.name, "error")
+                    raise
+                latency = time.perf_counter() - t0
+                if is_upstream_failure(r):
+                    breaker.record_failure(latency)
+                else:
+                    breaker.record_success(latency)
+            finally:
+                breaker.release(ticket)  # cancelled: give back a trial slot
+            count_response(breaker.name, r.status_code)
+            observe_upstream(breaker.name, "token", latency)
+            r.raise_for_status()
+            t = r.json()
+        now = time.time()
+        self.fetched += 1
+        return {
+            "access_token": t["access_token"],
+            "issued_at": now,
+            "expires_at": now + int(t.get("expires_in", 3600)),
+        }
+
+    @span("graph.token")
+    async def _refresh(self, rejected: Optional[str] = None) -> dict:
+        """New token from the shared file, or from Entra under the file lock."""
+        lock = FileLock(self.cache_path.with_suffix(".lock"), timeout_s=15.0)
+        await lock.acquire_async()  # cancellable: a thread would keep waiting
+        try:
+            tok = await asyncio.to_thread(self._read)
+            fresh = (
+                self._usable(tok)
+                and not self._due(tok)
+                and tok["access_token"] != rejected
+            )
+            if fresh:
+                if tok["access_token"] != self._token.get("access_token"):
+                    self.shared += 1
+            else:
+                tok = await self._fetch()
+                await asyncio.to_thread(self._write, tok)
+                logger.info(
+                    f"[GRAPH] access token refreshed, valid "
+                    f"{(tok['expires_at'] - tok['issued_at']) / 60:.0f} min"
+                )
+        finally:
+            lock.release()
+        self._token = tok
+        return tok
+
+    async def _refresh_in_background(self) -> None:
+        try:
+            async with self._lock:
+                if self._due(self._token):
+                    await self._refresh()
+        except Exception as e:  # the current token is still valid
+            logger.warning(f"[GRAPH] proactive token refresh failed: {e!r}")
+
+    async def get(self, force: bool = False) -> str:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        rejected = self._token.get("access_token") if force else None
+
+        tok = self._token
+        if not force and self._usable(tok):
+            if self._due(tok) and (self._background is None or self._background.done()):
+                self._background = asyncio.create_task(self._refresh_in_background())
+            return tok["access_token"]
+
+        async with self._lock:  # single flight
+            tok = self._token
+            if self._usable(tok) and tok.get("access_token") != rejected:
+                return tok["access_token"]  # refreshed while we waited
+            if not force:
+                shared = await asyncio.to_thread(self._read)
+                if self._usable(shared):
+                    self.shared += 1
+                    self._token = shared
+                    return shared["access_token"]
+            return (await self._refresh(rejected))["access_token"]
+
+    def snapshot(self) -> dict:
+        tok = self._token
+        return {
+            "valid_for_s": max(0, int(tok.get("expires_at", 0) - time.time())),
+            "fetched": self.fetched,
+            "shared": self.shared,
+        }
+
+
+token_broker = TokenBroker(GRAPH_TOKEN_CACHE, refresh_at=GRAPH_TOKEN_REFRESH_AT)
 
 
 async def get_access_token(force: bool = False) -> str:
-    if not force and _TOKEN["access_token"] and (_TOKEN["exp"] - time.time() > 60):
-        return _TOKEN["access_token"]
-
-    url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/v2.0/token"
-    form = {
-        "grant_type": "client_credentials",
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET,
-        "scope": SCOPE,
-    }
-    async with httpx.AsyncClient(timeout=6.0) as client:
-        r = await client.post(url, data=form)
-        r.raise_for_status()
-        t = r.json()
-
-    _TOKEN["access_token"] = t["access_token"]
-    _TOKEN["exp"] = time.time() + int(t.get("expires_in", 3600))
-    return _TOKEN["access_token"]
+    return await token_broker.get(force)
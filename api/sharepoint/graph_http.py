@@ -1,101 +1,321 @@
-import os, asyncio, random, time
+"""
+The one Microsoft Graph client every SharePoint route goes through.
+
+Each attempt of a call:
+- checks the host's circuit breaker (CircuitOpen: fail fast, no retries),
+- takes a slot from the shared throttle (throttle.py),
+- sends on a pooled AsyncClient (one per worker, reused across requests).
+
+Retries (one policy for /check, /upload and upload-session chunks):
+- network errors, 408 and 5xx: exponential backoff with jitter, or the
+  server's Retry-After when it sends one;
+- 429 / throttling 503: no private sleep, the throttle pauses every caller;
+- 401 on an authenticated call: one token refresh, then retried.
+
+Every call is measured under an `op` label ("check", "ensure.get",
+"upload.small", "upload.chunk", ...): calls, retries, status histogram,
+bytes sent/received, time queued for a throttle slot vs. time on the wire,
+slowest call. Calls slower than GRAPH_SLOW_REQUEST_S are logged. The totals
+are in /api/health under "graph", and in /api/metrics per host and op. In a
+traced request each call is also a `graph.<op>` span (api/tracing.py).
+
+    resp = await graph.request("GET", f"/drives/{drive}/root:/{path}", op="check")
+    async for page in graph.pages(f"/drives/{drive}/items/{id}/children", ...):
+"""
+
+import os, time, asyncio, random, logging
+from collections import Counter
+from typing import AsyncIterator, Dict, Optional
+
 import httpx
-from typing import Optional
-from email.utils import parsedate_to_datetime
 
-from .graph_auth import get_access_token
+from ..circuit_breaker import is_upstream_failure, upstream_breaker
+from ..metrics import count_response, count_retry, count_throttled, observe_upstream
+from ..tracing import current_trace
+from .config import GRAPH_MAX_RETRIES, GRAPH_SLOW_REQUEST_S, GRAPH_TIMEOUT_S
+from .graph_auth import get_access_token, token_broker
 from .schemas import GraphRequest
+from .throttle import THROTTLE_STATUSES, graph_throttle, retry_after_s
 
 GRAPH_BASE = os.getenv("GRAPH_BASE", "https://graph.microsoft.com/v1.0")
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
 
-
-def _should_retry(resp: Optional[httpx.Response], err: Optional[Exception]) -> bool:
-    if err is not None:
-        return isinstance(
-            err,
-            (
-                httpx.ConnectError,
-                httpx.ReadError,
-                httpx.RemoteProtocolError,
-                httpx.ReadTimeout,
-                httpx.ConnectTimeout,
-                httpx.PoolTimeout,
-                httpx.NetworkError,
-            ),
-        )
-    if resp is None:
-        return False
-    return resp.status_code in (408, 429, 500, 502, 503, 504)
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
 
 
 def _retry_after_delay(resp: Optional[httpx.Response], attempt: int) -> float:
-    if resp is not None:
-        ra = resp.headers.get("Retry-After")
-        if ra:
-            try:
-                return max(0.0, float(ra))
-            except ValueError:
-                try:
-                    dt = parsedate_to_datetime(ra)
-                    return max(0.0, dt.timestamp() - time.time())
-                except Exception:
-                    pass
+    ra = retry_after_s(resp)
+    if ra is not None:
+        return ra
     base = min(0.5 * (2**attempt), 5.0)
     return base + random.uniform(0, 0.25)
 
 
-async def graph_http(req: GraphRequest) -> httpx.Response:
-    assert req.endpoint.startswith("/"), "endpoint must start with '/'"
-    url = f"{GRAPH_BASE}{req.endpoint}"
-
-    token = await get_access_token()
-    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-    if req.extra_headers:
-        headers.update(req.extra_headers)
-
-    timeout = httpx.Timeout(req.timeout_ms / 1000.0)
-    attempts = req.max_retries + 1
-    refreshed = False
-
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        last_resp: Optional[httpx.Response] = None
-        last_err: Optional[Exception] = None
-
-        for attempt in range(attempts):
-            last_err = None
-            try:
-                last_resp = await client.request(
-                    req.method,
-                    url,
-                    params=req.params,
-                    json=req.json,
-                    data=req.data,
-                    headers=headers,
-                )
+def _sent_bytes(request: httpx.Request) -> int:
+    try:
+        return int(request.headers.get("Content-Length", 0))
+    except ValueError:
+        return 0
+
+
+class OpStats:
+    """Counters for one operation label."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.errors = 0  # calls that ended in an exception
+        self.statuses: Counter = Counter()  # per attempt, "error" if no response
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.queue_s = 0.0  # waiting for a throttle slot
+        self.wire_s = 0.0  # request sent -> response read
+        self.total_s = 0.0  # whole call, retries and backoff included
+        self.max_s = 0.0
+
+    def snapshot(self) -> dict:
+        n = self.calls or 1
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "errors": self.errors,
+            "statuses": {str(k): v for k, v in sorted(self.statuses.items())},
+            "bytes_out": self.bytes_out,
+            "bytes_in": self.bytes_in,
+            "avg_ms": round(self.total_s * 1000 / n, 1),
+            "avg_queue_ms": round(self.queue_s * 1000 / n, 1),
+            "avg_wire_ms": round(self.wire_s * 1000 / n, 1),
+            "max_ms": round(self.max_s * 1000, 1),
+        }
+
+
+class GraphClient:
+    def __init__(
+        self,
+        base_url: str = GRAPH_BASE,
+        *,
+        timeout_s: float = GRAPH_TIMEOUT_S,
+        max_retries: int = GRAPH_MAX_RETRIES,
+        slow_s: float = GRAPH_SLOW_REQUEST_S,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout_s = timeout_s
+        self.max_retries = max_retries
+        self.slow_s = slow_s
+        self.breaker = upstream_breaker(self.base_url)  # listed in /api/health
+        self.ops: Dict[str, OpStats] = {}
+        self._client: Optional[httpx.AsyncClient] = None
 
-                if last_resp.status_code == 401 and not refreshed:
-                    token = await get_access_token(force=True)
-                    headers["Authorization"] = f"Bearer {token}"
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout_s,
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=16),
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def request(
+        self,
+        method: str,
+        endpoint: str,
+        *,
+        op: str = "other",
+        params=None,
+        json=None,
+        data=None,
+        content: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        auth: bool = True,
+        log: Optional[logging.Logger] = None,
+    ) -> httpx.Response:
+        """
+        One Graph call with retries; returns the last response (any status).
+        `endpoint` is relative to GRAPH_BASE, or an absolute URL (upload
+        sessions: pass auth=False, their URL carries its own credentials).
+        Raises CircuitOpen, or the last network error once retries run out.
+        """
+        absolute = endpoint.startswith(("https://", "http://"))
+        url = endpoint if absolute else self.base_url + endpoint
+        breaker = upstream_breaker(url)
+        h = {"Accept": "application/json"}
+        if auth:
+            h["Authorization"] = f"Bearer {await get_access_token()}"
+        if headers:
+            h.update(headers)
+        attempts = 1 + (self.max_retries if retries is None else retries)
+        # bodies take as long as they are big: only time metadata calls
+        timed = data is None and content is None
+
+        stats = self.ops.setdefault(op, OpStats())
+        stats.calls += 1
+        t_call = time.perf_counter()
+        queue_s = wire_s = 0.0
+        retried = 0
+        refreshed = False
+        resp: Optional[httpx.Response] = None
+        try:
+            for attempt in range(attempts):
+                if attempt:
+                    retried += 1
+                    stats.retries += 1
+                    count_retry(breaker.name, op)
+                if log:
+                    log.info(f"[GRAPH] {method} {url} (try {attempt + 1}/{attempts})")
+
+                t_sent = t0 = time.perf_counter()
+                err: Optional[Exception] = None
+                resp = None
+                ticket = None
+                try:
+                    try:
+                        async with graph_throttle.slot() as slot:
+                            t_sent = time.perf_counter()
+                            queue_s += t_sent - t0
+                            # reserved only now: no trial slot held while queued;
+                            # CircuitOpen: fail fast, no retry ladder
+                            ticket = breaker.before_call()
+                            resp = await self._http().request(
+                                method,
+                                url,
+                                params=params,
+                                json=json,
+                                data=data,
+                                content=content,
+                                headers=h,
+                                timeout=timeout or self.timeout_s,
+                            )
+                            slot.observe(resp)
+                    except (httpx.TransportError, asyncio.TimeoutError) as e:
+                        err = e
+                    latency = time.perf_counter() - t_sent
+                    wire_s += latency
+                    stats.attempts += 1
+
+                    if err is not None or is_upstream_failure(resp):
+                        breaker.record_failure(latency if timed else None)
+                    else:
+                        breaker.record_success(latency if timed else None)
+                finally:
+                    breaker.release(ticket)  # cancelled / unexpected error
+
+                if err is not None:
+                    stats.statuses["error"] += 1
+                    count_response(breaker.name, "error")
+                    if log:
+                        log.error(f"[GRAPH] exception: {err!r}")
+                    if attempt < attempts - 1:
+                        await asyncio.sleep(_retry_after_delay(None, attempt))
+                        continue
+                    stats.errors += 1
+                    raise err
+
+                stats.statuses[resp.status_code] += 1
+                count_response(breaker.name, resp.status_code)
+                if resp.status_code in THROTTLE_STATUSES:
+                    count_throttled(breaker.name)
+                stats.bytes_out += _sent_bytes(resp.request)
+                stats.bytes_in += len(resp.content)
+                if log:
+                    log.info(f"[GRAPH] -> {resp.status_code}")
+
+                if resp.status_code == 401 and auth and not refreshed:
+                    h["Authorization"] = f"Bearer {await get_access_token(force=True)}"
                     refreshed = True
-                    await asyncio.sleep(0.2)
                     continue
-
-                if _should_retry(last_resp, None) and attempt < attempts - 1:
-                    await asyncio.sleep(_retry_after_delay(last_resp, attempt))
+                if resp.status_code in RETRY_STATUSES and attempt < attempts - 1:
+                    if resp.status_code in THROTTLE_STATUSES:
+                        # the shared throttle pauses every caller for Retry-After
+                        if log:
+                            log.warning("[GRAPH] throttled, retrying after pause")
+                        continue
+                    delay = _retry_after_delay(resp, attempt)
+                    if log:
+                        log.warning(f"[GRAPH] retrying in {delay:.2f}s")
+                    await asyncio.sleep(delay)
                     continue
+                return resp
+            return resp
+        finally:
+            total = time.perf_counter() - t_call
+            trace = current_trace()
+            if trace is not None:
+                trace.add(f"graph.{op}", t_call, total)
+            observe_upstream(breaker.name, op, total)
+            stats.queue_s += queue_s
+            stats.wire_s += wire_s
+            stats.total_s += total
+            stats.max_s = max(stats.max_s, total)
+            if total >= self.slow_s:
+                status = resp.status_code if resp is not None else "error"
+                logger.warning(
+                    f"[GRAPH] slow {op}: {method} {endpoint[:120]} -> {status} in "
+                    f"{total:.2f}s (queued {queue_s:.2f}s, wire {wire_s:.2f}s, "
+                    f"{retried} retries)"
+                )
 
-                if req.raise_for_status:
-                    last_resp.raise_for_status()
-                return last_resp
+    async def pages(
+        self, endpoint: str, *, op: str = "other", **kwargs
+    ) -> AsyncIterator[httpx.Response]:
+        """
+        A collection page by page, following @odata.nextLink (absolute URLs,
+        query string included). Stops after a non-2xx page; the caller checks
+        each response's status.
+        """
+        while endpoint:
+            resp = await self.request("GET", endpoint, op=op, **kwargs)
+            yield resp
+            if not resp.is_success:
+                return
+            endpoint = resp.json().get("@odata.nextLink")
+            kwargs.pop("params", None)  # already in the next link
+
+    def snapshot(self) -> dict:
+        totals = OpStats()
+        for s in self.ops.values():
+            totals.calls += s.calls
+            totals.retries += s.retries
+            totals.errors += s.errors
+            totals.statuses.update(s.statuses)
+            totals.bytes_out += s.bytes_out
+            totals.bytes_in += s.bytes_in
+            totals.queue_s += s.queue_s
+            totals.wire_s += s.wire_s
+            totals.total_s += s.total_s
+            totals.max_s = max(totals.max_s, s.max_s)
+        return {
+            **totals.snapshot(),
+            "ops": {op: s.snapshot() for op, s in sorted(self.ops.items())},
+            "throttle": graph_throttle.snapshot(),
+            "token": token_broker.snapshot(),
+        }
 
-            except Exception as e:
-                last_err = e
-                if attempt < attempts - 1 and _should_retry(None, e):
-                    await asyncio.sleep(_retry_after_delay(None, attempt))
-                    continue
 
-        if last_err:
-            raise last_err
-        if req.raise_for_status and last_resp is not None:
-            last_resp.raise_for_status()
-        return last_resp
+graph = GraphClient()
+
+
+async def graph_http(req: GraphRequest) -> httpx.Response:
+    """GraphRequest front-end to `graph` (kept for scripts in api/utils)."""
+    assert req.endpoint.startswith("/"), "endpoint must start with '/'"
+    resp = await graph.request(
+        req.method,
+        req.endpoint,
+        op="graph_http",
+        params=req.params,
+        json=req.json,
+        data=req.data if isinstance(req.data, dict) else None,
+        content=req.data if isinstance(req.data, bytes) else None,
+        headers=req.extra_headers,
+        timeout=req.timeout_ms / 1000.0,
+        retries=req.max_retries,
+    )
+    if req.raise_for_status:
+        resp.raise_for_status()
+    return resp
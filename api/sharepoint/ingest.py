@@ -0,0 +1,334 @@
+"""
+Resumable tablet -> API uploads (photos and checklists), spooled on disk.
+
+The client creates an upload, then sends the bytes in chunks (PATCH with
+Upload-Offset, as in tus). Each chunk is appended to a spool file and
+fsynced before it is acknowledged, so after a dropped connection the client
+asks for the offset (HEAD) and resends only what is missing.
+
+Per upload, in INGEST_SPOOL_DIR (shared by all uvicorn workers, any of which
+may receive the next chunk):
+
+    <id>.json       what to upload where (written once at creation)
+    <id>.part       the bytes received so far; its size is the offset
+    <id>.fwd.json   forwarding state: Graph upload session, bytes Graph has
+                    accepted, and the final drive item once committed
+    <id>.lock       one chunk writer at a time
+    <id>.fwd.lock   one forwarder / committer at a time
+
+Large files go to a Graph upload session while the client is still sending:
+after each acknowledged chunk, whole INGEST_FORWARD_SLICE slices (multiples
+of 320 KiB, as Graph requires) are forwarded in the background, and the last
+chunk only waits for the tail. Small files and checklists are committed in
+one request once complete. The final item is stored, so a repeated final
+chunk (response lost) returns it instead of uploading twice.
+
+Uploads untouched for INGEST_TTL_S are swept.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from ..file_lock import FileLock
+from .config import INGEST_FORWARD_SLICE, INGEST_SPOOL_DIR, INGEST_TTL_S
+from .graph_http import graph
+
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+FLUSH_BYTES = 1024 * 1024  # buffer this much of a request body per disk write
+MAX_RESYNCS = 3  # 416s in a row before giving up on the upload session
+
+
+class UploadNotFound(Exception):
+    pass
+
+
+class OffsetMismatch(Exception):
+    def __init__(self, offset: int) -> None:
+        super().__init__(f"upload is at offset {offset}")
+        self.offset = offset
+
+
+class UploadBusy(Exception):
+    pass
+
+
+class ForwardFailed(Exception):
+    pass
+
+
+class IngestSpool:
+    def __init__(self, spool_dir, *, slice_bytes: int, ttl_s: float) -> None:
+        self.dir = Path(spool_dir)
+        self.slice_bytes = max(327680, slice_bytes // 327680 * 327680)
+        self.ttl_s = ttl_s
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._last_sweep = 0.0
+        self._tasks: set = set()  # background forwards of this worker
+
+        self.created = 0
+        self.chunks = 0
+        self.bytes_in = 0
+        self.resumed = 0  # offset mismatches answered with the real offset
+        self.forwarded_bytes = 0
+        self.committed = 0
+
+    # --- files ---
+    def _path(self, upload_id: str, suffix: str) -> Path:
+        return self.dir / f"{upload_id}{suffix}"
+
+    def _read_json(self, path: Path) -> dict:
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            raise UploadNotFound(path.stem)
+
+    def _write_json(self, path: Path, data: dict) -> None:
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def meta(self, upload_id: str) -> dict:
+        return self._read_json(self._path(upload_id, ".json"))
+
+    def state(self, upload_id: str) -> dict:
+        return self._read_json(self._path(upload_id, ".fwd.json"))
+
+    def offset(self, upload_id: str) -> int:
+        try:
+            return self._path(upload_id, ".part").stat().st_size
+        except FileNotFoundError:
+            raise UploadNotFound(upload_id)
+
+    def create(self, meta: dict, upload_url: Optional[str] = None) -> str:
+        upload_id = uuid.uuid4().hex
+        self._write_json(
+            self._path(upload_id, ".json"), {**meta, "created_at": time.time()}
+        )
+        self._write_json(
+            self._path(upload_id, ".fwd.json"),
+            {"upload_url": upload_url, "forwarded": 0, "item": None},
+        )
+        self._path(upload_id, ".part").touch()
+        self.created += 1
+        return upload_id
+
+    def drop(self, upload_id: str) -> None:
+        for suffix in (".part", ".json", ".fwd.json", ".lock", ".fwd.lock"):
+            try:
+                self._path(upload_id, suffix).unlink()
+            except OSError:  # a lock still held elsewhere (Windows)
+                pass
+
+    def sweep(self) -> None:
+        """Drop uploads untouched for ttl_s (at most every few minutes)."""
+        now = time.time()
+        if now - self._last_sweep < 300:
+            return
+        self._last_sweep = now
+        for p in self.dir.glob("*.part"):
+            try:
+                if now - p.stat().st_mtime > self.ttl_s:
+                    logger.info(f"[INGEST] dropping stale upload {p.stem}")
+                    self.drop(p.stem)
+            except OSError:
+                pass
+
+    # --- chunks ---
+    async def append(
+        self, upload_id: str, offset: int, body: AsyncIterator[bytes]
+    ) -> int:
+        """Append a chunk at `offset`; returns the new (acknowledged) offset."""
+        size = self.meta(upload_id)["size"]
+        lock = FileLock(self._path(upload_id, ".lock"))
+        if not await lock.acquire_async(blocking=False):
+            raise UploadBusy(upload_id)
+        try:
+            current = self.offset(upload_id)
+            if offset != current:
+                self.resumed += 1
+                raise OffsetMismatch(current)
+            f = await asyncio.to_thread(open, self._path(upload_id, ".part"), "ab")
+            try:
+                buf = bytearray()
+                written = 0
+                try:
+                    async for data in body:
+                        if current + written + len(buf) + len(data) > size:
+                            raise ValueError("chunk runs past the declared size")
+                        buf += data
+                        if len(buf) >= FLUSH_BYTES:
+                            await asyncio.to_thread(f.write, bytes(buf))
+                            written += len(buf)
+                            buf.clear()
+                finally:
+                    # keep what arrived, even from a dropped connection
+                    if buf:
+                        await asyncio.to_thread(f.write, bytes(buf))
+                        written += len(buf)
+                    await asyncio.to_thread(_flush_sync, f)
+                    self.chunks += 1
+                    self.bytes_in += written
+            finally:
+                f.close()
+            return current + written
+        finally:
+            lock.release()
+
+    def read(self, upload_id: str) -> bytes:
+        """Everything spooled so far (blocking: small uploads only)."""
+        try:
+            return self._path(upload_id, ".part").read_bytes()
+        except FileNotFoundError:
+            raise UploadNotFound(upload_id)
+
+    # --- forwarding (Graph upload session) ---
+    def forward_soon(self, upload_id: str) -> None:
+        """Forward whole slices in the background (pipelined with the client)."""
+        task = asyncio.create_task(self._forward_in_background(upload_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _forward_in_background(self, upload_id: str) -> None:
+        lock = FileLock(self._path(upload_id, ".fwd.lock"))
+        try:
+            if not await lock.acquire_async(blocking=False):
+                return  # another worker is forwarding; it re-checks the spool
+            try:
+                await self._forward(upload_id, final=False)
+            finally:
+                lock.release()
+        except Exception as e:  # the final chunk retries with the error surfaced
+            logger.warning(f"[INGEST] background forward of {upload_id}: {e!r}")
+
+    async def _forward(self, upload_id: str, final: bool) -> Optional[dict]:
+        """Send spooled bytes to the upload session; the item once complete."""
+        size = self.meta(upload_id)["size"]
+        st = self.state(upload_id)
+        resyncs = 0
+        while st["item"] is None:
+            have = self.offset(upload_id)
+            start = st["forwarded"]
+            end = min(start + self.slice_bytes, have)
+            if end - start < self.slice_bytes and not (final and end == size):
+                return None  # wait for a whole slice (or the last bytes)
+            piece = await asyncio.to_thread(
+                _read_range, self._path(upload_id, ".part"), start, end - start
+            )
+            resp = await graph.request(
+                "PUT",
+                st["upload_url"],
+                op="ingest.chunk",
+                content=piece,
+                headers={
+                    "Content-Length": str(len(piece)),
+                    "Content-Range": f"bytes {start}-{end - 1}/{size}",
+                },
+                timeout=60.0,
+                auth=False,
+            )
+            if resp.status_code in (200, 201):
+                st.update(forwarded=size, item=resp.json())
+            elif resp.status_code == 202:
+                ranges = resp.json().get("nextExpectedRanges") or [f"{end}-"]
+                st["forwarded"] = int(ranges[0].split("-")[0])
+            elif resp.status_code == 416:  # Graph has other bytes than we think
+                resyncs += 1
+                if resyncs > MAX_RESYNCS:
+                    raise ForwardFailed(
+                        f"upload session still rejects bytes {start}-{end - 1} "
+                        f"after {MAX_RESYNCS} re-syncs"
+                    )
+                st["forwarded"] = await self._session_offset(st["upload_url"])
+                continue
+            else:
+                raise ForwardFailed(f"{resp.status_code} {resp.text[:200]}")
+            resyncs = 0
+            self.forwarded_bytes += len(piece)
+            await asyncio.to_thread(
+                self._write_json, self._path(upload_id, ".fwd.json"), st
+            )
+        return st["item"]
+
+    async def _session_offset(self, upload_url: str) -> int:
+        resp = await graph.request("GET", upload_url, op="ingest.status", auth=False)
+        if not resp.is_success:
+            raise ForwardFailed(f"session status {resp.status_code}")
+        ranges = resp.json().get("nextExpectedRanges")
+        if not ranges:  # nothing we could resend: restarting at 0 would loop
+            raise ForwardFailed("session status lists no expected ranges")
+        return int(ranges[0].split("-")[0])
+
+    # --- completion ---
+    async def commit(
+        self, upload_id: str, put: Optional[Callable[[bytes], Awaitable[dict]]]
+    ) -> dict:
+        """
+        The final drive item, committed once: the rest of the upload session,
+        or `put(spooled bytes)` for small files and checklists.
+        """
+        lock = FileLock(self._path(upload_id, ".fwd.lock"), timeout_s=300)
+        await lock.acquire_async()  # cancellable: a thread would keep waiting
+        try:
+            st = self.state(upload_id)
+            if st["item"] is not None:
+                return st["item"]  # a repeated final chunk
+            if put is None:
+                item = await self._forward(upload_id, final=True)
+            else:
+                data = await asyncio.to_thread(self.read, upload_id)
+                item = await put(data)
+                st.update(forwarded=len(data), item=item)
+                await asyncio.to_thread(
+                    self._write_json, self._path(upload_id, ".fwd.json"), st
+                )
+            self.committed += 1
+            return item
+        finally:
+            lock.release()
+
+    async def cancel(self, upload_id: str) -> None:
+        st = self.state(upload_id)
+        if st.get("upload_url") and st["item"] is None:
+            try:
+                await graph.request(
+                    "DELETE", st["upload_url"], op="ingest.cancel", auth=False
+                )
+            except Exception as e:  # the session expires on its own
+                logger.debug(f"[INGEST] cancel session failed: {e!r}")
+        await asyncio.to_thread(self.drop, upload_id)
+
+    def snapshot(self) -> dict:
+        return {
+            "created": self.created,
+            "chunks": self.chunks,
+            "bytes_in": self.bytes_in,
+            "resumed": self.resumed,
+            "forwarded_bytes": self.forwarded_bytes,
+            "committed": self.committed,
+            "forwarding": len(self._tasks),
+        }
+
+
+def _flush_sync(f) -> None:
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _read_range(path: Path, start: int, length: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(length)
+
+
+ingest_spool = IngestSpool(
+    INGEST_SPOOL_DIR, slice_bytes=INGEST_FORWARD_SLICE, ttl_s=INGEST_TTL_S
+)
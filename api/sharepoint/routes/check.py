@@ -1,12 +1,19 @@
 import os
-from typing import List
+import json
+from typing import AsyncIterator, List, Literal, Optional
 import logging
 from urllib.parse import quote
 
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 
-from ..graph_http import graph_http
-from ..schemas import GraphRequest, CheckResponse, FileEntry
+from ...circuit_breaker import CircuitOpen
+from ...tracing import span
+from ..config import CHECK_PAGE_SIZE
+from ..drive_index import drive_index
+from ..graph_http import graph
+from ..schemas import CheckResponse, FileEntry
+from .thumbs import thumb_url
 
 router = APIRouter()
 logger = logging.getLogger(os.getenv("APP_LOGGER"))
@@ -14,15 +21,179 @@ logger = logging.getLogger(os.getenv("APP_LOGGER"))
 DRIVE_ID = os.getenv("GRAPH_DRIVE_ID", "").strip()
 ROOT_PATH = os.getenv("GRAPH_ROOT_PATH", "").strip("/")
 
+CHILD_FIELDS = "id,name,size,webUrl,eTag,lastModifiedDateTime,file,folder"
+FOLDER_FIELDS = "id,name,size,webUrl,eTag,lastModifiedDateTime,folder,parentReference"
 
+
+# ---------------------------------------------------------------------------- #
+def _graph_error(resp) -> str:
+    detail = "SharePoint query failed"
+    try:
+        j = resp.json()
+        err = j.get("error") or {}
+        msg = err.get("message", "").strip()
+        code = err.get("code")
+        if code or msg:
+            detail = f"{code}: {msg}"
+        else:
+            detail = str(j)
+    except Exception:
+        detail = resp.text
+    return detail
+
+
+def _file_entry(c: dict) -> FileEntry:
+    return FileEntry(
+        id=c.get("id"),
+        name=c.get("name") or "",
+        size=c.get("size") or 0,
+        webUrl=c.get("webUrl"),
+        content_type=(c.get("file") or {}).get("mimeType"),
+        thumb_url=thumb_url(c["id"]) if c.get("id") and _is_photo(c) else None,
+    )
+
+
+def _is_photo(c: dict) -> bool:
+    mime = (c.get("file") or {}).get("mimeType")
+    return bool(mime and mime.startswith("image/"))
+
+
+@span("check.folder")
+async def _get_folder(target_path: str, expand_children: bool) -> Optional[dict]:
+    """The order folder item (None if missing or not a folder)."""
+    # Only encode the full path here, right before using it in the endpoint.
+    endpoint = f"/drives/{DRIVE_ID}/root:/{quote(target_path)}?$select={FOLDER_FIELDS}"
+    if expand_children:  # first page in the same round trip
+        endpoint += f"&$expand=children($select={CHILD_FIELDS};$top={CHECK_PAGE_SIZE})"
+
+    try:
+        resp = await graph.request("GET", endpoint, op="check", timeout=6.0)
+    except CircuitOpen:
+        raise  # 503 + Retry-After (main.py)
+    except Exception as e:
+        logger.error(f"[/CHECK] SharePoint request failed: {e}")
+        raise HTTPException(status_code=502, detail=f"SharePoint request failed: {e}")
+
+    # Handle 404 specifically for a clean "not found" result.
+    if resp.status_code == 404:
+        logger.info(f"[/CHECK] Folder not found for path: {target_path}")
+        return None
+    if not resp.is_success:
+        detail = _graph_error(resp)
+        logger.error(f"[/CHECK] SharePoint request failed: {detail}")
+        raise HTTPException(status_code=resp.status_code, detail=detail)
+
+    data = resp.json()
+    if not data.get("folder"):
+        logger.info(f"[/CHECK] Found an item at {target_path}, but it is not a folder.")
+        return None
+    return data
+
+
+async def _children(folder_id: str, select: str) -> AsyncIterator[List[dict]]:
+    """Immediate children, one Graph page at a time."""
+    async for resp in graph.pages(
+        f"/drives/{DRIVE_ID}/items/{folder_id}/children",
+        op="check.page",
+        params={"$select": select, "$top": CHECK_PAGE_SIZE},
+        timeout=6.0,
+    ):
+        if not resp.is_success:
+            detail = _graph_error(resp)
+            logger.error(f"[/CHECK] listing children failed: {detail}")
+            raise HTTPException(status_code=resp.status_code, detail=detail)
+        yield resp.json().get("value") or []
+
+
+async def _all_children(data: dict, select: str) -> AsyncIterator[List[dict]]:
+    """Expanded first page if it holds everything, else the paged listing."""
+    expanded = data.get("children")
+    if expanded is not None and len(expanded) >= data["folder"].get("childCount", 0):
+        yield expanded
+        return
+    async for page in _children(data["id"], select):
+        yield page
+
+
+@span("check.index")
+def _from_index(customer: str, order_no: str, mode: str, age: float) -> CheckResponse:
+    """The same answer, from the local drive index."""
+    folder = drive_index.find_folder(customer.strip(), f"{order_no}.{customer}".strip())
+    rows = drive_index.children(folder["id"]) if folder is not None else []
+    photo_count = sum(1 for r in rows if (r["mime"] or "").startswith("image/"))
+    files = [
+        FileEntry(
+            id=r["id"],
+            name=r["name"],
+            size=r["size"] or 0,
+            webUrl=r["web_url"],
+            content_type=r["mime"],
+            thumb_url=(
+                thumb_url(r["id"]) if (r["mime"] or "").startswith("image/") else None
+            ),
+        )
+        for r in rows
+        if mode == "full"
+    ]
+    return CheckResponse(
+        ok=True,
+        customer=customer,
+        order_no=order_no,
+        order_folder_id=folder["id"] if folder is not None else None,
+        folder_exists=folder is not None,
+        has_photos=photo_count > 0,
+        photo_count=photo_count,
+        child_count=len(rows) if folder is not None else None,
+        files=files,
+        source="index",
+        index_age_s=round(age, 1),
+    )
+
+
+def _stream(head: dict, data: Optional[dict]) -> StreamingResponse:
+    """NDJSON: a folder line, one line per child, then a summary line."""
+
+    async def lines():
+        yield json.dumps({"type": "folder", **head}) + "\n"
+        count = photos = 0
+        try:
+            if data is not None:
+                async for page in _children(data["id"], CHILD_FIELDS):
+                    for c in page:
+                        count += 1
+                        photos += _is_photo(c)
+                        entry = _file_entry(c).model_dump(by_alias=True)
+                        yield json.dumps({"type": "file", **entry}) + "\n"
+        except (HTTPException, CircuitOpen) as e:
+            # the 200 is already sent: report the failure in-band
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            yield json.dumps({"type": "error", "detail": detail}) + "\n"
+            return
+        yield json.dumps(
+            {"type": "summary", "child_count": count, "photo_count": photos}
+        ) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+# ---------------------------------------------------------------------------- #
 @router.get("/check", response_model=CheckResponse)
 async def check_order_folder(
     customer: str = Query(..., min_length=1, max_length=120),
     order_no: str = Query(..., min_length=1, max_length=120),
+    mode: Literal["full", "count", "stream"] = Query("full"),
+    max_age_s: Optional[float] = Query(None, ge=0),
 ):
     """
     Checks for the existence of a specific order folder within a SharePoint drive,
     and returns its immediate children.
+
+    - full:   every child (Graph pages followed past the 200-item cap)
+    - count:  photo/child counts only; pages fetch just `file` per child
+    - stream: NDJSON, one child per line as pages arrive (huge folders)
+
+    full/count answer from the local drive index when its last sync is at most
+    `max_age_s` old (default DRIVE_INDEX_MAX_AGE_S; 0 forces a live query).
     """
 
     # --- 1. Construct the folder path ---
@@ -34,67 +205,25 @@ async def check_order_folder(
 
     logger.info(f"[/CHECK] Target path for checking sp folder existence: {target_path}")
 
-    # --- 2. Build the API request to find and expand the folder ---
-    # Only encode the full path here, right before using it in the endpoint.
-    encoded_path = quote(target_path)
-    endpoint = (
-        f"/drives/{DRIVE_ID}/root:/{encoded_path}"
-        "?$select=id,name,webUrl,folder"
-        "&$expand=children($select=id,name,size,webUrl,file,folder)"
-    )
-
-    try:
-        resp = await graph_http(
-            GraphRequest(
-                method="GET",
-                endpoint=endpoint,
-                timeout_ms=6000,
-                max_retries=3,
-                raise_for_status=False,
-            )
-        )
-    except Exception as e:
-        logger.error(f"[/CHECK] SharePoint request failed: {e}")
-        raise HTTPException(status_code=502, detail=f"SharePoint request failed: {e}")
-
-    # --- 3. Handle different response statuses ---
-    # Handle 404 specifically for a clean "not found" result.
-    if resp.status_code == 404:
-        logger.info(f"[/CHECK] Folder not found for path: {target_path}")
-        return CheckResponse(
-            ok=True,
-            customer=customer,
-            order_no=order_no,
-            folder_exists=False,
-            has_photos=False,
-            photo_count=0,
-            files=[],
-        )
+    if mode != "stream":
+        age = drive_index.fresh(max_age_s)
+        if age is not None:
+            return _from_index(customer, order_no, mode, age)
 
-    # Handle other non-success status codes.
-    if not resp.is_success:
-        detail = "SharePoint query failed"
-        try:
-            j = resp.json()
-            err = j.get("error") or {}
-            msg = err.get("message", "").strip()
-            code = err.get("code")
-            if code or msg:
-                detail = f"{code}: {msg}"
-            else:
-                detail = str(j)
-        except Exception:
-            detail = resp.text
-        logger.error(f"[/CHECK] SharePoint request failed: {detail}")
-        raise HTTPException(status_code=resp.status_code, detail=detail)
+    # --- 2. Find the folder (with the first page of children in full mode) ---
+    data = await _get_folder(target_path, expand_children=mode == "full")
 
-    # --- 4. Process the successful response ---
-    data = resp.json()
-    is_folder = bool(data.get("folder"))
-    children = data.get("children") or []
+    if mode == "stream":
+        head = {
+            "ok": True,
+            "customer": customer,
+            "order_no": order_no,
+            "order_folder_id": data.get("id") if data else None,
+            "folder_exists": data is not None,
+        }
+        return _stream(head, data)
 
-    if not is_folder:
-        logger.info(f"[/CHECK] Found an item at {target_path}, but it is not a folder.")
+    if data is None:
         return CheckResponse(
             ok=True,
             customer=customer,
@@ -105,24 +234,26 @@ async def check_order_folder(
             files=[],
         )
 
+    # --- 3. Walk the children page by page ---
     files: List[FileEntry] = []
-    photo_count = 0
-    for c in children:
-        mime = (c.get("file") or {}).get("mimeType")
-        if mime and mime.startswith("image/"):
-            photo_count += 1
-        files.append(
-            FileEntry(
-                id=c.get("id"),
-                name=c.get("name") or "",
-                size=c.get("size") or 0,
-                webUrl=c.get("webUrl"),
-                content_type=mime,
-            )
-        )
+    seen: List[dict] = [data]  # written through to the drive index
+    child_count = photo_count = 0
+    if data["folder"].get("childCount", 0) > 0:
+        select = "id,file" if mode == "count" else CHILD_FIELDS
+        async with span("check.children"):
+            async for page in _all_children(data, select):
+                child_count += len(page)
+                photo_count += sum(1 for c in page if _is_photo(c))
+                if mode == "full":
+                    files.extend(_file_entry(c) for c in page)
+                    parent = {"id": data["id"]}
+                    seen.extend({**c, "parentReference": parent} for c in page)
+    with span("check.record"):
+        await drive_index.record(seen)
 
     logger.info(
-        f"[/CHECK] Found folder at {target_path} with {photo_count} immediate photos."
+        f"[/CHECK] Found folder at {target_path} with {photo_count} immediate photos "
+        f"({child_count} children)."
     )
     return CheckResponse(
         ok=True,
@@ -132,5 +263,6 @@ async def check_order_folder(
         folder_exists=True,
         has_photos=photo_count > 0,
         photo_count=photo_count,
+        child_count=child_count,
         files=files,
     )
@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import os, json
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Path, Request, Response
+from fastapi.responses import JSONResponse
+from starlette.requests import ClientDisconnect
+
+from ..config import INGEST_CHUNK_SIZE, INGEST_MAX_BYTES
+from ..ingest import (
+    ForwardFailed,
+    OffsetMismatch,
+    UploadBusy,
+    UploadNotFound,
+    ingest_spool,
+)
+from ..schemas import IngestCreate, IngestStatus, UploadedFile
+from ..setup import sp_session_logger
+from .upload import (
+    GRAPH_DRIVE_ID,
+    GRAPH_ROOT_PREFIX,
+    build_qc_xlsx_from_checklist,
+    create_upload_session,
+    ensure_customer_order,
+    put_small_file,
+    sp_safe,
+)
+
+router = APIRouter(prefix="/ingest")
+server_logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+SMALL_PUT_MAX = 4 * 1024 * 1024  # above this: Graph upload session
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+UPLOAD_ID = r"^[0-9a-f]{32}$"
+
+
+def _mime_for(name: str, declared: Optional[str]) -> str:
+    if declared:
+        return declared
+    name = name.lower()
+    if name.endswith(".jpg") or name.endswith(".jpeg"):
+        return "image/jpeg"
+    if name.endswith(".png"):
+        return "image/png"
+    return "application/octet-stream"
+
+
+def _status(upload_id: str, offset: Optional[int] = None) -> IngestStatus:
+    meta = ingest_spool.meta(upload_id)
+    st = ingest_spool.state(upload_id)
+    item = st["item"]
+    return IngestStatus(
+        upload_id=upload_id,
+        offset=ingest_spool.offset(upload_id) if offset is None else offset,
+        size=meta["size"],
+        chunk_size=INGEST_CHUNK_SIZE,
+        complete=item is not None,
+        forwarded=st["forwarded"],
+        folderId=meta["folder_id"],
+        file=(
+            UploadedFile(
+                id=item.get("id"),
+                name=item.get("name", meta["name"]),
+                webUrl=item.get("webUrl"),
+                size=item.get("size", meta["size"]),
+                content_type=meta["mime"],
+            )
+            if item is not None
+            else None
+        ),
+    )
+
+
+def _offset_headers(upload_id: str, offset: int) -> dict:
+    return {
+        "Upload-Offset": str(offset),
+        "Upload-Length": str(ingest_spool.meta(upload_id)["size"]),
+        "Cache-Control": "no-store",
+    }
+
+
+def _load_checklist(data: bytes) -> dict:
+    checklist = json.loads(data)
+    if not isinstance(checklist, dict):
+        raise ValueError("expected a JSON object")
+    return checklist
+
+
+async def _commit(upload_id: str) -> dict:
+    """The drive item for a fully received upload."""
+    meta = ingest_spool.meta(upload_id)
+    if meta["mode"] == "session":
+        return await ingest_spool.commit(upload_id, None)
+
+    async def put(data: bytes) -> dict:
+        if meta["kind"] == "checklist":
+            xlsx = build_qc_xlsx_from_checklist(meta["order_no"], _load_checklist(data))
+            data = xlsx.getvalue()
+        return await put_small_file(
+            GRAPH_DRIVE_ID, meta["dest"], data, meta["mime"], meta["folder_id"]
+        )
+
+    return await ingest_spool.commit(upload_id, put)
+
+
+# ---------------------------------------------------------------------------- #
+@router.post("", response_model=IngestStatus, status_code=201)
+async def create_upload(body: IngestCreate):
+    """
+    Starts a resumable upload of one photo or checklist (JSON, turned into
+    the QC workbook). Send the bytes with PATCH; resume from HEAD's offset.
+    """
+    if body.size > INGEST_MAX_BYTES:
+        raise HTTPException(413, f"Uploads are limited to {INGEST_MAX_BYTES} bytes")
+    ingest_spool.sweep()
+
+    customer = sp_safe(body.client)
+    if body.kind == "checklist":
+        name = f"{body.orderNo}_QC_{datetime.utcnow().strftime('%Y-%m-%d')}.xlsx"
+        mime, mode = XLSX_MIME, "put"
+    else:
+        name = sp_safe(body.name or "") or "photo.jpg"
+        mime = _mime_for(name, body.mime)
+        mode = "put" if body.size <= SMALL_PUT_MAX else "session"
+
+    folder_id = body.folderId
+    if not folder_id:
+        try:
+            folder_id, _, _ = await ensure_customer_order(
+                GRAPH_DRIVE_ID, customer, body.orderNo
+            )
+        except HTTPException as e:
+            sp_session_logger.error(f"[INGEST] ensure failed: {e.detail}")
+            raise HTTPException(502, f"Folder ensure failed: {e.detail}")
+
+    dest = "/".join(
+        [
+            GRAPH_ROOT_PREFIX.strip("/"),
+            customer.strip(),
+            f"{body.orderNo}.{customer.strip()}",
+            name,
+        ]
+    )
+    upload_url = (
+        await create_upload_session(GRAPH_DRIVE_ID, dest, folder_id)
+        if mode == "session"
+        else None
+    )
+    upload_id = ingest_spool.create(
+        {
+            "kind": body.kind,
+            "order_no": body.orderNo,
+            "customer": customer,
+            "name": name,
+            "size": body.size,
+            "mime": mime,
+            "mode": mode,
+            "dest": dest,
+            "folder_id": folder_id,
+        },
+        upload_url,
+    )
+    sp_session_logger.info(
+        f"[INGEST] {upload_id} {body.kind} '{name}' size={body.size} mode={mode}"
+    )
+    return _status(upload_id, offset=0)
+
+
+@router.head("/{upload_id}")
+async def upload_offset(upload_id: str = Path(..., pattern=UPLOAD_ID)):
+    """Where to resume: Upload-Offset (bytes stored) and Upload-Length."""
+    try:
+        offset = ingest_spool.offset(upload_id)
+        return Response(status_code=200, headers=_offset_headers(upload_id, offset))
+    except UploadNotFound:
+        return Response(status_code=404)
+
+
+@router.get("/{upload_id}", response_model=IngestStatus)
+async def upload_status(upload_id: str = Path(..., pattern=UPLOAD_ID)):
+    try:
+        return _status(upload_id)
+    except UploadNotFound:
+        raise HTTPException(404, "Unknown or expired upload")
+
+
+@router.patch("/{upload_id}", response_model=IngestStatus)
+async def upload_chunk(request: Request, upload_id: str = Path(..., pattern=UPLOAD_ID)):
+    """
+    Appends the request body at `Upload-Offset`. A stale offset gets 409 and
+    the real one. The chunk that completes the upload returns the file; a
+    checklist that is not a JSON object gets 400 and the upload is dropped.
+    """
+    try:
+        offset = int(request.headers["Upload-Offset"])
+    except (KeyError, ValueError):
+        raise HTTPException(400, "Upload-Offset header required")
+
+    try:
+        meta = ingest_spool.meta(upload_id)
+        new_offset = await ingest_spool.append(upload_id, offset, request.stream())
+    except UploadNotFound:
+        raise HTTPException(404, "Unknown or expired upload")
+    except OffsetMismatch as e:
+        if e.offset != meta["size"]:
+            return JSONResponse(
+                status_code=409,
+                content={
+                    "detail": f"Resume from offset {e.offset}",
+                    "offset": e.offset,
+                },
+                headers=_offset_headers(upload_id, e.offset),
+            )
+        new_offset = e.offset  # all bytes stored already: (re)commit below
+    except UploadBusy:
+        raise HTTPException(423, "Another chunk of this upload is being received")
+    except ValueError as e:
+        raise HTTPException(413, str(e))
+    except ClientDisconnect:
+        # the bytes that arrived are stored; the client resumes from HEAD
+        sp_session_logger.info(f"[INGEST] {upload_id} client disconnected")
+        return Response(status_code=400)
+
+    headers = _offset_headers(upload_id, new_offset)
+    if new_offset < meta["size"]:
+        if meta["mode"] == "session":
+            ingest_spool.forward_soon(upload_id)
+        return JSONResponse(
+            _status(upload_id, new_offset).model_dump(by_alias=True), headers=headers
+        )
+
+    if meta["kind"] == "checklist":
+        try:
+            _load_checklist(await asyncio.to_thread(ingest_spool.read, upload_id))
+        except ValueError as e:  # resending the same bytes cannot help
+            sp_session_logger.warning(f"[INGEST] {upload_id} invalid checklist: {e}")
+            await asyncio.to_thread(ingest_spool.drop, upload_id)
+            raise HTTPException(400, f"Checklist is not valid JSON: {e}")
+
+    try:
+        await _commit(upload_id)
+    except ForwardFailed as e:
+        sp_session_logger.error(f"[INGEST] {upload_id} commit failed: {e}")
+        raise HTTPException(502, f"Upload to SharePoint failed: {e}")
+    status = _status(upload_id, new_offset)
+    sp_session_logger.info(f"[INGEST] {upload_id} done -> {status.file.web_url}")
+    return JSONResponse(status.model_dump(by_alias=True), headers=headers)
+
+
+@router.delete("/{upload_id}", status_code=204)
+async def cancel_upload(upload_id: str = Path(..., pattern=UPLOAD_ID)):
+    try:
+        await ingest_spool.cancel(upload_id)
+    except UploadNotFound:
+        raise HTTPException(404, "Unknown or expired upload")
+    return Response(status_code=204)
@@ -0,0 +1,131 @@
+import os
+import asyncio
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from ..drive_index import drive_index
+from ..schemas import (
+    CustomerStats,
+    CustomerStatsResponse,
+    DayStats,
+    DayStatsResponse,
+    OrderStats,
+    OrderStatsResponse,
+    StatsSummary,
+)
+
+router = APIRouter(prefix="/stats")
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+
+# ---------------------------------------------------------------------------- #
+def _index_age() -> float:
+    """Stats come only from the local index (no Graph calls): it must be synced."""
+    age = drive_index.age_s()
+    if age is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Photo library index not synced yet",
+            headers={"Retry-After": str(int(drive_index.interval_s) or 30)},
+        )
+    return round(age, 1)
+
+
+def _order_no(folder: str, customer: str) -> str:
+    """'<order_no>.<customer>' -> order_no"""
+    suffix = f".{customer}"
+    if folder.casefold().endswith(suffix.casefold()):
+        return folder[: -len(suffix)]
+    return folder
+
+
+# ---------------------------------------------------------------------------- #
+@router.get("", response_model=StatsSummary)
+async def library_summary():
+    """Library totals: customers, orders, orders without photos, photos, bytes."""
+    age = _index_age()
+    rows = await asyncio.to_thread(drive_index.customer_stats)
+    return StatsSummary(
+        customers=len(rows),
+        orders=sum(r["orders"] for r in rows),
+        orders_without_photos=sum(r["orders_without_photos"] for r in rows),
+        photos=sum(r["photos"] for r in rows),
+        photo_bytes=sum(r["photo_bytes"] for r in rows),
+        bytes=sum(r["bytes"] for r in rows),
+        index_age_s=age,
+    )
+
+
+@router.get("/customers", response_model=CustomerStatsResponse)
+async def customer_stats(customer: Optional[str] = Query(None, max_length=120)):
+    """Orders, photos and bytes per customer."""
+    age = _index_age()
+    rows = await asyncio.to_thread(drive_index.customer_stats, customer)
+    return CustomerStatsResponse(
+        customers=[CustomerStats(**r) for r in rows], index_age_s=age
+    )
+
+
+@router.get("/orders", response_model=OrderStatsResponse)
+async def order_stats(
+    customer: Optional[str] = Query(None, max_length=120),
+    without_photos: bool = Query(False, description="Only orders with no photos"),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
+    """Photos and bytes per order folder, sorted by customer then folder name."""
+    age = _index_age()
+    total, rows = await asyncio.to_thread(
+        drive_index.order_stats,
+        customer,
+        without_photos=without_photos,
+        limit=limit,
+        offset=offset,
+    )
+    orders = [
+        OrderStats(
+            customer=r["customer"],
+            order_no=_order_no(r["folder"], r["customer"]),
+            folder_id=r["folder_id"],
+            photos=r["photos"],
+            photo_bytes=r["photo_bytes"],
+            files=r["files"],
+            bytes=r["bytes"],
+            last_modified=r["last_modified"],
+        )
+        for r in rows
+    ]
+    return OrderStatsResponse(
+        total=total, limit=limit, offset=offset, orders=orders, index_age_s=age
+    )
+
+
+@router.get("/days", response_model=DayStatsResponse)
+async def day_stats(
+    since: Optional[date] = Query(None, description="First day (default: 30 days ago)"),
+    until: Optional[date] = Query(
+        None, description="Last day, inclusive (default: today)"
+    ),
+    customer: Optional[str] = Query(None, max_length=120),
+):
+    """Photos per day (UTC, by the photo's last modification)."""
+    age = _index_age()
+    until = until or datetime.now(timezone.utc).date()
+    since = since or until - timedelta(days=29)
+    if since > until:
+        raise HTTPException(status_code=422, detail="since is after until")
+    rows = await asyncio.to_thread(
+        drive_index.day_stats,
+        since.isoformat(),
+        (until + timedelta(days=1)).isoformat(),
+        customer,
+    )
+    return DayStatsResponse(
+        since=since.isoformat(),
+        until=until.isoformat(),
+        days=[DayStats(**r) for r in rows],
+        index_age_s=age,
+    )
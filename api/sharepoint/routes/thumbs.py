@@ -0,0 +1,63 @@
+import os
+import logging
+from typing import Literal
+
+from fastapi import APIRouter, Path, Query, Request, Response
+
+from ...metrics import cache_lookup
+from ..config import THUMB_CLIENT_MAX_AGE_S
+from ..schemas import FolderThumbsResponse, ThumbEntry
+from ..thumbs import folder_thumbs, get_thumb
+
+router = APIRouter(prefix="/thumb")
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+ITEM_ID = r"^[A-Za-z0-9!._-]{1,200}$"
+
+
+def thumb_url(item_id: str, size: str = "medium") -> str:
+    return f"/api/sharepoint/thumb/{item_id}?size={size}"
+
+
+# ---------------------------------------------------------------------------- #
+@router.get("/folder/{folder_id}", response_model=FolderThumbsResponse)
+async def thumbs_for_folder(
+    folder_id: str = Path(..., pattern=ITEM_ID),
+    size: Literal["small", "medium"] = Query("medium"),
+):
+    """
+    Caches the thumbnails of every photo in a folder (one paged Graph listing,
+    only new or changed photos downloaded) and lists their /thumb URLs.
+    """
+    entries = await folder_thumbs(folder_id, size)
+    items = [ThumbEntry(**e, thumb_url=thumb_url(e["id"], size)) for e in entries]
+    fetched = sum(1 for i in items if i.fetched)
+    logger.info(
+        f"[/THUMB] folder {folder_id}: {len(items)} photos, {fetched} downloaded"
+    )
+    return FolderThumbsResponse(
+        folder_id=folder_id,
+        size=size,
+        count=len(items),
+        fetched=fetched,
+        items=items,
+    )
+
+
+@router.get("/{item_id}")
+async def thumb(
+    request: Request,
+    item_id: str = Path(..., pattern=ITEM_ID),
+    size: Literal["small", "medium"] = Query("medium"),
+):
+    """A photo's thumbnail (small 96px, medium 176px), from the local cache."""
+    t, how = await get_thumb(item_id, size)
+    cache_lookup("thumbs", how)  # hit / revalidated / miss
+    headers = {
+        "ETag": f'"{t.validator}"',
+        "Cache-Control": f"private, max-age={THUMB_CLIENT_MAX_AGE_S}",
+        "X-Thumb-Cache": how,
+    }
+    if f'"{t.validator}"' in request.headers.get("If-None-Match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=t.data, media_type=t.content_type, headers=headers)
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-import os, io, json, asyncio, inspect, re
+import os, io, json, re, time, asyncio
 import logging
 from typing import Optional
 from datetime import datetime
@@ -10,28 +10,24 @@ from openpyxl import Workbook
 from openpyxl.utils import get_column_letter
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Request
 
+from ...circuit_breaker import CircuitOpen
+from ...tracing import add_span, span
+from ..config import UPLOAD_CONCURRENCY, UPLOAD_PATH_PUT
+from ..drive_index import drive_index
+from ..graph_http import graph
 from ..setup import sp_session_logger
 from ..schemas import UploadedFile, UploadResponse
-from ..graph_auth import get_access_token  # async in your setup
 
 router = APIRouter()
 server_logger = logging.getLogger(os.getenv("APP_LOGGER"))
 
 # ------------------------ config ------------------------
-GRAPH_BASE = os.getenv("GRAPH_BASE", "https://graph.microsoft.com/v1.0")
 GRAPH_DRIVE_ID = os.getenv("GRAPH_DRIVE_ID", "")
 GRAPH_ROOT_PREFIX = os.getenv("GRAPH_ROOT_PATH", "")
 _INVALID = re.compile(r'[<>:"/\\|?*]')  # Graph/OneDrive forbidden chars
 
 
-# ------------------------ auth + http helpers ------------------------
-async def _token() -> str:
-    tok = get_access_token()
-    if inspect.isawaitable(tok):
-        tok = await tok
-    return str(tok)
-
-
+# ------------------------ http helpers ------------------------
 def _enc(seg: str) -> str:
     return quote(seg.strip("/"), safe="")
 
@@ -40,63 +36,20 @@ def _join(*segs: str) -> str:
     return "/".join(_enc(s) for s in segs if s and s.strip("/"))
 
 
-async def _graph(
-    client: httpx.AsyncClient,
-    method: str,
-    endpoint: str,
-    *,
-    json_body=None,
-    data=None,
-    headers=None,
-    timeout=10.0,
-    retries=4,
-) -> httpx.Response:
-    url = GRAPH_BASE + endpoint
-    h = {"Authorization": f"Bearer {await _token()}", "Accept": "application/json"}
-    if headers:
-        h.update(headers)
-    for attempt in range(1, retries + 1):
-        try:
-            sp_session_logger.info(f"[GRAPH] {method} {url} (try {attempt}/{retries})")
-            resp = await client.request(
-                method, url, headers=h, json=json_body, data=data, timeout=timeout
-            )
-            sp_session_logger.info(f"[GRAPH] -> {resp.status_code}")
-            if resp.status_code in (200, 201, 202, 204):
-                return resp
-            if resp.status_code in (429, 500, 502, 503, 504) and attempt < retries:
-                ra = resp.headers.get("Retry-After")
-                delay = float(ra) if ra else 0.8 * (2 ** (attempt - 1))
-                logger.warn(f"[GRAPH] retrying in {delay:.2f}s")
-                await asyncio.sleep(delay)
-                continue
-            return resp
-        except Exception as e:
-            sp_session_logger.error(f"[GRAPH] exception: {e!r}")
-            if attempt < retries:
-                delay = 0.8 * (2 ** (attempt - 1))
-                sp_session_logger.error(f"[GRAPH] retrying in {delay:.2f}s")
-                await asyncio.sleep(delay)
-                continue
-            raise
-
-
 def sp_safe(name: str) -> str:
     s = _INVALID.sub("-", name)
     return s.strip().rstrip(". ")[:200]
 
 
 # ------------------------ folder ensure (client + order only) ------------------------
-async def _get_by_path(
-    client: httpx.AsyncClient, drive_id: str, path: str
-) -> httpx.Response:
+async def _get_by_path(drive_id: str, path: str) -> httpx.Response:
     ep = f"/drives/{drive_id}/root:/{_join(path)}"
     sp_session_logger.info(f"[FOLDER] GET {ep}")
-    return await _graph(client, "GET", ep)
+    return await graph.request("GET", ep, op="ensure.get", log=sp_session_logger)
 
 
 async def ensure_customer_order(
-    client: httpx.AsyncClient, drive_id: str, customer: str, order_no: str
+    drive_id: str, customer: str, order_no: str
 ) -> tuple[str, bool, bool]:
     root = GRAPH_ROOT_PREFIX.strip("/")
     cust = customer.strip()
@@ -104,9 +57,16 @@ async def ensure_customer_order(
     full_path = "/".join([root, cust, order_name])
     cust_path = "/".join([root, cust])
 
-    r = await _get_by_path(client, drive_id, full_path)
+    if drive_index.fresh() is not None:
+        row = drive_index.find_folder(cust, order_name)
+        if row is not None:
+            sp_session_logger.info(f"[ENSURE] order folder in index id={row['id']}")
+            return row["id"], False, False
+
+    r = await _get_by_path(drive_id, full_path)
     if r.status_code == 200:
         fid = r.json()["id"]
+        await drive_index.record([r.json()])
         sp_session_logger.info(f"[ENSURE] full path exists id={fid}")
         return fid, False, False
     if r.status_code not in (404, 400):
@@ -115,7 +75,7 @@ async def ensure_customer_order(
     created_customer = False
     created_order = False
 
-    r2 = await _get_by_path(client, drive_id, cust_path)
+    r2 = await _get_by_path(drive_id, cust_path)
     if r2.status_code == 404:
         ep = f"/drives/{drive_id}/root:/{_join(root)}:/children"
         body = {
@@ -124,16 +84,20 @@ async def ensure_customer_order(
             "@microsoft.graph.conflictBehavior": "rename",
         }
         sp_session_logger.info(f"[ENSURE] POST create customer -> {ep}")
-        cr = await _graph(client, "POST", ep, json_body=body)
+        cr = await graph.request(
+            "POST", ep, op="ensure.create", json=body, log=sp_session_logger
+        )
         if cr.status_code not in (200, 201):
             raise HTTPException(502, f"Create customer failed: {cr.text}")
+        await drive_index.record([cr.json()])
         created_customer = True
     elif r2.status_code != 200:
         raise HTTPException(502, f"Check customer failed: {r2.text}")
 
-    r3 = await _get_by_path(client, drive_id, full_path)
+    r3 = await _get_by_path(drive_id, full_path)
     if r3.status_code == 200:
         fid = r3.json()["id"]
+        await drive_index.record([r3.json()])
         sp_session_logger.info(f"[ENSURE] order exists id={fid}")
         return fid, created_customer, False
 
@@ -144,15 +108,19 @@ async def ensure_customer_order(
         "@microsoft.graph.conflictBehavior": "rename",
     }
     sp_session_logger.info(f"[ENSURE] POST create order -> {ep}")
-    cr2 = await _graph(client, "POST", ep, json_body=body)
+    cr2 = await graph.request(
+        "POST", ep, op="ensure.create", json=body, log=sp_session_logger
+    )
     if cr2.status_code in (200, 201):
         fid = cr2.json()["id"]
+        await drive_index.record([cr2.json()])
         sp_session_logger.info(f"[ENSURE] order created id={fid}")
         return fid, created_customer, True
 
-    r4 = await _get_by_path(client, drive_id, full_path)
+    r4 = await _get_by_path(drive_id, full_path)
     if r4.status_code == 200:
         fid = r4.json()["id"]
+        await drive_index.record([r4.json()])
         sp_session_logger.info(f"[ENSURE] order found after fallback id={fid}")
         return fid, created_customer, created_order
 
@@ -229,47 +197,63 @@ def _mime_from_upload(up: UploadFile) -> str:
     return "application/octet-stream"
 
 
+def _new_item(drive_id: str, dest_path_with_name: str, folder_id: Optional[str]) -> str:
+    """
+    Address of a new file: under its folder's id when known (no path lookup),
+    else by path, which makes Graph create missing parent folders.
+    """
+    if folder_id:
+        name = dest_path_with_name.rsplit("/", 1)[-1]
+        return f"/drives/{drive_id}/items/{folder_id}:/{_enc(name)}:"
+    return f"/drives/{drive_id}/root:/{_join(dest_path_with_name)}:"
+
+
 async def put_small_file(
-    client: httpx.AsyncClient,
     drive_id: str,
     dest_path_with_name: str,
     data: bytes,
     mime: str,
+    folder_id: Optional[str] = None,
 ) -> dict:
-    ep = f"/drives/{drive_id}/root:/{_join(dest_path_with_name)}:/content?@microsoft.graph.conflictBehavior=rename"
+    ep = f"{_new_item(drive_id, dest_path_with_name, folder_id)}/content?@microsoft.graph.conflictBehavior=rename"
     sp_session_logger.info(f"[UPLOAD] small PUT {ep} bytes={len(data)} mime={mime}")
-    r = await _graph(
-        client, "PUT", ep, data=data, headers={"Content-Type": mime}, timeout=30.0
+    r = await graph.request(
+        "PUT",
+        ep,
+        op="upload.small",
+        content=data,
+        headers={"Content-Type": mime},
+        timeout=30.0,
+        log=sp_session_logger,
     )
     if r.status_code not in (200, 201):
         raise HTTPException(502, f"PUT small failed: {r.text}")
+    await drive_index.record([r.json()])
     return r.json()
 
 
 async def create_upload_session(
-    client: httpx.AsyncClient, drive_id: str, dest_path_with_name: str
+    drive_id: str, dest_path_with_name: str, folder_id: Optional[str] = None
 ) -> str:
-    ep = f"/drives/{drive_id}/root:/{_join(dest_path_with_name)}:/createUploadSession"
+    ep = f"{_new_item(drive_id, dest_path_with_name, folder_id)}/createUploadSession"
     body = {"@microsoft.graph.conflictBehavior": "rename", "deferCommit": False}
-    r = await _graph(client, "POST", ep, json_body=body)
+    r = await graph.request(
+        "POST", ep, op="upload.session", json=body, log=sp_session_logger
+    )
     if r.status_code not in (200, 201):
         raise HTTPException(502, f"createUploadSession failed: {r.text}")
     return r.json()["uploadUrl"]
 
 
 async def upload_large_file(
-    client: httpx.AsyncClient,
     drive_id: str,
     dest_path_with_name: str,
-    up: UploadFile,
+    data: bytes,
     mime: str,
+    folder_id: Optional[str] = None,
 ) -> dict:
-    # Simple size detection and chunk loop using in-memory bytes for clarity
-    await up.seek(0)
-    data = await up.read()
     size = len(data)
-    await up.seek(0)
-    upload_url = await create_upload_session(client, drive_id, dest_path_with_name)
+    upload_url = await create_upload_session(drive_id, dest_path_with_name, folder_id)
     chunk = 8 * 1024 * 1024
     sent = 0
     part = 0
@@ -286,11 +270,20 @@ async def upload_large_file(
             "Content-Type": mime,
         }
         sp_session_logger.info(f"[UPLOAD]   part {part} {sent}-{end-1}/{size}")
-        resp = await client.put(
-            upload_url, headers=headers, content=piece, timeout=60.0
+        # the session URL is pre-authorized: no bearer token on chunk PUTs
+        resp = await graph.request(
+            "PUT",
+            upload_url,
+            op="upload.chunk",
+            content=piece,
+            headers=headers,
+            timeout=60.0,
+            auth=False,
+            log=sp_session_logger,
         )
         if resp.status_code in (200, 201):
             sp_session_logger.info("[UPLOAD] large complete")
+            await drive_index.record([resp.json()])
             return resp.json()
         if resp.status_code == 202:
             sent = end
@@ -301,6 +294,41 @@ async def upload_large_file(
     raise HTTPException(502, "Resumable upload ended unexpectedly")
 
 
+# ------------------------ pipeline helpers ------------------------
+async def _timed(timings: dict, stage: str, aw):
+    """Await `aw` as stage `stage`: timings_ms entry and trace span."""
+    t0 = time.perf_counter()
+    try:
+        with span(f"upload.{stage}"):
+            return await aw
+    finally:
+        timings[stage] = round((time.perf_counter() - t0) * 1000, 1)
+
+
+def _build_checklist_xlsx(order_no: str, checklist: str) -> Optional[bytes]:
+    """Workbook bytes, or None when there is no checklist (runs in a thread)."""
+    if not checklist or checklist.strip() in ("", "null", "{}"):
+        return None
+    return build_qc_xlsx_from_checklist(order_no, json.loads(checklist)).getvalue()
+
+
+async def _read_photos(files: list[UploadFile]) -> list[tuple[str, bytes, str]]:
+    """(name, bytes, mime) per photo, read from the request's spooled parts."""
+    photos = []
+    for i, up in enumerate(files, start=1):
+        await up.seek(0)
+        photos.append(
+            (up.filename or f"photo_{i}.jpg", await up.read(), _mime_from_upload(up))
+        )
+    return photos
+
+
+async def _put(dest_rel: str, data: bytes, mime: str, folder_id: Optional[str]) -> dict:
+    if len(data) <= 4 * 1024 * 1024:
+        return await put_small_file(GRAPH_DRIVE_ID, dest_rel, data, mime, folder_id)
+    return await upload_large_file(GRAPH_DRIVE_ID, dest_rel, data, mime, folder_id)
+
+
 # ---------------------------------- route ----------------------------------- #
 @router.post("/upload", response_model=UploadResponse)
 async def upload_qc(
@@ -312,6 +340,16 @@ async def upload_qc(
     files: list[UploadFile] = File(...),
     fileSignal: Optional[str] = Form(None),
 ):
+    """
+    Stages run as a graph, not in sequence: the photo reads, the workbook
+    build (thread) and the folder ensure start together, and the uploads
+    (UPLOAD_CONCURRENCY at a time) start as soon as the folder id is known.
+    With UPLOAD_PATH_PUT the ensure is skipped: the first file is PUT by path
+    (Graph creates the folders) and its parent id addresses the rest.
+    Per-stage wall times are returned in `timings_ms`.
+    """
+    t_start = time.perf_counter()
+    timings: dict = {}
     ct = request.headers.get("content-type", "")
     if not ct.startswith("multipart/form-data"):
         raise HTTPException(
@@ -330,101 +368,147 @@ async def upload_qc(
             f"[REQ] orderNo='{orderNo}' client='{customerName}' files={len(files)} checklist_len={len(checklist or '')}"
         )
 
-    async with httpx.AsyncClient() as client:
-        if folderId:
-            created_customer = created_order = False
-        else:
+    order_dir = "/".join(
+        [
+            GRAPH_ROOT_PREFIX.strip("/"),
+            customerName.strip(),
+            f"{orderNo}.{customerName.strip()}",
+        ]
+    )
+
+    # --- start everything that does not need the folder ---
+    read_task = asyncio.create_task(_timed(timings, "read", _read_photos(files)))
+    xlsx_task = asyncio.create_task(
+        _timed(
+            timings,
+            "xlsx_build",
+            asyncio.to_thread(_build_checklist_xlsx, orderNo, checklist),
+        )
+    )
+    created_customer = created_order = False
+    ensure_task = None
+    if not folderId and not UPLOAD_PATH_PUT:
+        ensure_task = asyncio.create_task(
+            _timed(
+                timings,
+                "ensure",
+                ensure_customer_order(GRAPH_DRIVE_ID, customerName, orderNo),
+            )
+        )
+
+    try:
+        if ensure_task is not None:
             try:
-                folderId, created_customer, created_order = await ensure_customer_order(
-                    client, GRAPH_DRIVE_ID, customerName, orderNo
-                )
+                folderId, created_customer, created_order = await ensure_task
                 sp_session_logger.info(
                     f"[ENSURE] id={folderId} created_customer={created_customer} created_order={created_order}"
                 )
             except HTTPException as e:
                 sp_session_logger.error(f"[ERR] ensure failed: {e.detail}")
                 raise HTTPException(502, f"Folder ensure failed: {e.detail}")
+        photos = await read_task
+    except BaseException:
+        read_task.cancel()
+        xlsx_task.cancel()
+        raise
 
-        # upload XLSX once if checklist provided
-        if checklist and checklist.strip() not in ("", "null", "{}"):
-            try:
-                chk = json.loads(checklist)
-                xlsx = build_qc_xlsx_from_checklist(orderNo, chk)
-                xname = f"{orderNo}_QC_{datetime.utcnow().strftime('%Y-%m-%d')}.xlsx"
-                dest = "/".join(
-                    [
-                        GRAPH_ROOT_PREFIX.strip("/"),
-                        customerName.strip(),
-                        f"{orderNo}.{customerName.strip()}",
-                        xname,
-                    ]
-                )
-                data = xlsx.getvalue()
-                # most manifests are small; use small PUT
-                _ = await put_small_file(
-                    client,
-                    GRAPH_DRIVE_ID,
-                    dest,
-                    data,
-                    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                )
-                sp_session_logger.info(f"[XLSX] uploaded '{xname}'")
-            except Exception as e:
-                sp_session_logger.error(f"[XLSX] skipped due to error: {e!s}")
-
-        # upload photos one-by-one (client can batch a few for (i/N) progress)
-        uploaded: list[UploadedFile] = []
-        for i, up in enumerate(files, start=1):
-            base = up.filename or f"photo_{i}.jpg"
-            try:
-                await up.seek(0)
-                buf = await up.read()
-                size = len(buf)
-                await up.seek(0)
-                mime = _mime_from_upload(up)
-                dest_rel = "/".join(
-                    [
-                        GRAPH_ROOT_PREFIX.strip("/"),
-                        customerName.strip(),
-                        f"{orderNo}.{customerName.strip()}",
-                        base,
-                    ]
-                )
-                if size <= 4 * 1024 * 1024:
-                    meta = await put_small_file(
-                        client, GRAPH_DRIVE_ID, dest_rel, buf, mime
-                    )
-                else:
-                    meta = await upload_large_file(
-                        client, GRAPH_DRIVE_ID, dest_rel, up, mime
-                    )
-                uploaded.append(
-                    UploadedFile(
-                        id=meta.get("id"),
-                        name=meta.get("name", base),
-                        webUrl=meta.get("webUrl"),
-                        size=meta.get("size", size),
-                        content_type=mime,
-                    )
+    # --- uploads: the workbook and the photos share the concurrency limit ---
+    slots = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+    t_uploads = time.perf_counter()
+
+    async def upload_xlsx() -> None:
+        try:
+            data = await xlsx_task
+            if data is None:
+                return
+            xname = f"{orderNo}_QC_{datetime.utcnow().strftime('%Y-%m-%d')}.xlsx"
+            async with slots:
+                await _timed(
+                    timings,
+                    "xlsx_upload",
+                    put_small_file(
+                        GRAPH_DRIVE_ID,
+                        f"{order_dir}/{xname}",
+                        data,
+                        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        folderId,
+                    ),
                 )
-                sp_session_logger.info(f"[OK] {base} -> {meta.get('webUrl')}")
-            except Exception as e:
-                sp_session_logger.error(f"[ERR] file '{base}' failed: {e!s}")
-                uploaded.append(
-                    UploadedFile(name=base, webUrl=None, size=0, content_type=None)
+            sp_session_logger.info(f"[XLSX] uploaded '{xname}'")
+        except CircuitOpen:
+            raise
+        except Exception as e:
+            sp_session_logger.error(f"[XLSX] skipped due to error: {e!s}")
+
+    async def upload_photo(base: str, buf: bytes, mime: str) -> UploadedFile:
+        try:
+            async with slots:
+                meta = await _put(f"{order_dir}/{base}", buf, mime, folderId)
+            sp_session_logger.info(f"[OK] {base} -> {meta.get('webUrl')}")
+            return UploadedFile(
+                id=meta.get("id"),
+                name=meta.get("name", base),
+                webUrl=meta.get("webUrl"),
+                size=meta.get("size", len(buf)),
+                content_type=mime,
+            )
+        except CircuitOpen:
+            raise  # the rest would fail the same way; 503 the whole batch
+        except Exception as e:
+            sp_session_logger.error(f"[ERR] file '{base}' failed: {e!s}")
+            return UploadedFile(name=base, webUrl=None, size=0, content_type=None)
+
+    uploaded: list[UploadedFile] = []
+    if not folderId and photos:
+        # path PUT: the first photo creates the folders and tells us their id
+        base, buf, mime = photos[0]
+        try:
+            first = await _put(f"{order_dir}/{base}", buf, mime, None)
+            folderId = (first.get("parentReference") or {}).get("id")
+            uploaded.append(
+                UploadedFile(
+                    id=first.get("id"),
+                    name=first.get("name", base),
+                    webUrl=first.get("webUrl"),
+                    size=first.get("size", len(buf)),
+                    content_type=mime,
                 )
+            )
+            sp_session_logger.info(f"[OK] {base} -> {first.get('webUrl')} (path PUT)")
+        except CircuitOpen:
+            xlsx_task.cancel()
+            raise
+        except Exception as e:
+            sp_session_logger.error(f"[ERR] file '{base}' failed: {e!s}")
+            uploaded.append(
+                UploadedFile(name=base, webUrl=None, size=0, content_type=None)
+            )
+        photos = photos[1:]
 
-        if fileSignal == "eof":
-            sp_session_logger.info("")  # signal for log spacing
-
-        ok_count = sum(1 for u in uploaded if u.id)
-        return UploadResponse(
-            ok=ok_count == len(uploaded) and len(uploaded) > 0,
-            customer=customerName,
-            order_no=orderNo,
-            folderId=folderId,
-            created_customer=created_customer,
-            created_order=created_order,
-            uploaded_count=ok_count,
-            uploaded=uploaded,
-        )
+    results = await asyncio.gather(
+        upload_xlsx(), *(upload_photo(*p) for p in photos), return_exceptions=True
+    )
+    for r in results:
+        if isinstance(r, BaseException):
+            raise r
+    uploaded.extend(r for r in results[1:])
+    timings["uploads"] = round((time.perf_counter() - t_uploads) * 1000, 1)
+    add_span("upload.uploads", timings["uploads"])
+    timings["total"] = round((time.perf_counter() - t_start) * 1000, 1)
+    sp_session_logger.info(f"[TIMINGS] {timings}")
+
+    if fileSignal == "eof":
+        sp_session_logger.info("")  # signal for log spacing
+
+    ok_count = sum(1 for u in uploaded if u.id)
+    return UploadResponse(
+        ok=ok_count == len(uploaded) and len(uploaded) > 0,
+        customer=customerName,
+        order_no=orderNo,
+        folderId=folderId,
+        created_customer=created_customer,
+        created_order=created_order,
+        uploaded_count=ok_count,
+        uploaded=uploaded,
+        timings_ms=timings,
+    )
@@ -24,6 +24,7 @@ class FileEntry(BaseModel):
     size: int = 0
     web_url: Optional[str] = Field(None, alias="webUrl")
     content_type: Optional[str] = None
+    thumb_url: Optional[str] = None  # photos: /api/sharepoint/thumb/{id}
 
     class Config:
         populate_by_name = True
@@ -37,7 +38,10 @@ class CheckResponse(BaseModel):
     folder_exists: bool
     has_photos: bool
     photo_count: int
-    files: List[FileEntry] = []
+    child_count: Optional[int] = None  # all immediate children, not only photos
+    files: List[FileEntry] = []  # empty in count mode
+    source: str = "graph"  # or "index" (drive_index.py)
+    index_age_s: Optional[float] = None
 
 
 # =========================== Schemas for /upload ============================ #
@@ -56,8 +60,110 @@ class UploadResponse(BaseModel):
     ok: bool
     customer: str
     order_no: str
-    folderId: str
-    created_customer: bool
+    folderId: Optional[str] = None  # None only if a path-PUT batch failed entirely
+    created_customer: bool  # False when the ensure was skipped (UPLOAD_PATH_PUT)
     created_order: bool
     uploaded_count: int
     uploaded: list[UploadedFile] = []
+    timings_ms: Dict[str, float] = (
+        {}
+    )  # read, ensure, xlsx_build, xlsx_upload, uploads, total
+
+
+# =========================== Schemas for /ingest ============================ #
+class IngestCreate(BaseModel):
+    orderNo: str = Field(..., min_length=1, max_length=120)
+    client: str = Field(..., min_length=1, max_length=120)
+    kind: Literal["photo", "checklist"] = "photo"
+    name: Optional[str] = Field(None, max_length=200)  # photos; checklists are named
+    size: int = Field(..., ge=1)  # total bytes the client will send
+    mime: Optional[str] = None
+    folderId: Optional[str] = None  # from an earlier response: skips the ensure
+
+
+class IngestStatus(BaseModel):
+    upload_id: str
+    offset: int  # bytes stored; resume from here
+    size: int
+    chunk_size: int  # suggested PATCH size
+    complete: bool
+    forwarded: int  # bytes already in SharePoint
+    folderId: Optional[str] = None
+    file: Optional[UploadedFile] = None  # once complete
+
+
+# ============================ Schemas for /thumb ============================ #
+class ThumbEntry(BaseModel):
+    id: str
+    name: str
+    thumb_url: str
+    cached: bool  # False: Graph had no thumbnail (yet) or the download failed
+    fetched: bool = False  # downloaded now (new or changed photo)
+
+
+class FolderThumbsResponse(BaseModel):
+    folder_id: str
+    size: str
+    count: int
+    fetched: int
+    items: List[ThumbEntry]
+
+
+# ============================ Schemas for /stats ============================ #
+class CustomerStats(BaseModel):
+    customer: str
+    orders: int
+    orders_without_photos: int
+    photos: int
+    photo_bytes: int
+    bytes: int  # every file in the order folders (QC workbooks included)
+    last_modified: Optional[str] = None
+
+
+class OrderStats(BaseModel):
+    customer: str
+    order_no: str
+    folder_id: str
+    photos: int
+    photo_bytes: int
+    files: int
+    bytes: int
+    last_modified: Optional[str] = None
+
+
+class DayStats(BaseModel):
+    day: str  # YYYY-MM-DD, UTC
+    photos: int
+    photo_bytes: int
+    orders: int
+    customers: int
+
+
+class StatsSummary(BaseModel):
+    customers: int
+    orders: int
+    orders_without_photos: int
+    photos: int
+    photo_bytes: int
+    bytes: int
+    index_age_s: float
+
+
+class CustomerStatsResponse(BaseModel):
+    customers: List[CustomerStats]
+    index_age_s: float
+
+
+class OrderStatsResponse(BaseModel):
+    total: int
+    limit: int
+    offset: int
+    orders: List[OrderStats]
+    index_age_s: float
+
+
+class DayStatsResponse(BaseModel):
+    since: str
+    until: str
+    days: List[DayStats]
+    index_age_s: float
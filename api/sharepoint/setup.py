@@ -3,6 +3,8 @@ import logging
 
 from ..internal_logging.top_prepend import TopPrependFileHandler
 from .config import SP_UPLOAD_SESSION_DIR
+from .drive_index import drive_index
+from .graph_http import graph
 
 ROOT_LOGGER_NAME = os.getenv("APP_LOGGER")
 
@@ -35,3 +37,14 @@ def setup_sp_session_logger() -> logging.Logger:
 
 # Create on import
 sp_session_logger = setup_sp_session_logger()
+
+
+async def start_sharepoint() -> None:
+    """Called from the app lifespan on startup."""
+    drive_index.start()
+
+
+async def stop_sharepoint() -> None:
+    """Called from the app lifespan on shutdown."""
+    await drive_index.stop()
+    await graph.aclose()
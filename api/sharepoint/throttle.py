@@ -0,0 +1,291 @@
+"""
+Shared, throttle-aware concurrency limiter for Microsoft Graph.
+
+Every Graph call (GraphClient in graph_http.py, upload-session chunks
+included) takes a slot here first:
+
+- AIMD window: at most `window` calls in flight on this machine. A 429 or
+  503 halves it (multiplicative decrease, at most once per cooldown, so one
+  burst of rejections counts once); every `window` successes grow it by one
+  (additive increase), up to GRAPH_MAX_INFLIGHT.
+- Retry-After is global: while Graph has asked any worker to back off, no
+  worker sends anything, instead of every request sleeping on its own
+  schedule and the rest hammering on.
+- The window and the pause live in a small JSON file shared by the uvicorn
+  workers (atomic replace; read-modify-write under a FileLock). Each worker
+  re-reads it at most every GRAPH_THROTTLE_SYNC_S and admits up to its share
+  of the window (window / WORKERS).
+
+    async with graph_throttle.slot() as slot:
+        resp = await client.request(...)
+        slot.observe(resp)
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+import httpx
+
+from ..config import WORKERS
+from ..file_lock import FileLock
+from .config import (
+    GRAPH_DEFAULT_RETRY_AFTER_S,
+    GRAPH_MAX_INFLIGHT,
+    GRAPH_MIN_INFLIGHT,
+    GRAPH_THROTTLE_COOLDOWN_S,
+    GRAPH_THROTTLE_DECREASE,
+    GRAPH_THROTTLE_SYNC_S,
+    SP_STATE_DIR,
+)
+
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+THROTTLE_STATUSES = (429, 503)
+
+
+def retry_after_s(resp: Optional[httpx.Response]) -> Optional[float]:
+    """Retry-After in seconds (delta or HTTP date), None when absent/invalid."""
+    ra = resp.headers.get("Retry-After") if resp is not None else None
+    if not ra:
+        return None
+    try:
+        return max(0.0, float(ra))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(ra).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+class Slot:
+    """Outcome of one call, reported back to the limiter on exit."""
+
+    def __init__(self) -> None:
+        self.status: Optional[int] = None  # None: no response (network error)
+        self.retry_after: Optional[float] = None
+
+    def observe(self, resp: httpx.Response) -> None:
+        self.status = resp.status_code
+        self.retry_after = retry_after_s(resp)
+
+
+class GraphThrottle:
+    def __init__(
+        self,
+        state_path,
+        *,
+        workers: int = 1,
+        max_window: int = 16,
+        min_window: int = 1,
+        decrease: float = 0.5,
+        cooldown_s: float = 2.0,
+        default_pause_s: float = 1.0,
+        sync_s: float = 0.5,
+    ) -> None:
+        self.state_path = Path(state_path)
+        self.workers = max(1, workers)
+        self.max_window = max(1, max_window)
+        self.min_window = max(1, min(min_window, self.max_window))
+        self.decrease = decrease
+        self.cooldown_s = cooldown_s
+        self.default_pause_s = default_pause_s
+        self.sync_s = sync_s
+
+        # shared state (mirrors the file)
+        self.window = float(self.max_window)
+        self.paused_until = 0.0  # wall clock: comparable across processes
+        self.decreased_at = 0.0
+        self._seq = 0
+        self._mtime_ns = 0
+        self._synced_at = 0.0
+
+        # local state
+        self.in_flight = 0
+        self._successes = 0
+        self._cond: Optional[asyncio.Condition] = None
+        self.requests = 0
+        self.throttled = 0
+        self.waited = 0
+        self.wait_s = 0.0
+
+    @property
+    def limit(self) -> int:
+        """This worker's share of the machine-wide window."""
+        return max(1, int(self.window) // self.workers)
+
+    # --- shared state file ---
+    def _defaults(self) -> dict:
+        return {
+            "window": float(self.max_window),
+            "paused_until": 0.0,
+            "decreased_at": 0.0,
+            "seq": 0,
+        }
+
+    def _read(self) -> dict:
+        try:
+            return {**self._defaults(), **json.loads(self.state_path.read_text())}
+        except (OSError, ValueError):
+            return self._defaults()
+
+    def _adopt(self, state: dict) -> None:
+        self.paused_until = max(self.paused_until, state["paused_until"])
+        if state["seq"] >= self._seq:
+            self._seq = state["seq"]
+            self.window = min(max(state["window"], self.min_window), self.max_window)
+            self.decreased_at = max(self.decreased_at, state["decreased_at"])
+
+    def _refresh(self) -> None:
+        """Pick up other workers' window/pause; cheap (stat) unless it changed."""
+        now = time.monotonic()
+        if now - self._synced_at < self.sync_s:
+            return
+        self._synced_at = now
+        try:
+            mtime_ns = os.stat(self.state_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime_ns != self._mtime_ns:
+            self._mtime_ns = mtime_ns
+            self._adopt(self._read())
+
+    def _update(self, change: Callable[[dict], None]) -> dict:
+        """Apply `change` to the freshest shared state and write it back."""
+        try:
+            with FileLock(self.state_path.with_suffix(".lock"), timeout_s=2.0):
+                state = self._read()
+                change(state)
+                state["seq"] += 1
+                tmp = self.state_path.with_suffix(".tmp")
+                tmp.write_text(json.dumps(state))
+                os.replace(tmp, self.state_path)
+        except (OSError, TimeoutError) as e:  # still apply it to this worker
+            logger.warning(f"[GRAPH] throttle state not shared: {e!r}")
+            state = {
+                "window": self.window,
+                "paused_until": self.paused_until,
+                "decreased_at": self.decreased_at,
+                "seq": self._seq,
+            }
+            change(state)
+        return state
+
+    # --- AIMD ---
+    async def _on_throttle(self, status: int, retry_after: Optional[float]) -> None:
+        pause = retry_after if retry_after is not None else self.default_pause_s
+        now = time.time()
+        shrunk = []
+
+        def change(state: dict) -> None:
+            if now - state["decreased_at"] >= self.cooldown_s:
+                shrunk.append(state["window"])
+                state["window"] = max(
+                    self.min_window, int(state["window"] * self.decrease)
+                )
+                state["decreased_at"] = now
+            state["paused_until"] = max(state["paused_until"], now + pause)
+
+        self._adopt(await asyncio.to_thread(self._update, change))
+        if shrunk:  # once per burst; the rest of the burst only extends the pause
+            logger.warning(
+                f"[GRAPH] throttled ({status}); window {shrunk[0]:.0f} -> "
+                f"{self.window:.0f}, all workers paused {pause:.1f}s"
+            )
+
+    async def _on_success(self) -> None:
+        self._successes += 1
+        if self._successes < int(self.window) or self.window >= self.max_window:
+            return
+        self._successes = 0
+
+        def change(state: dict) -> None:
+            state["window"] = min(self.max_window, state["window"] + 1)
+
+        self._adopt(await asyncio.to_thread(self._update, change))
+
+    # --- slots ---
+    def _condition(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def acquire(self) -> None:
+        cond = self._condition()
+        t0 = time.monotonic()
+        waited = False
+        async with cond:
+            while True:
+                self._refresh()
+                pause = self.paused_until - time.time()
+                if pause <= 0 and self.in_flight < self.limit:
+                    break
+                waited = True
+                timeout = min(pause, self.sync_s) if pause > 0 else self.sync_s
+                try:
+                    await asyncio.wait_for(cond.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            self.in_flight += 1
+        self.requests += 1
+        if waited:
+            self.waited += 1
+            self.wait_s += time.monotonic() - t0
+
+    async def release(
+        self, status: Optional[int] = None, retry_after: Optional[float] = None
+    ) -> None:
+        self.in_flight -= 1
+        try:
+            if status in THROTTLE_STATUSES:
+                self.throttled += 1
+                await self._on_throttle(status, retry_after)
+            elif status is not None and status < 500:
+                await self._on_success()
+        finally:
+            cond = self._condition()
+            async with cond:
+                cond.notify_all()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        slot = Slot()
+        try:
+            yield slot
+        finally:
+            await self.release(slot.status, slot.retry_after)
+
+    def snapshot(self) -> dict:
+        self._refresh()
+        return {
+            "window": int(self.window),
+            "worker_limit": self.limit,
+            "in_flight": self.in_flight,
+            "paused_for_s": round(max(0.0, self.paused_until - time.time()), 1),
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "waited": self.waited,
+            "avg_wait_ms": (self.wait_s * 1000 / self.waited) if self.waited else 0.0,
+        }
+
+
+graph_throttle = GraphThrottle(
+    SP_STATE_DIR / "graph_throttle.json",
+    workers=WORKERS,
+    max_window=GRAPH_MAX_INFLIGHT,
+    min_window=GRAPH_MIN_INFLIGHT,
+    decrease=GRAPH_THROTTLE_DECREASE,
+    cooldown_s=GRAPH_THROTTLE_COOLDOWN_S,
+    default_pause_s=GRAPH_DEFAULT_RETRY_AFTER_S,
+    sync_s=GRAPH_THROTTLE_SYNC_S,
+)
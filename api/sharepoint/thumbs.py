@@ -0,0 +1,306 @@
+"""
+Thumbnail proxy for the photo library.
+
+Tablets cannot open SharePoint webUrls without credentials, so the API fetches
+Graph's thumbnails (small: 96px, medium: 176px) and serves them itself.
+
+- Disk cache (THUMB_CACHE_DIR, shared by all uvicorn workers): a
+  `<key>.jpg` + `<key>.json` pair per item and size, the json holding the
+  item's eTag and when it was last checked. Pruned least recently used first
+  (mtime, touched on every hit) past THUMB_CACHE_MAX_MB.
+- Revalidation: an entry checked more than THUMB_REVALIDATE_S ago is compared
+  with the item's current eTag, taken from the drive index when that is
+  fresh (no Graph call), else asked with If-None-Match (304: still good).
+  Only a changed eTag downloads the thumbnail again.
+- Folders: one paged children listing with `$expand=thumbnails` returns the
+  eTag and thumbnail URL of every photo; only missing or changed thumbnails
+  are downloaded, THUMB_FETCH_CONCURRENCY at a time.
+- Concurrent requests for the same thumbnail share one fetch.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from .config import (
+    CHECK_PAGE_SIZE,
+    THUMB_CACHE_DIR,
+    THUMB_CACHE_MAX_MB,
+    THUMB_FETCH_CONCURRENCY,
+    THUMB_REVALIDATE_S,
+)
+from .drive_index import drive_index
+from .graph_http import graph
+
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+DRIVE_ID = os.getenv("GRAPH_DRIVE_ID", "").strip()
+SIZES = ("small", "medium")
+
+
+@dataclass
+class Thumb:
+    data: bytes
+    etag: str  # of the drive item the thumbnail was made from
+    content_type: str
+    checked_at: float
+
+    @property
+    def validator(self) -> str:
+        """ETag sent to clients (per item version and size)."""
+        return hashlib.sha1(f"{self.etag}|{len(self.data)}".encode()).hexdigest()[:20]
+
+
+class ThumbCache:
+    def __init__(self, disk_dir, max_bytes: int) -> None:
+        self.disk_dir = Path(disk_dir)
+        self.max_bytes = max_bytes
+        self._disk_bytes: Optional[int] = None  # lazily measured
+        self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+        self.hits = 0  # served from disk, no Graph call
+        self.revalidated = 0  # eTag unchanged (index or 304)
+        self.fetched = 0  # downloaded from Graph
+        self.pruned = 0
+
+    @staticmethod
+    def key(item_id: str, size: str) -> str:
+        # ids are case-sensitive, Windows file names are not
+        return hashlib.sha1(f"{item_id}|{size}".encode()).hexdigest()
+
+    def get(self, item_id: str, size: str) -> Optional[Thumb]:
+        k = self.key(item_id, size)
+        meta_p, jpg_p = self.disk_dir / f"{k}.json", self.disk_dir / f"{k}.jpg"
+        try:
+            meta = json.loads(meta_p.read_text(encoding="utf-8"))
+            data = jpg_p.read_bytes()
+        except (OSError, ValueError):
+            return None
+        now = time.time()
+        try:
+            os.utime(jpg_p, (now, now))  # LRU by mtime
+        except OSError:
+            pass
+        return Thumb(data=data, **meta)
+
+    def put(self, item_id: str, size: str, thumb: Thumb) -> None:
+        k = self.key(item_id, size)
+        meta = {
+            "etag": thumb.etag,
+            "content_type": thumb.content_type,
+            "checked_at": thumb.checked_at,
+        }
+        try:
+            for suffix, payload in (
+                (".jpg", thumb.data),
+                (".json", json.dumps(meta).encode("utf-8")),
+            ):
+                tmp = self.disk_dir / f"{k}{suffix}.{os.getpid()}.tmp"
+                tmp.write_bytes(payload)
+                os.replace(tmp, self.disk_dir / f"{k}{suffix}")
+        except OSError as e:
+            logger.warning(f"[THUMB] cache write failed: {e}")
+            return
+
+        added = len(thumb.data) + 128
+        if self._disk_bytes is None or self._disk_bytes + added > self.max_bytes:
+            self._prune()  # (re)measures, other workers share the dir
+        else:
+            self._disk_bytes += added
+
+    def mark_checked(self, item_id: str, size: str, thumb: Thumb) -> None:
+        """Still valid: store the new check time (json only)."""
+        thumb.checked_at = time.time()
+        k = self.key(item_id, size)
+        meta = {
+            "etag": thumb.etag,
+            "content_type": thumb.content_type,
+            "checked_at": thumb.checked_at,
+        }
+        try:
+            tmp = self.disk_dir / f"{k}.json.{os.getpid()}.tmp"
+            tmp.write_text(json.dumps(meta), encoding="utf-8")
+            os.replace(tmp, self.disk_dir / f"{k}.json")
+        except OSError:
+            pass
+
+    def drop(self, item_id: str, size: str) -> None:
+        k = self.key(item_id, size)
+        for suffix in (".jpg", ".json"):
+            try:
+                (self.disk_dir / f"{k}{suffix}").unlink()
+            except OSError:
+                pass
+
+    def _prune(self) -> None:
+        entries = []
+        for p in self.disk_dir.glob("*.jpg"):
+            try:
+                st = p.stat()
+                entries.append((st.st_mtime, st.st_size + 128, p))
+            except OSError:
+                pass
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9  # prune a little extra to avoid thrash
+        for _, size, p in entries:
+            if total <= target:
+                break
+            try:
+                p.unlink()
+                p.with_suffix(".json").unlink(missing_ok=True)
+                total -= size
+                self.pruned += 1
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+    def snapshot(self) -> dict:
+        served = self.hits + self.revalidated + self.fetched
+        return {
+            "disk_bytes": self._disk_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "fetched": self.fetched,
+            "pruned": self.pruned,
+            "hit_ratio": round((served - self.fetched) / served, 3) if served else 0.0,
+        }
+
+
+thumb_cache = ThumbCache(THUMB_CACHE_DIR, int(THUMB_CACHE_MAX_MB * 1024 * 1024))
+
+_inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+_fetch_slots: Optional[asyncio.Semaphore] = None
+
+
+# ---------------------------------------------------------------------------- #
+async def _download(url: str, etag: str) -> Thumb:
+    """Thumbnail bytes from the pre-authenticated URL Graph handed out."""
+    global _fetch_slots
+    if _fetch_slots is None:
+        _fetch_slots = asyncio.Semaphore(THUMB_FETCH_CONCURRENCY)
+    async with _fetch_slots:
+        resp = await graph.request("GET", url, op="thumb.content", auth=False)
+    if not resp.is_success:
+        raise HTTPException(502, f"Thumbnail download failed: {resp.status_code}")
+    thumb_cache.fetched += 1
+    return Thumb(
+        data=resp.content,
+        etag=etag,
+        content_type=resp.headers.get("Content-Type", "image/jpeg"),
+        checked_at=time.time(),
+    )
+
+
+def _thumb_url(item: dict, size: str) -> Optional[str]:
+    for t in item.get("thumbnails") or []:
+        url = (t.get(size) or {}).get("url")
+        if url:
+            return url
+    return None
+
+
+async def _load(item_id: str, size: str) -> Tuple[Thumb, str]:
+    cached = await asyncio.to_thread(thumb_cache.get, item_id, size)
+    if cached is not None:
+        if time.time() - cached.checked_at < THUMB_REVALIDATE_S:
+            thumb_cache.hits += 1
+            return cached, "hit"
+        if drive_index.fresh() is not None:
+            row = drive_index.item(item_id)
+            if row is not None and row["etag"] == cached.etag:
+                thumb_cache.revalidated += 1
+                await asyncio.to_thread(thumb_cache.mark_checked, item_id, size, cached)
+                return cached, "revalidated"
+
+    resp = await graph.request(
+        "GET",
+        f"/drives/{DRIVE_ID}/items/{item_id}",
+        op="thumb.item",
+        params={"$select": "id,eTag", "$expand": f"thumbnails($select={size})"},
+        headers={"If-None-Match": cached.etag} if cached is not None else None,
+    )
+    if resp.status_code == 304 and cached is not None:
+        thumb_cache.revalidated += 1
+        await asyncio.to_thread(thumb_cache.mark_checked, item_id, size, cached)
+        return cached, "revalidated"
+    if resp.status_code == 404:
+        await asyncio.to_thread(thumb_cache.drop, item_id, size)
+        raise HTTPException(404, "Item not found")
+    if not resp.is_success:
+        raise HTTPException(502, f"Thumbnail lookup failed: {resp.status_code}")
+
+    item = resp.json()
+    if cached is not None and item.get("eTag") == cached.etag:
+        thumb_cache.revalidated += 1
+        await asyncio.to_thread(thumb_cache.mark_checked, item_id, size, cached)
+        return cached, "revalidated"
+    url = _thumb_url(item, size)
+    if url is None:
+        raise HTTPException(404, "No thumbnail for this item")
+    thumb = await _download(url, item.get("eTag") or "")
+    await asyncio.to_thread(thumb_cache.put, item_id, size, thumb)
+    return thumb, "miss"
+
+
+async def get_thumb(item_id: str, size: str) -> Tuple[Thumb, str]:
+    """(thumbnail, how it was served: hit / revalidated / miss)"""
+    key = (item_id, size)
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_load(item_id, size))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def folder_thumbs(folder_id: str, size: str) -> List[dict]:
+    """Cache the thumbnails of a folder's photos; one entry per photo."""
+
+    async def warm(item: dict) -> dict:
+        entry = {"id": item["id"], "name": item.get("name") or "", "cached": True}
+        cached = await asyncio.to_thread(thumb_cache.get, item["id"], size)
+        if cached is not None and cached.etag == item.get("eTag"):
+            thumb_cache.revalidated += 1
+            await asyncio.to_thread(thumb_cache.mark_checked, item["id"], size, cached)
+            return entry
+        url = _thumb_url(item, size)
+        if url is None:
+            return {**entry, "cached": False}
+        try:
+            thumb = await _download(url, item.get("eTag") or "")
+        except HTTPException:  # one bad thumbnail does not fail the folder
+            return {**entry, "cached": False}
+        await asyncio.to_thread(thumb_cache.put, item["id"], size, thumb)
+        return {**entry, "fetched": True}
+
+    jobs = []
+    async for resp in graph.pages(
+        f"/drives/{DRIVE_ID}/items/{folder_id}/children",
+        op="thumb.folder",
+        params={
+            "$select": "id,name,eTag,file",
+            "$expand": f"thumbnails($select={size})",
+            "$top": CHECK_PAGE_SIZE,
+        },
+    ):
+        if resp.status_code == 404:
+            raise HTTPException(404, "Folder not found")
+        if not resp.is_success:
+            raise HTTPException(502, f"Listing folder failed: {resp.status_code}")
+        for item in resp.json().get("value") or []:
+            mime = (item.get("file") or {}).get("mimeType") or ""
+            if mime.startswith("image/"):
+                jobs.append(asyncio.ensure_future(warm(item)))
+    return list(await asyncio.gather(*jobs))
@@ -0,0 +1,191 @@
+# api/tracing.py
+"""
+Per-request spans: where a request's time went.
+
+A sampled request carries a Trace in a contextvar, so the tasks and
+asyncio.to_thread calls it starts add to the same trace. Code marks its
+stages with `span`:
+
+    with span("upload.ensure"):        # or `async with`
+        ...
+
+    @span("vision.detect")             # sync or async functions
+    async def _detect(...): ...
+
+    add_span("vision.forward", 12.5)   # measured elsewhere (worker process)
+
+Graph calls (one span name per op), the Entra token refresh and Genius
+calls are spans already (graph_http.py, graph_auth.py, genius/auth.py).
+
+TraceMiddleware samples TRACE_SAMPLE_RATE of /api requests, plus any request
+sending `X-Trace: 1`, and for those:
+- adds a Server-Timing header: one entry per span name with the durations
+  summed (concurrent spans can add up to more than `total`) and the count in
+  desc, then `total` and the trace id. Streaming responses send headers
+  first, so they only list the spans finished by then;
+- logs one `[TRACE] {json}` line once the response is sent: method, path,
+  status, total_ms and every span with its start offset.
+
+Outside a sampled request a span costs one contextvar lookup.
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import inspect
+import logging
+import functools
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import TRACE_SAMPLE_RATE
+
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+
+class Trace:
+    __slots__ = ("id", "t0", "spans")
+
+    def __init__(self) -> None:
+        self.id = uuid.uuid4().hex[:12]
+        self.t0 = time.perf_counter()
+        self.spans: List[Tuple[str, float, float]] = []  # name, start, duration
+
+    def add(self, name: str, start: float, duration_s: float) -> None:
+        self.spans.append((name, start - self.t0, duration_s))
+
+    def server_timing(self) -> str:
+        sums: Dict[str, List[float]] = {}
+        for name, _, dur in list(self.spans):
+            s = sums.setdefault(name, [0.0, 0])
+            s[0] += dur
+            s[1] += 1
+        parts = [
+            (
+                f'{name};dur={d * 1000:.1f};desc="x{n}"'
+                if n > 1
+                else f"{name};dur={d * 1000:.1f}"
+            )
+            for name, (d, n) in sums.items()
+        ]
+        parts.append(f"total;dur={(time.perf_counter() - self.t0) * 1000:.1f}")
+        parts.append(f'trace;desc="{self.id}"')
+        return ", ".join(parts)
+
+    def log(self, method: str, path: str, status: int) -> None:
+        record = {
+            "id": self.id,
+            "method": method,
+            "path": path,
+            "status": status,
+            "total_ms": round((time.perf_counter() - self.t0) * 1000, 1),
+            "spans": [
+                {"name": name, "at_ms": round(at * 1000, 1), "ms": round(d * 1000, 1)}
+                for name, at, d in sorted(self.spans, key=lambda s: s[1])
+            ],
+        }
+        logger.info(f"[TRACE] {json.dumps(record)}")
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def add_span(name: str, duration_ms: float) -> None:
+    """A stage timed elsewhere, recorded as ending now."""
+    trace = _current.get()
+    if trace is not None:
+        duration_s = duration_ms / 1000
+        trace.add(name, time.perf_counter() - duration_s, duration_s)
+
+
+class span:
+    """Times a stage of the current request: context manager or decorator."""
+
+    __slots__ = ("name", "_trace", "_t0")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._trace: Optional[Trace] = None
+        self._t0 = 0.0
+
+    def __enter__(self) -> "span":
+        self._trace = _current.get()
+        if self._trace is not None:
+            self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._trace is not None:
+            self._trace.add(self.name, self._t0, time.perf_counter() - self._t0)
+
+    async def __aenter__(self) -> "span":
+        return self.__enter__()
+
+    async def __aexit__(self, *exc) -> None:
+        self.__exit__(*exc)
+
+    def __call__(self, fn):
+        name = self.name  # a fresh span per call: calls may overlap
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+
+class TraceMiddleware:
+    """Starts a Trace for sampled /api requests; see the module docstring."""
+
+    def __init__(self, app: ASGIApp, sample_rate: float = TRACE_SAMPLE_RATE) -> None:
+        self.app = app
+        self.sample_rate = sample_rate
+
+    def _sampled(self, scope: Scope) -> bool:
+        if not scope["path"].startswith("/api/"):
+            return False
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return True
+        return Headers(scope=scope).get("x-trace") == "1"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self._sampled(scope):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        status = 500
+
+        async def send_traced(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message).append(
+                    "Server-Timing", trace.server_timing()
+                )
+            await send(message)
+
+        token = _current.set(trace)
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            _current.reset(token)
+            trace.log(scope["method"], scope["path"], status)
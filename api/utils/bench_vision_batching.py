@@ -0,0 +1,118 @@
+"""
+Throughput / tail-latency benchmark for vision micro-batching.
+
+Runs N concurrent "stations" hammering a MicroBatcher for a fixed duration,
+once with batching on and once with it off, and prints images/s and p50/p99.
+
+By default the forward pass is a stand-in dense layer (one matmul over the
+whole batch) so the SIMD amortisation of batching is visible without a model.
+Use --real to run the actual decode -> forward -> annotate -> encode path on a
+generated JPEG instead.
+
+  python api/utils/bench_vision_batching.py --concurrency 8 --seconds 10
+"""
+
+import os, sys, time, asyncio, argparse
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+# Add the repo root to the system path (vision imports its sibling packages)
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(parent_dir))
+
+from api.vision.batching import MicroBatcher
+from api.vision.inference import run_yolo_batch
+
+
+def make_standin_forward(features: int = 4096, hidden: int = 1024):
+    """Dense layer stand-in: cost is dominated by one (B, F) x (F, H) matmul."""
+    rng = np.random.default_rng(0)
+    weights = rng.standard_normal((features, hidden), dtype=np.float32)
+
+    def run_batch(items):
+        x = np.stack(items)
+        y = x @ weights
+        return [float(v) for v in y.sum(axis=1)]
+
+    def make_item():
+        return rng.standard_normal(features, dtype=np.float32)
+
+    return run_batch, make_item
+
+
+def make_real_forward(width: int = 1920, height: int = 1440):
+    img = Image.new("RGB", (width, height), (40, 40, 40))
+    buf = BytesIO()
+    img.save(buf, "JPEG", quality=90)
+    payload = buf.getvalue()
+    return run_yolo_batch, lambda: payload
+
+
+async def run_once(args, enabled: bool) -> dict:
+    if args.real:
+        run_batch, make_item = make_real_forward()
+    else:
+        run_batch, make_item = make_standin_forward()
+
+    batcher = MicroBatcher(
+        "bench",
+        run_batch,
+        max_batch_size=args.max_batch,
+        max_delay_ms=args.deadline_ms,
+        enabled=enabled,
+    )
+    latencies = []
+    stop_at = time.perf_counter() + args.seconds
+
+    async def station():
+        item = make_item()
+        while time.perf_counter() < stop_at:
+            t0 = time.perf_counter()
+            await batcher.submit(item)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(station() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    await batcher.stop()
+
+    lat = np.array(latencies)
+    snap = batcher.snapshot()
+    return {
+        "batching": "on" if enabled else "off",
+        "images/s": len(lat) / elapsed,
+        "p50_ms": float(np.percentile(lat, 50)),
+        "p99_ms": float(np.percentile(lat, 99)),
+        "avg_batch": snap["avg_batch_size"],
+        "max_queue": snap["max_queue_depth"],
+    }
+
+
+async def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--max-batch", type=int, default=8)
+    ap.add_argument("--deadline-ms", type=float, default=20.0)
+    ap.add_argument("--real", action="store_true", help="use the real vision path")
+    args = ap.parse_args()
+
+    rows = [await run_once(args, enabled) for enabled in (False, True)]
+
+    print(
+        f"\nconcurrency={args.concurrency} max_batch={args.max_batch} deadline={args.deadline_ms}ms"
+    )
+    print(
+        f"{'batching':>8} {'images/s':>10} {'p50_ms':>9} {'p99_ms':>9} {'avg_batch':>10} {'max_queue':>10}"
+    )
+    for r in rows:
+        print(
+            f"{r['batching']:>8} {r['images/s']:>10.1f} {r['p50_ms']:>9.1f} "
+            f"{r['p99_ms']:>9.1f} {r['avg_batch']:>10.2f} {r['max_queue']:>10d}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+"""
+Classical counter calibration: precision at the confidence threshold.
+
+Runs the color-threshold counter (api/vision/classical.py) directly on
+synthetic scenes, spaced and with touching / overlapping parts, and prints
+per product how many photos it answers at CLASSICAL_MIN_CONF (the rest go to
+the ML model), how many of those answers are exact, and the counts it gets
+right below the threshold. Exits 1 when precision falls under --min-precision,
+so a profile or scoring change can be checked before it ships.
+
+  python api/utils/bench_vision_classical.py
+  python api/utils/bench_vision_classical.py --threshold 0.7 --gaps 0.1,-0.2
+"""
+
+import os, sys, time, argparse
+from collections import defaultdict
+
+# Add the repo root to the system path (vision imports its sibling packages)
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(parent_dir))
+
+from api.vision.config import CLASSICAL_MIN_CONF
+from api.vision.classical import PROFILES, run_classical_batch
+from api.vision.synthetic import DENSITIES, RESOLUTIONS, SCENES, generate
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--threshold", type=float, default=CLASSICAL_MIN_CONF)
+    ap.add_argument("--min-precision", type=float, default=0.98)
+    ap.add_argument("--products", default=",".join(p for p in SCENES if p in PROFILES))
+    ap.add_argument("--gaps", default="0.1,-0.15", help="part spacing, see synthetic")
+    ap.add_argument("--densities", default=",".join(map(str, DENSITIES)))
+    ap.add_argument("--per-scene", type=int, default=2)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    # product -> [photos, answered, answered exact, exact below threshold]
+    stats = defaultdict(lambda: [0, 0, 0, 0])
+    t0 = time.perf_counter()
+    for gap in (float(g) for g in args.gaps.split(",")):
+        for img in generate(
+            args.products.split(","),
+            RESOLUTIONS,
+            [int(d) for d in args.densities.split(",")],
+            args.per_scene,
+            args.seed,
+            gap=gap,
+        ):
+            res = run_classical_batch([img.jpeg], img.product, render=False)[0]
+            exact = res.count == img.count
+            answered = res.mean_conf >= args.threshold
+            s = stats[(img.product, gap)]
+            s[0] += 1
+            s[1] += answered
+            s[2] += answered and exact
+            s[3] += exact and not answered
+
+    print(
+        f"\nclassical counter at confidence >= {args.threshold} "
+        f"({time.perf_counter() - t0:.1f}s)"
+    )
+    print(
+        f"{'product':>15} {'gap':>6} {'photos':>7} {'answered%':>10} "
+        f"{'precision%':>11} {'exact_escalated':>16}"
+    )
+    total = [0, 0, 0, 0]
+    for (product, gap), s in sorted(stats.items()):
+        total = [a + b for a, b in zip(total, s)]
+        precision = f"{s[2] / s[1] * 100:.0f}" if s[1] else "-"
+        print(
+            f"{product:>15} {gap:>6.2f} {s[0]:>7} {s[1] / s[0] * 100:>10.0f} "
+            f"{precision:>11} {s[3]:>16}"
+        )
+
+    precision = total[2] / total[1] if total[1] else 1.0
+    print(
+        f"\nanswered {total[1]}/{total[0]}, precision {precision * 100:.1f}% "
+        f"(min {args.min_precision * 100:.0f}%)"
+    )
+    if precision < args.min_precision:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
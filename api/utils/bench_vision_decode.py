@@ -0,0 +1,88 @@
+"""
+Decode + preprocess benchmark: current full-resolution path vs draft path.
+
+  old:  Image.open().convert("RGB") -> resize to SxS
+  new:  preprocess.decode_into (JPEG draft, resize, then EXIF) into a batch slot
+
+Generates textured JPEGs at a few resolutions and prints ms per image and
+ms per megapixel for both paths.
+
+  python api/utils/bench_vision_decode.py --repeat 10
+"""
+
+import os, sys, time, argparse
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+# Add the repo root to the system path (vision imports its sibling packages)
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(parent_dir))
+
+from api.vision.config import MODEL_INPUT_SIZE
+from api.vision.preprocess import decode_into, new_batch
+
+RESOLUTIONS = [(1024, 768), (1600, 1200), (2592, 1944), (4000, 3000)]  # ~0.8-12 MP
+
+
+def make_jpeg(width: int, height: int, orientation: int = 6) -> bytes:
+    """Noisy gradient photo stand-in, tagged with an EXIF orientation."""
+    rng = np.random.default_rng(width)
+    yy, xx = np.mgrid[0:height, 0:width]
+    base = np.stack(
+        [(xx * 255 // width), (yy * 255 // height), ((xx + yy) % 256)], axis=-1
+    )
+    noise = rng.integers(0, 40, size=base.shape)
+    arr = np.clip(base + noise, 0, 255).astype(np.uint8)
+    img = Image.fromarray(arr)
+    exif = img.getexif()
+    exif[0x0112] = orientation
+    buf = BytesIO()
+    img.save(buf, "JPEG", quality=90, exif=exif)
+    return buf.getvalue()
+
+
+def old_path(data: bytes, size: int) -> np.ndarray:
+    img = Image.open(BytesIO(data)).convert("RGB")
+    return np.asarray(img.resize((size, size), Image.BILINEAR), dtype=np.uint8)
+
+
+def new_path(data: bytes, size: int, out: np.ndarray) -> np.ndarray:
+    decode_into(data, out)
+    return out
+
+
+def timeit(fn, repeat: int) -> float:
+    fn()  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) * 1000 / repeat
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--repeat", type=int, default=10)
+    ap.add_argument("--size", type=int, default=MODEL_INPUT_SIZE)
+    args = ap.parse_args()
+
+    slot = new_batch(1, args.size)[0]
+    print(f"\nmodel input {args.size}x{args.size}, {args.repeat} runs each")
+    print(
+        f"{'resolution':>12} {'MP':>5} {'old_ms':>8} {'new_ms':>8} "
+        f"{'old_ms/MP':>10} {'new_ms/MP':>10} {'speedup':>8}"
+    )
+    for w, h in RESOLUTIONS:
+        data = make_jpeg(w, h)
+        mp = w * h / 1e6
+        old_ms = timeit(lambda: old_path(data, args.size), args.repeat)
+        new_ms = timeit(lambda: new_path(data, args.size, slot), args.repeat)
+        print(
+            f"{f'{w}x{h}':>12} {mp:>5.1f} {old_ms:>8.1f} {new_ms:>8.1f} "
+            f"{old_ms / mp:>10.2f} {new_ms / mp:>10.2f} {old_ms / new_ms:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
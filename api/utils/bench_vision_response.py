@@ -0,0 +1,73 @@
+"""
+Response-path benchmark: rendered JPEG vs JSON overlay geometry.
+
+Runs the app in-process (VISION_WORKERS=0, result cache off) so every CPU
+cycle spent on a request lands in this process, then for each mode prints
+bytes on the wire (client sends Accept-Encoding: gzip) and server CPU per
+request (process CPU time / requests; the in-process client adds the
+same small overhead to both modes).
+
+  python api/utils/bench_vision_response.py --requests 50 --size 2592x1944
+"""
+
+import os, sys, time, argparse
+
+# In-process, uncached: measure the real per-request work
+os.environ["VISION_WORKERS"] = "0"
+os.environ["VISION_CACHE"] = "0"
+os.environ["VISION_LABEL_QUEUE"] = "0"
+
+# Add the repo root to the system path (the app is imported as a package)
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(parent_dir))
+
+from fastapi.testclient import TestClient
+from api.main import app
+from api.utils.bench_vision_decode import make_jpeg
+
+
+def bench(client, endpoint: str, data: dict, jpeg: bytes, n: int) -> dict:
+    headers = {
+        "Authorization": f"Bearer {os.getenv('API_BEARER_TOKEN')}",
+        "Accept-Encoding": "gzip",
+    }
+    files = {"file": ("bench.jpg", jpeg, "image/jpeg")}
+    client.post(endpoint, files=files, data=data, headers=headers)  # warm-up
+
+    wire = 0
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    for _ in range(n):
+        r = client.post(endpoint, files=files, data=data, headers=headers)
+        r.raise_for_status()
+        wire += r.num_bytes_downloaded
+    cpu, wall = time.process_time() - cpu0, time.perf_counter() - t0
+    return {
+        "bytes": wire / n,
+        "cpu_ms": cpu * 1000 / n,
+        "wall_ms": wall * 1000 / n,
+        "encoding": r.headers.get("content-encoding", "identity"),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--requests", type=int, default=30)
+    ap.add_argument("--size", default="2592x1944")
+    ap.add_argument("--endpoint", default="/api/vision/yolo")
+    args = ap.parse_args()
+
+    w, h = (int(v) for v in args.size.split("x"))
+    jpeg = make_jpeg(w, h, orientation=1)
+    print(f"\n{args.endpoint}, {w}x{h} upload ({len(jpeg) / 1024:.0f} KiB)")
+    print(f"{'mode':>6} {'bytes':>10} {'encoding':>9} {'cpu_ms':>8} {'wall_ms':>8}")
+    with TestClient(app) as client:
+        for mode in ("image", "json"):
+            r = bench(client, args.endpoint, {"output": mode}, jpeg, args.requests)
+            print(
+                f"{mode:>6} {r['bytes']:>10.0f} {r['encoding']:>9} "
+                f"{r['cpu_ms']:>8.1f} {r['wall_ms']:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Vision benchmark on synthetic QC photos: throughput, latency, RSS, accuracy.
+
+Generates foam-ring / gripper scenes (api/vision/synthetic.py) over a grid of
+resolutions and part counts, then drives a vision endpoint at fixed
+concurrency levels (closed loop: each client sends its next image as soon as
+the last one answers). Per level it prints images/s, p50/p95/p99 latency,
+peak RSS and counting accuracy against the synthetic ground truth; a
+breakdown by scene follows.
+
+In-process by default (the full app with its vision worker processes, result
+cache and label queue off). With --url it benchmarks a running server over
+HTTP instead; pass --server-pid to sample that server's RSS (its worker
+processes included). Every request carries a unique JPEG comment, so the
+server's result cache never answers.
+
+  python api/utils/bench_vision_suite.py --concurrency 1,4,8 --requests 48
+  python api/utils/bench_vision_suite.py --url http://localhost:8000 --server-pid 1234
+  python api/utils/bench_vision_suite.py --save /tmp/qc_synth   # write the set only
+  python api/utils/bench_vision_suite.py --set /tmp/qc_synth    # reuse a saved set
+"""
+
+import os, sys, time, asyncio, argparse, itertools, logging
+from collections import Counter, defaultdict
+from pathlib import Path
+
+# In-process runs measure the real work: no cache, no captures
+os.environ.setdefault("VISION_CACHE", "0")
+os.environ.setdefault("VISION_LABEL_QUEUE", "0")
+
+# Add the repo root to the system path (the app is imported as a package)
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(parent_dir))
+
+import httpx
+import numpy as np
+
+from api.vision.synthetic import (
+    DENSITIES,
+    RESOLUTIONS,
+    SCENES,
+    generate,
+    load_set,
+    save_set,
+)
+
+
+def unique_jpeg(jpeg: bytes, n: int) -> bytes:
+    """Same pixels, different bytes: a COM segment right after SOI."""
+    payload = f"bench {n}".encode()
+    return (
+        jpeg[:2]
+        + b"\xff\xfe"
+        + (len(payload) + 2).to_bytes(2, "big")
+        + payload
+        + jpeg[2:]
+    )
+
+
+def tree_rss_mb(pid: int) -> float:
+    """RSS of a process and all its descendants, from /proc (Linux only)."""
+    total, stack = 0, [pid]
+    while stack:
+        p = stack.pop()
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+                        break
+            for tid in os.listdir(f"/proc/{p}/task"):
+                with open(f"/proc/{p}/task/{tid}/children") as f:
+                    stack.extend(int(c) for c in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total / 1024
+
+
+async def sample_rss(pid: int, peak: list, every_s: float = 0.2) -> None:
+    while True:
+        peak[0] = max(peak[0], tree_rss_mb(pid))
+        await asyncio.sleep(every_s)
+
+
+async def infer(client: httpx.AsyncClient, args, img, n: int) -> dict:
+    data = {"product": img.product}
+    if args.endpoint == "yolo":
+        data["output"] = "json"
+    if args.tiled:
+        data["tiled"] = "true"
+    files = {"file": (f"{img.name}.jpg", unique_jpeg(img.jpeg, n), "image/jpeg")}
+    t0 = time.perf_counter()
+    try:
+        r = await client.post(f"/api/vision/{args.endpoint}", files=files, data=data)
+    except httpx.HTTPError as e:
+        return {"img": img, "ms": None, "error": repr(e)}
+    ms = (time.perf_counter() - t0) * 1000
+    if r.status_code != 200:
+        return {"img": img, "ms": ms, "error": str(r.status_code)}
+    body = r.json()
+    return {
+        "img": img,
+        "ms": ms,
+        "count": body["count"],
+        "answered_by": body.get("stage") or body.get("engine"),
+    }
+
+
+async def run_level(client, args, images, concurrency: int, pid) -> dict:
+    counter = itertools.count()
+    results = []
+
+    async def station():
+        while (n := next(counter)) < args.requests:
+            results.append(await infer(client, args, images[n % len(images)], n))
+
+    peak = [0.0]
+    sampler = asyncio.create_task(sample_rss(pid, peak)) if pid else None
+    t0 = time.perf_counter()
+    await asyncio.gather(*(station() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    if sampler:
+        sampler.cancel()
+
+    ok = [r for r in results if "count" in r]
+    lat = np.array([r["ms"] for r in ok]) if ok else np.zeros(1)
+    err = np.array([r["count"] - r["img"].count for r in ok]) if ok else np.zeros(1)
+    return {
+        "concurrency": concurrency,
+        "images/s": len(ok) / elapsed,
+        "p50": float(np.percentile(lat, 50)),
+        "p95": float(np.percentile(lat, 95)),
+        "p99": float(np.percentile(lat, 99)),
+        "errors": len(results) - len(ok),
+        "rss_mb": peak[0] if pid else None,
+        "exact": float(np.mean(err == 0)) * 100,
+        "mae": float(np.mean(np.abs(err))),
+        "results": ok,
+        "failures": Counter(r["error"] for r in results if "error" in r),
+    }
+
+
+def print_breakdown(results) -> None:
+    by_scene = defaultdict(list)
+    for r in results:
+        img = r["img"]
+        w, h = img.size
+        density = img.name.rsplit("_", 2)[-2]
+        by_scene[(img.product, f"{w}x{h}", density)].append(r)
+
+    print(
+        f"\n{'product':>15} {'size':>10} {'parts':>6} {'n':>4} {'truth':>6} "
+        f"{'pred':>6} {'exact%':>7} {'mae':>5}  answered by"
+    )
+    for (product, size, density), rs in sorted(by_scene.items()):
+        truth = np.mean([r["img"].count for r in rs])
+        pred = np.mean([r["count"] for r in rs])
+        err = np.array([r["count"] - r["img"].count for r in rs])
+        stages = Counter(r["answered_by"] for r in rs).most_common()
+        print(
+            f"{product:>15} {size:>10} {density:>6} {len(rs):>4} {truth:>6.1f} "
+            f"{pred:>6.1f} {np.mean(err == 0) * 100:>7.0f} {np.mean(np.abs(err)):>5.1f}  "
+            + ", ".join(f"{s} {c}" for s, c in stages)
+        )
+
+
+async def bench(args, images) -> None:
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # one line per request
+    levels = [int(c) for c in args.concurrency.split(",")]
+    headers = {"Authorization": f"Bearer {os.getenv('API_BEARER_TOKEN')}"}
+    timeout = httpx.Timeout(args.timeout)
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, headers=headers, timeout=timeout)
+        pid, lifespan = args.server_pid, None
+    else:
+        from api.main import app
+
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(
+            transport=transport,
+            base_url="http://bench",
+            headers=headers,
+            timeout=timeout,
+        )
+        pid, lifespan = os.getpid(), app.router.lifespan_context(app)
+
+    if lifespan is not None:
+        await lifespan.__aenter__()
+    try:
+        async with client:
+            # Warm-up: first requests pay for pool spawn and lazy imports
+            for n, img in enumerate(images[: args.warmup]):
+                await infer(client, args, img, -1 - n)
+
+            target = args.url or "in-process"
+            print(
+                f"\n/api/vision/{args.endpoint} ({target}), {len(images)} images, "
+                f"{args.requests} requests per level"
+            )
+            print(
+                f"{'conc':>5} {'images/s':>9} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8} "
+                f"{'errors':>7} {'rss_mb':>7} {'exact%':>7} {'mae':>5}"
+            )
+            all_ok = []
+            for c in levels:
+                r = await run_level(client, args, images, c, pid)
+                all_ok.extend(r["results"])
+                rss = f"{r['rss_mb']:.0f}" if r["rss_mb"] is not None else "-"
+                print(
+                    f"{c:>5} {r['images/s']:>9.2f} {r['p50']:>8.0f} {r['p95']:>8.0f} "
+                    f"{r['p99']:>8.0f} {r['errors']:>7} {rss:>7} {r['exact']:>7.0f} "
+                    f"{r['mae']:>5.2f}"
+                )
+                for reason, n in r["failures"].items():
+                    print(f"{'':>5} {n} x {reason}")
+            if all_ok:
+                print_breakdown(all_ok)
+    finally:
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--endpoint", choices=["count", "yolo"], default="count")
+    ap.add_argument("--tiled", action="store_true")
+    ap.add_argument("--concurrency", default="1,4,8", help="comma-separated levels")
+    ap.add_argument("--requests", type=int, default=32, help="per concurrency level")
+    ap.add_argument("--warmup", type=int, default=2)
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--url", help="benchmark a running server instead")
+    ap.add_argument("--server-pid", type=int, help="sample this server's RSS")
+    ap.add_argument("--products", default=",".join(SCENES))
+    ap.add_argument(
+        "--resolutions", default=",".join(f"{w}x{h}" for w, h in RESOLUTIONS)
+    )
+    ap.add_argument("--densities", default=",".join(map(str, DENSITIES)))
+    ap.add_argument("--per-scene", type=int, default=1)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--set", help="load a saved synthetic set instead of generating")
+    ap.add_argument("--save", help="write the generated set here and exit")
+    args = ap.parse_args()
+
+    if args.set:
+        images = load_set(args.set)
+    else:
+        t0 = time.perf_counter()
+        images = list(
+            generate(
+                args.products.split(","),
+                [
+                    tuple(int(v) for v in r.split("x"))
+                    for r in args.resolutions.split(",")
+                ],
+                [int(d) for d in args.densities.split(",")],
+                args.per_scene,
+                args.seed,
+            )
+        )
+        print(f"generated {len(images)} images in {time.perf_counter() - t0:.1f}s")
+    if args.save:
+        n = save_set(images, args.save)
+        print(f"saved {n} images to {Path(args.save).resolve()}")
+        return
+
+    asyncio.run(bench(args, images))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Local stand-in for the GroundedSAM service, for load-testing the fallback path
+on a laptop. Serves the same `/infer` contract as the real service (see
+api/vision/grounded_sam.py) with configurable latency, failures and capacity.
+
+  python api/utils/groundedsam_standin.py --port 9000 --latency-ms 800 \
+      --jitter-ms 200 --fail-rate 0.05 --timeout-rate 0.01 --capacity 2
+
+Then point the API at it:  GROUNDED_SAM_URL=http://127.0.0.1:9000/infer
+
+- `--capacity` requests are "on the GPU" at once; the rest queue, like the
+  real single-GPU box.
+- Failures answer 500; timeouts sleep far past any sane client deadline.
+- Detections are random boxes + polygons inside the decoded image.
+"""
+
+import random, asyncio, argparse
+from io import BytesIO
+
+import uvicorn
+from PIL import Image
+from fastapi import FastAPI, File, Form, UploadFile
+from fastapi.responses import JSONResponse
+
+args = None
+app = FastAPI(title="GroundedSAM stand-in")
+stats = {"requests": 0, "failed": 0, "timed_out": 0, "queued": 0, "running": 0}
+_gpu: asyncio.Semaphore = None
+
+
+def fake_detections(width: int, height: int, n: int) -> dict:
+    boxes, masks = [], []
+    for _ in range(n):
+        w = random.randint(max(2, width // 20), max(3, width // 6))
+        h = random.randint(max(2, height // 20), max(3, height // 6))
+        x, y = random.randint(0, width - w), random.randint(0, height - h)
+        boxes.append([x, y, x + w, y + h])
+        masks.append(
+            [[x, y + h // 2], [x + w // 2, y], [x + w, y + h // 2], [x + w // 2, y + h]]
+        )
+    return {
+        "boxes": boxes,
+        "scores": [round(random.uniform(0.5, 0.95), 3) for _ in boxes],
+        "labels": ["object"] * n,
+        "masks": masks,
+        "model": "standin",
+    }
+
+
+@app.post("/infer")
+async def infer(
+    image: UploadFile = File(...),
+    prompt: str = Form("object"),
+):
+    global _gpu
+    if _gpu is None:
+        _gpu = asyncio.Semaphore(args.capacity)
+    stats["requests"] += 1
+    data = await image.read()
+    try:
+        width, height = Image.open(BytesIO(data)).size
+    except Exception:
+        return JSONResponse(status_code=400, content={"error": "bad image"})
+
+    stats["queued"] += 1
+    async with _gpu:
+        stats["queued"] -= 1
+        stats["running"] += 1
+        try:
+            if random.random() < args.timeout_rate:
+                stats["timed_out"] += 1
+                await asyncio.sleep(3600)
+            delay = max(0.0, random.gauss(args.latency_ms, args.jitter_ms)) / 1000
+            await asyncio.sleep(delay)
+            if random.random() < args.fail_rate:
+                stats["failed"] += 1
+                return JSONResponse(status_code=500, content={"error": "CUDA OOM"})
+        finally:
+            stats["running"] -= 1
+
+    return fake_detections(width, height, random.randint(1, args.max_objects))
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", **stats, "capacity": args.capacity}
+
+
+def main():
+    global args
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9000)
+    ap.add_argument("--latency-ms", type=float, default=800)
+    ap.add_argument("--jitter-ms", type=float, default=200)
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--timeout-rate", type=float, default=0.0)
+    ap.add_argument("--capacity", type=int, default=2)
+    ap.add_argument("--max-objects", type=int, default=12)
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+    random.seed(args.seed)
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Build INT8 variants of a detector for CPU serving.
+
+Writes <version>.int8_dynamic.onnx and/or <version>.int8_static.onnx next to
+the fp32 model. A running server picks them up on its next model poll: it
+re-tunes for this machine (api/vision/autotune.py) and serves the fastest
+variant that still agrees with fp32.
+
+Static quantization is calibrated on the low-confidence capture queue by
+default (the photos the plant actually struggles with); use --calibration
+synthetic when the queue is still empty, or point it at a directory of
+photos. Needs `pip install onnx` on top of onnxruntime.
+
+  python api/utils/quantize_vision_model.py models/foam-v3.onnx
+  python api/utils/quantize_vision_model.py models/foam-v3.onnx --variants int8_static --calibration synthetic --limit 100
+  python api/utils/quantize_vision_model.py models/foam-v3.onnx --tune   # tune here too
+"""
+
+import os, sys, time, argparse
+
+# Add the repo root to the system path (the app is imported as a package)
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(parent_dir))
+
+from api.vision.config import VISION_WORKERS
+from api.vision.quantize import build_variants
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("model", help="fp32 .onnx export")
+    ap.add_argument(
+        "--variants",
+        default="int8_dynamic,int8_static",
+        help="comma-separated: int8_dynamic, int8_static",
+    )
+    ap.add_argument(
+        "--calibration",
+        default="label_queue",
+        help="label_queue | synthetic | a directory of photos",
+    )
+    ap.add_argument("--limit", type=int, default=200, help="calibration images")
+    ap.add_argument(
+        "--tune", action="store_true", help="run the machine auto-tuner afterwards"
+    )
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    built = build_variants(
+        args.model, args.variants.split(","), args.calibration, args.limit
+    )
+    src_mb = os.path.getsize(args.model) / (1024 * 1024)
+    print(f"\n{args.model}: {src_mb:.1f} MiB fp32")
+    for variant, path in built.items():
+        print(
+            f"{variant:>13}: {path} ({os.path.getsize(path) / (1024 * 1024):.1f} MiB)"
+        )
+    print(f"built in {time.perf_counter() - t0:.1f}s")
+
+    if args.tune:
+        from api.vision import autotune
+
+        path, options, record = autotune.select(args.model, VISION_WORKERS)
+        print(f"\nserving on this machine: {path} {options}")
+        if record:
+            print(f"agreement with fp32: {record['agreement']}")
+            print(f"{'variant':>13} {'threads':>7} {'mode':>10} {'batch_ms':>9}")
+            for t in sorted(record["trials"], key=lambda t: t["batch_ms"]):
+                o = t["options"]
+                print(
+                    f"{t['variant']:>13} {o.get('intra_op_threads') or '-':>7} "
+                    f"{o.get('execution_mode', 'sequential'):>10} {t['batch_ms']:>9.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 from fastapi import APIRouter
 from .vision_routes import router as vision_router
+from .setup import start_vision, stop_vision
 
 router = APIRouter(prefix="/api/vision", tags=["vision"])
 router.include_router(vision_router)
 
-__all__ = ["router"]
+__all__ = ["router", "start_vision", "stop_vision"]
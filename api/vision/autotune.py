@@ -0,0 +1,237 @@
+"""
+Per-machine runtime tuning for the ONNX detector.
+
+The first time a model is served on a machine (and again whenever its
+variant files change), every variant on disk is timed on a synthetic batch
+under a grid of session settings (intra-op thread counts, sequential vs
+parallel execution). The fastest configuration is saved to
+AUTOTUNE_DIR/<machine>.json. Later boots, hot swaps and the other uvicorn
+workers read the saved choice instead of tuning again.
+
+- A quantized variant must first agree with fp32 on that batch (box F1 at
+  IoU 0.5 >= AUTOTUNE_MIN_AGREEMENT), or it is not served.
+- Thread counts are bounded by the CPUs each vision worker process gets.
+- Tuning runs in a separate spawned process (clean timings, no onnxruntime
+  state left in the API process) under a file lock, so concurrent uvicorn
+  workers tune once and the rest wait for the result.
+- VISION_MODEL_VARIANT / VISION_MODEL_THREADS pin the choice; tuning then
+  only covers what is not pinned. VISION_AUTOTUNE=0 skips tuning entirely.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import json
+import time
+import logging
+import platform
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from ..file_lock import FileLock
+from .boxes import match_f1
+from .config import (
+    AUTOTUNE_BUDGET_S,
+    AUTOTUNE_DIR,
+    AUTOTUNE_ENABLED,
+    AUTOTUNE_MIN_AGREEMENT,
+    MAX_BATCH_SIZE,
+    MODEL_THREADS,
+    MODEL_VARIANT,
+)
+from .onnx_detector import available_variants
+
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+_KEEP_MODELS = 10  # tuning records kept per machine file
+
+
+def machine_id() -> str:
+    node = re.sub(r"[^A-Za-z0-9_.-]", "_", platform.node() or "host")
+    return f"{node}-{os.cpu_count()}cpu"
+
+
+def tune_path() -> Path:
+    return Path(AUTOTUNE_DIR) / f"{machine_id()}.json"
+
+
+def default_options() -> dict:
+    return {"intra_op_threads": MODEL_THREADS or None}
+
+
+def model_key(model_path: str) -> str:
+    """Identifies a model, its variant files and the pins it was tuned under."""
+    parts = []
+    for variant, p in available_variants(model_path).items():
+        st = p.stat()
+        parts.append(f"{variant}:{st.st_size}:{int(st.st_mtime)}")
+    return f"{Path(model_path).stem}|{','.join(parts)}|{MODEL_VARIANT}|{MODEL_THREADS}"
+
+
+def thread_grid(workers: int) -> List[dict]:
+    """Session settings to try, within the CPUs one worker process gets."""
+    budget = max(1, (os.cpu_count() or 1) // max(1, workers))
+    if MODEL_THREADS:
+        counts = [MODEL_THREADS]
+    else:
+        counts = sorted({2**i for i in range(budget.bit_length()) if 2**i <= budget})
+        counts = sorted(set(counts) | {budget})
+    grid = [{"intra_op_threads": t, "execution_mode": "sequential"} for t in counts]
+    if budget >= 2:
+        grid += [
+            {"intra_op_threads": t, "inter_op_threads": 2, "execution_mode": "parallel"}
+            for t in counts
+        ]
+    return grid
+
+
+# ---------------------------------------------------------------------------- #
+# Tuner (runs in its own process)
+def _tune_batch(n: int) -> np.ndarray:
+    from .preprocess import letterbox_into, new_batch, open_for_model
+    from .synthetic import generate
+
+    images = generate(resolutions=[(1600, 1200)], densities=[10], per_scene=n)
+    batch = new_batch(n)
+    for i, img in zip(range(n), images):
+        decoded, source_size = open_for_model(img.jpeg)
+        letterbox_into(decoded, batch[i], source_size)
+    return batch
+
+
+def _trial(path: str, options: dict, batch: np.ndarray, repeat: int):
+    from .onnx_detector import OnnxDetector
+
+    detector = OnnxDetector(path, **options)
+    dets = detector.forward(batch)  # warm-up, and the output to compare
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        detector.forward(batch)
+        times.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(times)), dets
+
+
+def tune(
+    model_path: str,
+    workers: int,
+    batch_size: int = MAX_BATCH_SIZE,
+    repeat: int = 5,
+    budget_s: float = AUTOTUNE_BUDGET_S,
+) -> dict:
+    """Time variants x session settings; returns the record that gets saved."""
+    t_start = time.perf_counter()
+    variants = {v: str(p) for v, p in available_variants(model_path).items()}
+    if MODEL_VARIANT in variants:
+        variants = {v: p for v, p in variants.items() if v in ("fp32", MODEL_VARIANT)}
+    batch = _tune_batch(batch_size)
+    trials = []
+
+    def run(variant: str, options: dict):
+        ms, dets = _trial(variants[variant], options, batch, repeat)
+        trials.append({"variant": variant, "options": options, "batch_ms": ms})
+        return ms, dets
+
+    # 1. Accuracy gate: every quantized variant against fp32, default settings
+    grid = thread_grid(workers)
+    _, reference = run("fp32", grid[0])
+    agreement = {"fp32": 1.0}
+    for variant in [v for v in variants if v != "fp32"]:
+        _, dets = run(variant, grid[0])
+        agreement[variant] = float(
+            np.mean([match_f1(r.boxes, d.boxes) for r, d in zip(reference, dets)])
+        )
+    if MODEL_VARIANT in variants:
+        candidates = [MODEL_VARIANT]  # pinned: served whatever its agreement
+    else:
+        candidates = [v for v in variants if agreement[v] >= AUTOTUNE_MIN_AGREEMENT]
+
+    # 2. Speed: remaining settings for each candidate, within the time budget
+    for variant in candidates:
+        for options in grid[1:]:
+            if time.perf_counter() - t_start > budget_s:
+                break
+            run(variant, options)
+
+    best = min(
+        (t for t in trials if t["variant"] in candidates), key=lambda t: t["batch_ms"]
+    )
+    return {
+        "variant": best["variant"],
+        "path": variants[best["variant"]],
+        "options": best["options"],
+        "batch_ms": round(best["batch_ms"], 2),
+        "batch_size": batch_size,
+        "agreement": {v: round(a, 4) for v, a in agreement.items()},
+        "trials": [{**t, "batch_ms": round(t["batch_ms"], 2)} for t in trials],
+        "tuned_at": time.time(),
+        "tune_s": round(time.perf_counter() - t_start, 1),
+    }
+
+
+# ---------------------------------------------------------------------------- #
+# Saved choices
+def _load(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(path: Path, key: str, record: dict) -> None:
+    data = _load(path)
+    models = data.get("models", {})
+    models.pop(key, None)
+    models[key] = record  # most recent last
+    data = {
+        "machine": {
+            "node": platform.node(),
+            "processor": platform.processor() or platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "models": dict(list(models.items())[-_KEEP_MODELS:]),
+    }
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(data, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def select(model_path: str, workers: int) -> Tuple[str, dict, Optional[dict]]:
+    """
+    (file to load, session options, tuning record) for serving `model_path`
+    on this machine; tunes first if nothing is saved for it yet. Blocking.
+    """
+    variants = available_variants(model_path)
+    if not AUTOTUNE_ENABLED:
+        variant = MODEL_VARIANT if MODEL_VARIANT in variants else "fp32"
+        return str(variants.get(variant, model_path)), default_options(), None
+
+    path, key = tune_path(), model_key(model_path)
+    with FileLock(path.with_name(path.name + ".lock"), timeout_s=3 * AUTOTUNE_BUDGET_S):
+        record = _load(path).get("models", {}).get(key)
+        if record is None:
+            logger.info(
+                f"[VISION] tuning {Path(model_path).name} on {machine_id()} "
+                f"({', '.join(variants)}) ..."
+            )
+            try:
+                with ProcessPoolExecutor(1, mp_context=mp.get_context("spawn")) as ex:
+                    record = ex.submit(tune, model_path, workers).result()
+            except Exception as e:
+                logger.error(f"[VISION] tuning failed, serving fp32 defaults: {e!r}")
+                return model_path, default_options(), None
+            _save(path, key, record)
+            logger.info(
+                f"[VISION] tuned in {record['tune_s']}s: {record['variant']} "
+                f"{record['options']} -> {record['batch_ms']}ms per "
+                f"{record['batch_size']}-image batch"
+            )
+
+    if not Path(record["path"]).is_file():  # variant removed since
+        return model_path, default_options(), None
+    return record["path"], record["options"], record
@@ -0,0 +1,184 @@
+"""
+Dynamic micro-batching for vision inference.
+
+- Requests are queued; a single drain task groups them into batches of up to
+  `max_batch_size`, waiting at most `max_delay_ms` after the oldest queued item.
+- Each batch runs as ONE call to `run_batch` (a sync callable runs in a worker
+  thread, an async one is awaited), and results are split back to the waiting
+  requests in order. Up to `max_concurrent_batches` batches run at once so a
+  multi-process worker pool stays busy.
+- `run_batch` may put an Exception in a result slot to fail just that request.
+- With `enabled=False` every request runs as its own batch of 1 (same metrics),
+  which is what the benchmark compares against.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+import asyncio
+import inspect
+import logging
+from collections import Counter
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        name: str,
+        run_batch: Callable[[List[Any]], List[Any]],
+        *,
+        max_batch_size: int = 8,
+        max_delay_ms: float = 20.0,
+        max_concurrent_batches: int = 1,
+        enabled: bool = True,
+    ) -> None:
+        self.name = name
+        self._run_batch = run_batch
+        self._is_async = inspect.iscoroutinefunction(run_batch)
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_delay = max(0.0, max_delay_ms) / 1000.0
+        self.max_concurrent_batches = max(1, max_concurrent_batches)
+        self.enabled = enabled
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._running: set[asyncio.Task] = set()
+
+        # metrics
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._max_depth = 0
+        self._wait_ms_total = 0.0
+        self._run_ms_total = 0.0
+        self._sizes: Counter = Counter()
+
+    # --- public API ---
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its slot of the batched result."""
+        if not self.enabled:
+            result = (await self._execute([item], [time.perf_counter()]))[0]
+        else:
+            self._ensure_started()
+            fut = asyncio.get_running_loop().create_future()
+            self._queue.put_nowait((item, fut, time.perf_counter()))
+            self._max_depth = max(self._max_depth, self._queue.qsize())
+            result = await fut
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def stop(self) -> None:
+        for t in list(self._running):
+            t.cancel()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._queue = None
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "max_batch_size": self.max_batch_size,
+            "max_delay_ms": self.max_delay * 1000,
+            "max_concurrent_batches": self.max_concurrent_batches,
+            "queue_depth": self.queue_depth,
+            "batches_in_flight": len(self._running),
+            "max_queue_depth": self._max_depth,
+            "batches": self._batches,
+            "items": self._items,
+            "errors": self._errors,
+            "avg_batch_size": (self._items / self._batches) if self._batches else 0.0,
+            "avg_queue_wait_ms": (
+                (self._wait_ms_total / self._items) if self._items else 0.0
+            ),
+            "avg_batch_run_ms": (
+                (self._run_ms_total / self._batches) if self._batches else 0.0
+            ),
+            "batch_size_histogram": dict(sorted(self._sizes.items())),
+        }
+
+    # --- internals ---
+    def _ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._queue = self._queue or asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._task = asyncio.create_task(self._drain(), name=f"batcher:{self.name}")
+
+    async def _execute(self, items: List[Any], enqueued: List[float]) -> List[Any]:
+        start = time.perf_counter()
+        self._wait_ms_total += sum((start - t) * 1000 for t in enqueued)
+        try:
+            if self._is_async:
+                results = await self._run_batch(items)
+            else:
+                results = await asyncio.to_thread(self._run_batch, items)
+            if len(results) != len(items):
+                raise RuntimeError(
+                    f"{self.name}: batch returned {len(results)} results for {len(items)} items"
+                )
+        except Exception as e:
+            results = [e] * len(items)
+        self._errors += sum(1 for r in results if isinstance(r, Exception))
+        self._run_ms_total += (time.perf_counter() - start) * 1000
+        self._batches += 1
+        self._items += len(items)
+        self._sizes[len(items)] += 1
+        return results
+
+    async def _drain(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            first = await self._queue.get()
+            batch = [first]
+            # deadline counts from when the oldest item was queued
+            deadline = loop.time() + self.max_delay - (time.perf_counter() - first[2])
+            while len(batch) < self.max_batch_size:
+                # take whatever is already waiting without sleeping
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            live = [b for b in batch if not b[1].done()]  # drop cancelled waiters
+            if not live:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._dispatch(live))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _dispatch(self, live: list) -> None:
+        try:
+            results = await self._execute([b[0] for b in live], [b[2] for b in live])
+            for (_, fut, _), res in zip(live, results):
+                if not fut.done():
+                    fut.set_result(res)
+            logger.debug(
+                "[VISION] %s batch size=%d queue_depth=%d",
+                self.name,
+                len(live),
+                self._queue.qsize() if self._queue else 0,
+            )
+        finally:
+            self._slots.release()
@@ -0,0 +1,81 @@
+"""
+Box utilities shared by the detectors (numpy only, xyxy boxes).
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+
+def box_area(boxes: np.ndarray) -> np.ndarray:
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(
+        boxes[:, 3] - boxes[:, 1], 0, None
+    )
+
+
+def _intersection(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    w = np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0])
+    h = np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1])
+    return np.clip(w, 0, None) * np.clip(h, 0, None)
+
+
+def nms(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    iou_thresh: float = 0.5,
+    contain_thresh: float = 1.0,
+) -> np.ndarray:
+    """
+    Greedy non-maximum suppression; returns kept indices, best score first.
+    With `contain_thresh` < 1, a kept box that has that fraction of its area
+    inside a larger kept box is dropped as well (a part cut at a tile edge),
+    whichever of the two scored higher.
+    """
+    if boxes.shape[0] == 0:
+        return np.zeros(0, dtype=np.int64)
+    areas = box_area(boxes)
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        i, rest = order[0], order[1:]
+        keep.append(i)
+        inter = _intersection(boxes[i], boxes[rest])
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-6)
+        order = rest[iou <= iou_thresh]
+    keep = np.asarray(keep, dtype=np.int64)
+    if contain_thresh >= 1.0 or keep.size < 2:
+        return keep
+
+    big_first = keep[np.argsort(-areas[keep], kind="stable")]
+    dropped = set()
+    for n, i in enumerate(big_first):
+        if i in dropped:
+            continue
+        rest = big_first[n + 1 :]
+        inside = _intersection(boxes[i], boxes[rest]) / np.maximum(areas[rest], 1e-6)
+        dropped.update(rest[inside > contain_thresh].tolist())
+    return np.asarray([i for i in keep if i not in dropped], dtype=np.int64)
+
+
+def match_f1(
+    reference: np.ndarray, boxes: np.ndarray, iou_thresh: float = 0.5
+) -> float:
+    """
+    F1 of `boxes` against `reference`, greedily matching each reference box
+    to its best unmatched box at IoU >= `iou_thresh` (1.0 when both are empty).
+    """
+    if reference.shape[0] == 0 and boxes.shape[0] == 0:
+        return 1.0
+    if reference.shape[0] == 0 or boxes.shape[0] == 0:
+        return 0.0
+    areas = box_area(boxes)
+    free = np.ones(boxes.shape[0], dtype=bool)
+    matched = 0
+    for box, area in zip(reference, box_area(reference)):
+        inter = _intersection(box, boxes)
+        iou = np.where(free, inter / np.maximum(area + areas - inter, 1e-9), 0.0)
+        j = int(np.argmax(iou))
+        if iou[j] >= iou_thresh:
+            free[j] = False
+            matched += 1
+    return 2 * matched / (reference.shape[0] + boxes.shape[0])
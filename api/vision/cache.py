@@ -0,0 +1,200 @@
+"""
+Content-addressed cache for vision results.
+
+- Key = sha256(image bytes) + job + model version + prompt, so a retaken /
+  resent / retried frame is answered without decode or inference.
+- Memory tier: LRU bounded by entry count and total bytes.
+- Disk tier (optional, `VISION_CACHE_DIR`): `<key>.json` + `<key>.jpg` pairs,
+  shared by all uvicorn workers, pruned oldest-first past a size cap.
+- `set_model_version()` drops everything when the served model changes.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import dataclasses
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from ..metrics import cache_lookup
+from .inference import InferenceResult
+
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+
+class ResultCache:
+    def __init__(
+        self,
+        *,
+        enabled: bool = True,
+        max_entries: int = 256,
+        max_bytes: int = 128 * 1024 * 1024,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 1024 * 1024 * 1024,
+    ) -> None:
+        self.enabled = enabled
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self.model_version = ""
+
+        self._mem: OrderedDict[str, InferenceResult] = OrderedDict()
+        self._mem_bytes = 0
+        self._disk_bytes: Optional[int] = None  # lazily measured
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    # --- keys / versioning ---
+    def key(self, img_bytes: bytes, job: str, prompt: str = "") -> str:
+        h = hashlib.sha256(img_bytes)
+        h.update(f"|{job}|{self.model_version}|{prompt}".encode("utf-8"))
+        return h.hexdigest()
+
+    def set_model_version(self, version: str) -> None:
+        """Keys carry the version; a reload also drops the old entries."""
+        previous, self.model_version = self.model_version, version
+        if previous and previous != version:
+            logger.info(f"[VISION] model {previous} -> {version}; cache invalidated")
+            self.invalidate()
+
+    def invalidate(self) -> None:
+        self._mem.clear()
+        self._mem_bytes = 0
+        if self.disk_dir:
+            for p in self.disk_dir.glob("*.*"):
+                try:
+                    p.unlink()
+                except OSError:
+                    pass
+            self._disk_bytes = 0
+
+    # --- lookups ---
+    async def get(self, key: str) -> Optional[InferenceResult]:
+        if not self.enabled:
+            return None
+        res = self._mem.get(key)
+        if res is not None:
+            self._mem.move_to_end(key)
+            self.hits += 1
+            cache_lookup("vision", "hit")
+            return dataclasses.replace(res, cached=True)
+        if self.disk_dir:
+            res = await asyncio.to_thread(self._disk_get, key)
+            if res is not None:
+                self._mem_put(key, res)
+                self.hits += 1
+                self.disk_hits += 1
+                cache_lookup("vision", "disk_hit")
+                return dataclasses.replace(res, cached=True)
+        self.misses += 1
+        cache_lookup("vision", "miss")
+        return None
+
+    async def put(self, key: str, res: InferenceResult) -> None:
+        if not self.enabled or not isinstance(res, InferenceResult):
+            return
+        self._mem_put(key, res)
+        if self.disk_dir:
+            await asyncio.to_thread(self._disk_put, key, res)
+
+    def snapshot(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "model_version": self.model_version,
+            "entries": len(self._mem),
+            "memory_bytes": self._mem_bytes,
+            "disk_bytes": self._disk_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+        }
+
+    # --- memory tier ---
+    def _mem_put(self, key: str, res: InferenceResult) -> None:
+        if key in self._mem:
+            self._mem_bytes -= len(self._mem.pop(key).jpeg)
+        self._mem[key] = dataclasses.replace(res, cached=False, timings_ms={})
+        self._mem_bytes += len(res.jpeg)
+        while self._mem and (
+            len(self._mem) > self.max_entries or self._mem_bytes > self.max_bytes
+        ):
+            _, old = self._mem.popitem(last=False)
+            self._mem_bytes -= len(old.jpeg)
+
+    # --- disk tier ---
+    def _disk_get(self, key: str) -> Optional[InferenceResult]:
+        meta_p = self.disk_dir / f"{key}.json"
+        jpg_p = self.disk_dir / f"{key}.jpg"
+        try:
+            meta = json.loads(meta_p.read_text(encoding="utf-8"))
+            jpeg = jpg_p.read_bytes()
+        except (OSError, ValueError):
+            return None
+        now = time.time()
+        for p in (meta_p, jpg_p):
+            try:
+                os.utime(p, (now, now))  # LRU by mtime
+            except OSError:
+                pass
+        meta["image_size"] = tuple(meta.get("image_size") or ())
+        return InferenceResult(jpeg=jpeg, **meta)
+
+    def _disk_put(self, key: str, res: InferenceResult) -> None:
+        meta = dataclasses.asdict(res)
+        for k in ("jpeg", "timings_ms", "cached"):
+            meta.pop(k, None)
+        try:
+            for suffix, payload in (
+                (".jpg", res.jpeg),
+                (".json", json.dumps(meta).encode("utf-8")),
+            ):
+                tmp = self.disk_dir / f"{key}{suffix}.tmp"
+                tmp.write_bytes(payload)
+                os.replace(tmp, self.disk_dir / f"{key}{suffix}")
+        except OSError as e:
+            logger.warning(f"[VISION] cache disk write failed: {e}")
+            return
+
+        added = len(res.jpeg) + len(json.dumps(meta))
+        if self._disk_bytes is None or self._disk_bytes + added > self.disk_max_bytes:
+            self._prune_disk()  # (re)measures, other workers share the dir
+        else:
+            self._disk_bytes += added
+
+    def _disk_files(self):
+        return [p for p in self.disk_dir.iterdir() if p.suffix in (".jpg", ".json")]
+
+    def _prune_disk(self) -> None:
+        files = []
+        for p in self._disk_files():
+            try:
+                st = p.stat()
+                files.append((st.st_mtime, st.st_size, p))
+            except OSError:
+                pass
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        target = self.disk_max_bytes * 0.9  # prune a little extra to avoid thrash
+        for _, size, p in files:
+            if total <= target:
+                break
+            try:
+                p.unlink()
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
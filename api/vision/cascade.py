@@ -0,0 +1,139 @@
+"""
+Confidence-gated cascade over the vision models.
+
+Stages run cheapest first (classical counter -> detector -> GroundedSAM).
+The first stage whose confidence clears its threshold answers; otherwise the
+next, more expensive stage runs. The whole cascade shares one deadline: every
+stage gets only the time that is left, and when it runs out the most
+confident result so far is returned (or TimeoutError if there is none).
+
+A stage that fails (service down, circuit open, stage timeout) is recorded
+and the cascade moves on. Per-stage run counts, answer ("hit") rate, errors
+and time are kept for /api/vision/health.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional
+
+from .inference import InferenceResult
+
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+# (image bytes, remaining seconds, request context) -> result
+StageFn = Callable[[bytes, float, dict], Awaitable[InferenceResult]]
+
+
+@dataclass
+class Stage:
+    name: str
+    run: StageFn
+    min_conf: float  # answer here at or above this mean confidence
+    applies: Callable[[dict], bool] = lambda ctx: True
+
+    # stats
+    runs: int = 0
+    hits: int = 0
+    errors: int = 0
+    skipped: int = 0
+    total_ms: float = 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "min_conf": self.min_conf,
+            "runs": self.runs,
+            "hits": self.hits,
+            "hit_rate": (self.hits / self.runs) if self.runs else 0.0,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "avg_ms": (self.total_ms / self.runs) if self.runs else 0.0,
+        }
+
+
+@dataclass
+class CascadeOutcome:
+    result: InferenceResult
+    stage: str  # stage that answered
+    confident: bool  # False when the cascade ran out of stages or time
+    trace: List[dict] = field(default_factory=list)
+
+
+class CascadeScheduler:
+    def __init__(self, stages: List[Stage]) -> None:
+        self.stages = stages
+        self.requests = 0
+        self.deadline_exceeded = 0
+
+    async def run(self, img_bytes: bytes, deadline_s: float, **ctx) -> CascadeOutcome:
+        self.requests += 1
+        deadline = time.monotonic() + deadline_s
+        best: Optional[InferenceResult] = None
+        best_stage = ""
+        last_err: Optional[Exception] = None
+        trace: List[dict] = []
+
+        for stage in self.stages:
+            if not stage.applies(ctx):
+                stage.skipped += 1
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                trace.append({"stage": stage.name, "outcome": "deadline"})
+                break
+
+            stage.runs += 1
+            t0 = time.perf_counter()
+            try:
+                res = await asyncio.wait_for(
+                    stage.run(img_bytes, remaining, ctx), remaining
+                )
+            except ValueError:
+                raise  # bad upload: no other stage will do better
+            except Exception as e:
+                last_err = e
+                ms = (time.perf_counter() - t0) * 1000
+                stage.errors += 1
+                stage.total_ms += ms
+                trace.append(
+                    {"stage": stage.name, "ms": round(ms, 1), "outcome": repr(e)}
+                )
+                logger.warning(f"[VISION] cascade stage {stage.name} failed: {e!r}")
+                continue
+
+            ms = (time.perf_counter() - t0) * 1000
+            stage.total_ms += ms
+            confident = res.mean_conf >= stage.min_conf
+            trace.append(
+                {
+                    "stage": stage.name,
+                    "ms": round(ms, 1),
+                    "count": res.count,
+                    "conf": round(res.mean_conf, 3),
+                    "outcome": "answered" if confident else "escalated",
+                }
+            )
+            if confident:
+                stage.hits += 1
+                return CascadeOutcome(res, stage.name, True, trace)
+            if best is None or res.mean_conf > best.mean_conf:
+                best, best_stage = res, stage.name
+
+        out_of_time = time.monotonic() >= deadline
+        self.deadline_exceeded += out_of_time
+        if best is None:
+            if last_err is not None and not out_of_time:
+                raise last_err
+            raise asyncio.TimeoutError("No cascade stage produced a result in time")
+        return CascadeOutcome(best, best_stage, False, trace)
+
+    def snapshot(self) -> dict:
+        return {
+            "requests": self.requests,
+            "deadline_exceeded": self.deadline_exceeded,
+            "stages": {s.name: s.snapshot() for s in self.stages},
+        }
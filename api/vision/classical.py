@@ -0,0 +1,385 @@
+"""
+Classical color-threshold / distance-transform counting (marker split).
+
+Fast first pass (~0.1 s on CPU) for well-staged photos (matte placemat,
+contrasting product color), per notes/better_performance_yolo.txt:
+
+  HSV threshold -> opening -> fill holes -> EDT -> peak markers -> split
+  -> rejoin splits that run along a ridge rather than through a neck
+
+Per-product thresholds live in color_profiles.json. Each result carries a
+confidence score: the share of the mask the instances explain, cut for every
+instance that looks merged or fragmented; callers escalate to the ML model
+below CLASSICAL_MIN_CONF. api/utils/bench_vision_classical.py reports the
+precision of the answers that clear it on synthetic scenes.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Union
+
+import numpy as np
+from PIL import Image
+from scipy import ndimage
+
+from .config import COLOR_PROFILES_PATH, CLASSICAL_MAX_SIDE
+from .inference import InferenceResult, encode_jpeg
+from .preprocess import open_for_model
+
+# Instances this much bigger than the median are probably merged neighbours,
+# this much smaller probably fragments of a part
+_MERGED_RATIO = 1.8
+_FRAGMENT_RATIO = 0.45
+# Area per squared thickness is near constant for one shape: well above the
+# median means two parts joined
+_ELONGATED_RATIO = 1.4
+# Each suspect instance scales the confidence by this (one is enough to escalate)
+_SUSPECT_COST = 0.7
+
+
+@dataclass
+class ColorProfile:
+    name: str
+    hsv_min: tuple  # PIL HSV scale, every channel 0..255
+    hsv_max: tuple
+    fill_holes: bool = True
+    open_radius: int = 2
+    min_area_frac: float = 0.0008  # of image area
+    max_area_frac: float = 0.25
+    peak_min_frac: float = 0.5  # of the smallest expected radius
+    neck_ratio: float = 0.8  # split only where the blob narrows below this
+    description: str = ""
+
+    @classmethod
+    def from_dict(cls, name: str, d: dict) -> "ColorProfile":
+        return cls(
+            name=name,
+            hsv_min=tuple(d["hsv_min"]),
+            hsv_max=tuple(d["hsv_max"]),
+            fill_holes=bool(d.get("fill_holes", True)),
+            open_radius=int(d.get("open_radius", 2)),
+            min_area_frac=float(d.get("min_area_frac", 0.0008)),
+            max_area_frac=float(d.get("max_area_frac", 0.25)),
+            peak_min_frac=float(d.get("peak_min_frac", 0.5)),
+            neck_ratio=float(d.get("neck_ratio", 0.8)),
+            description=d.get("description", ""),
+        )
+
+
+@dataclass
+class ClassicalResult:
+    count: int
+    confidence: float
+    labels: np.ndarray  # (H, W) int32 instance masks, 0 = background
+    boxes: np.ndarray  # (N, 4) xyxy in analysed-image pixels
+    areas: np.ndarray  # (N,) pixels
+
+
+def load_profiles(path: str = COLOR_PROFILES_PATH) -> Dict[str, ColorProfile]:
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    return {name: ColorProfile.from_dict(name, d) for name, d in raw.items()}
+
+
+PROFILES = load_profiles()
+
+
+# ---------------------------------------------------------------------------- #
+def _disk(radius: int) -> np.ndarray:
+    r = max(1, int(radius))
+    yy, xx = np.ogrid[-r : r + 1, -r : r + 1]
+    return (xx * xx + yy * yy) <= r * r
+
+
+def threshold(hsv: np.ndarray, profile: ColorProfile) -> np.ndarray:
+    """Boolean foreground mask; hue ranges may wrap (hsv_min[0] > hsv_max[0])."""
+    lo, hi = profile.hsv_min, profile.hsv_max
+    h, s, v = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    if lo[0] <= hi[0]:
+        mask = (h >= lo[0]) & (h <= hi[0])
+    else:
+        mask = (h >= lo[0]) | (h <= hi[0])
+    mask &= (s >= lo[1]) & (s <= hi[1])
+    mask &= (v >= lo[2]) & (v <= hi[2])
+    return mask
+
+
+def _label_max(values: np.ndarray, labels: np.ndarray, n: int) -> np.ndarray:
+    """Per-label maximum, index 0 = background (ndimage.maximum sorts: slower)."""
+    out = np.zeros(n + 1, dtype=values.dtype)
+    np.maximum.at(out, labels.ravel(), values.ravel())
+    return out
+
+
+def _merge_ridges(labels: np.ndarray, dist: np.ndarray, neck_ratio: float):
+    """Rejoin regions split along a ridge instead of at a neck.
+
+    An elongated part has several distance-transform peaks along its middle;
+    two touching parts narrow where they meet. Neighbouring regions are one
+    part when the thickest point of their shared border is at least
+    `neck_ratio` of the thinner region's own peak.
+    """
+    pairs, saddles = [], []
+    for a, b, da, db in (
+        (labels[:, :-1], labels[:, 1:], dist[:, :-1], dist[:, 1:]),
+        (labels[:-1], labels[1:], dist[:-1], dist[1:]),
+    ):
+        edge = (a != b) & (a > 0) & (b > 0)
+        pairs.append(np.sort(np.stack([a[edge], b[edge]], axis=1), axis=1))
+        saddles.append(np.minimum(da[edge], db[edge]))
+    pairs, saddles = np.concatenate(pairs), np.concatenate(saddles)
+    if pairs.size == 0:
+        return labels
+
+    pairs, inverse = np.unique(pairs, axis=0, return_inverse=True)
+    saddle = np.zeros(len(pairs))
+    np.maximum.at(saddle, inverse.ravel(), saddles)
+    n = int(labels.max())
+    peak = _label_max(dist, labels, n)
+
+    root = np.arange(n + 1)
+
+    def find(i: int) -> int:
+        while root[i] != i:
+            root[i] = root[root[i]]
+            i = root[i]
+        return i
+
+    for (a, b), s in zip(pairs, saddle):
+        if s >= neck_ratio * min(peak[a], peak[b]):
+            root[find(a)] = find(b)
+    return np.array([find(i) for i in range(n + 1)], dtype=labels.dtype)[labels]
+
+
+def _confidence(areas: np.ndarray, peaks: np.ndarray, mask_area: int) -> float:
+    """How much to trust the count: mask coverage, less each suspect instance.
+
+    Parts of one product vary in size (and with perspective), so spread alone
+    costs nothing. An instance is suspect when its area is far from the
+    median (merged neighbours above, fragments below) or when it is much
+    longer for its thickness (area / peak distance^2) than the others: two
+    parts joined end to end or side by side.
+    """
+    if areas.size == 0 or mask_area == 0:
+        return 0.0
+    coverage = areas.sum() / mask_area  # mask pixels explained by kept instances
+    median = np.median(areas)
+    elongation = areas / np.maximum(peaks, 1.0) ** 2
+    suspect = (
+        (areas > _MERGED_RATIO * median)
+        | (areas < _FRAGMENT_RATIO * median)
+        | (elongation > _ELONGATED_RATIO * np.median(elongation))
+    )
+    return float(np.clip(coverage * _SUSPECT_COST ** suspect.sum(), 0.0, 1.0))
+
+
+def count_instances(img: Image.Image, profile: ColorProfile) -> ClassicalResult:
+    hsv = np.asarray(img.convert("HSV"))
+    mask = threshold(hsv, profile)
+    if profile.open_radius:
+        mask = ndimage.binary_opening(mask, structure=_disk(profile.open_radius))
+    if profile.fill_holes:
+        mask = ndimage.binary_fill_holes(mask)
+
+    empty = ClassicalResult(
+        count=0,
+        confidence=0.0,
+        labels=np.zeros(mask.shape, dtype=np.int32),
+        boxes=np.zeros((0, 4), dtype=np.float32),
+        areas=np.zeros(0, dtype=np.int64),
+    )
+    mask_area = int(mask.sum())
+    if mask_area == 0:
+        return empty
+
+    # Markers: distance-transform peaks at least half a part radius apart
+    dist = ndimage.distance_transform_edt(mask)
+    r_min = math.sqrt(profile.min_area_frac * mask.size / math.pi)
+    min_peak = max(1.0, r_min * profile.peak_min_frac)
+    window = max(3, int(2 * min_peak) | 1)
+    peaks = (dist == ndimage.maximum_filter(dist, size=window)) & (dist >= min_peak)
+    markers, n = ndimage.label(peaks)
+    components, n_comp = ndimage.label(mask)
+
+    # Split touching parts: each mask pixel joins its nearest marker, as long
+    # as that marker sits in the same connected blob (a nearest-marker
+    # partition; ndimage.watershed_ift leaks across the plateau at the neck).
+    # Blobs without a marker, or pixels whose nearest marker is across the
+    # background, keep a label of their own after the marker ids.
+    labels = components + n
+    if n:
+        _, (iy, ix) = ndimage.distance_transform_edt(markers == 0, return_indices=True)
+        nearest = markers[iy, ix]
+        same_blob = components[iy, ix] == components
+        labels = np.where(same_blob, nearest, labels)
+    labels[~mask] = 0
+    labels = _merge_ridges(labels, dist, profile.neck_ratio)
+    used = np.union1d([0], labels)
+    labels = np.searchsorted(used, labels).astype(np.int32)  # 1..K, 0 stays 0
+    n = used.size - 1
+
+    # Drop dust / table-sized blobs, then relabel 1..N
+    areas = np.bincount(labels.ravel(), minlength=n + 1)[1:]
+    keep = (areas >= profile.min_area_frac * mask.size) & (
+        areas <= profile.max_area_frac * mask.size
+    )
+    lut = np.zeros(n + 1, dtype=np.int32)
+    lut[1:][keep] = np.arange(1, int(keep.sum()) + 1, dtype=np.int32)
+    labels = lut[labels]
+    areas = areas[keep]
+    if areas.size == 0:
+        return empty
+
+    boxes = np.array(
+        [
+            [sl[1].start, sl[0].start, sl[1].stop - 1, sl[0].stop - 1]
+            for sl in ndimage.find_objects(labels)
+        ],
+        dtype=np.float32,
+    )
+    return ClassicalResult(
+        count=int(areas.size),
+        confidence=_confidence(
+            areas,
+            _label_max(dist, labels, areas.size)[1:],
+            mask_area,
+        ),
+        labels=labels,
+        boxes=boxes,
+        areas=areas,
+    )
+
+
+# ---------------------------------------------------------------------------- #
+# 8-neighbourhood, clockwise (image y down) from west, as (dy, dx)
+_RING = ((0, -1), (-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1))
+_RING_INDEX = {d: i for i, d in enumerate(_RING)}
+
+
+def _trace(mask: np.ndarray) -> np.ndarray:
+    """
+    Outer boundary of the blob holding the first (top-left) pixel of a mask
+    with a background border, in order: Moore-neighbour tracing. (x, y) rows.
+    """
+    ys, xs = np.nonzero(mask)
+    start = (int(ys[0]), int(xs[0]))  # its west neighbour is background
+    points = [start]
+    cur, back = start, 0  # back: direction of the last background neighbour
+    second = None
+    for _ in range(4 * mask.size):  # bound; a boundary visits a pixel <= 4 times
+        for k in range(8):
+            d = (back + k) % 8
+            nxt = (cur[0] + _RING[d][0], cur[1] + _RING[d][1])
+            if mask[nxt]:
+                break
+        else:
+            break  # a single pixel
+        bd = _RING[(d - 1) % 8]  # background checked just before nxt
+        back = _RING_INDEX[(cur[0] + bd[0] - nxt[0], cur[1] + bd[1] - nxt[1])]
+        if cur == start and nxt == second:
+            break  # back where the walk began (Jacob's stopping criterion)
+        if second is None:
+            second = nxt
+        cur = nxt
+        points.append(cur)
+    pts = np.array(points[:-1] if len(points) > 1 else points, dtype=np.float32)
+    return pts[:, ::-1]
+
+
+def _simplify(pts: np.ndarray, tolerance: float) -> np.ndarray:
+    """Douglas-Peucker on a closed outline (iterative)."""
+    if len(pts) < 4:
+        return pts
+    closed = np.vstack([pts, pts[:1]])
+    keep = np.zeros(len(closed), dtype=bool)
+    keep[0] = keep[-1] = True
+    far = int(np.argmax(((closed - closed[0]) ** 2).sum(axis=1)))
+    keep[far] = True  # split there: the first and last point coincide
+    stack = [(0, far), (far, len(closed) - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j <= i + 1:
+            continue
+        a, seg = closed[i], closed[j] - closed[i]
+        rel = closed[i + 1 : j] - a
+        norm = float(np.hypot(*seg))
+        if norm:
+            dist = np.abs(rel[:, 0] * seg[1] - rel[:, 1] * seg[0]) / norm
+        else:
+            dist = np.hypot(rel[:, 0], rel[:, 1])
+        k = int(np.argmax(dist))
+        if dist[k] > tolerance:
+            keep[i + 1 + k] = True
+            stack += [(i, i + 1 + k), (i + 1 + k, j)]
+    return closed[keep][:-1]
+
+
+def instance_polygons(res: ClassicalResult, tolerance: float = 1.0) -> List[list]:
+    """One outline polygon per instance, in analysed-image pixels (x, y)."""
+    polygons = []
+    for i, sl in enumerate(ndimage.find_objects(res.labels), start=1):
+        crop = np.pad(res.labels[sl] == i, 1)  # background border for the walk
+        outline = _simplify(_trace(crop), tolerance)
+        polygons.append(outline + [sl[1].start - 1, sl[0].start - 1])
+    return polygons
+
+
+def render_instances(img: Image.Image, res: ClassicalResult) -> Image.Image:
+    """Tint each instance mask with its own color (vectorised palette lookup)."""
+    rng = np.random.default_rng(7)
+    palette = rng.integers(60, 255, size=(res.count + 1, 3), dtype=np.uint8)
+    rgb = np.asarray(img.convert("RGB")).copy()
+    fg = res.labels > 0
+    rgb[fg] = (rgb[fg] // 2) + (palette[res.labels[fg]] // 2)
+    return Image.fromarray(rgb)
+
+
+def run_classical_batch(
+    images: List[bytes], product: str, render: bool = True
+) -> List[Union[InferenceResult, Exception]]:
+    """
+    Worker-pool job: classical count, one outline polygon per instance in
+    `masks` (the GroundedSAM format), and the annotated JPEG when `render`.
+    """
+    profile = PROFILES.get(product)
+    if profile is None:
+        return [ValueError(f"Unknown product profile '{product}'")] * len(images)
+
+    results: List[Union[InferenceResult, Exception]] = []
+    for b in images:
+        cpu0, t0 = time.process_time(), time.perf_counter()
+        try:
+            img, source_size = open_for_model(b, CLASSICAL_MAX_SIDE)
+        except Exception as e:
+            results.append(ValueError(f"Could not decode image: {e}"))
+            continue
+        img.thumbnail((CLASSICAL_MAX_SIDE, CLASSICAL_MAX_SIDE))
+        res = count_instances(img, profile)
+        polygons = instance_polygons(res)
+        t1 = time.perf_counter()
+
+        jpeg = encode_jpeg(render_instances(img, res)) if render else b""
+        sx, sy = source_size[0] / img.width, source_size[1] / img.height
+        results.append(
+            InferenceResult(
+                jpeg=jpeg,
+                count=res.count,
+                mean_conf=res.confidence,
+                image_size=source_size,
+                timings_ms={
+                    "count": (t1 - t0) * 1000,
+                    "encode": (time.perf_counter() - t1) * 1000,
+                    "cpu": (time.process_time() - cpu0) * 1000,
+                },
+                boxes=(res.boxes * [sx, sy, sx, sy]).round(1).tolist(),
+                scores=[round(res.confidence, 3)] * res.count,
+                masks=[(p * [sx, sy]).round(1).tolist() for p in polygons],
+                model_version=f"classical:{profile.name}",
+                engine="classical",
+            )
+        )
+    return results
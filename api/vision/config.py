@@ -0,0 +1,84 @@
+import os
+from pathlib import Path
+
+# Square model input (YOLO-style letterbox target)
+MODEL_INPUT_SIZE = int(os.getenv("VISION_INPUT_SIZE", 640))
+
+# Dynamic micro-batching: group concurrent requests into one forward pass
+BATCHING_ENABLED = os.getenv("VISION_BATCHING", "1") == "1"
+MAX_BATCH_SIZE = int(os.getenv("VISION_MAX_BATCH", 8))
+BATCH_DEADLINE_MS = float(os.getenv("VISION_BATCH_DEADLINE_MS", 20))
+
+# Annotated image encoding (one encode, fast settings; see inference.encode_jpeg)
+JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", 85))
+JPEG_SUBSAMPLING = int(os.getenv("VISION_JPEG_SUBSAMPLING", 2))  # 2 = 4:2:0
+
+# Vision worker processes (0 = run in-process on a thread)
+VISION_WORKERS = int(os.getenv("VISION_WORKERS", 1))
+# In-flight request cap per API worker before answering 503
+VISION_MAX_PENDING = int(os.getenv("VISION_MAX_PENDING", 32))
+VISION_RETRY_AFTER_S = int(os.getenv("VISION_RETRY_AFTER_S", 2))
+
+# Content-addressed result cache (memory LRU + optional disk tier)
+CACHE_ENABLED = os.getenv("VISION_CACHE", "1") == "1"
+CACHE_MAX_ENTRIES = int(os.getenv("VISION_CACHE_ENTRIES", 256))
+CACHE_MAX_MB = float(os.getenv("VISION_CACHE_MAX_MB", 128))
+CACHE_DIR = os.getenv("VISION_CACHE_DIR", "").strip()  # empty = no disk tier
+CACHE_DISK_MAX_MB = float(os.getenv("VISION_CACHE_DISK_MB", 1024))
+
+# Classical color-threshold / distance-transform first pass
+COLOR_PROFILES_PATH = os.getenv(
+    "VISION_COLOR_PROFILES",
+    str(Path(__file__).resolve().parent / "color_profiles.json"),
+)
+CLASSICAL_MAX_SIDE = int(os.getenv("VISION_CLASSICAL_MAX_SIDE", 800))
+# results at or above this confidence skip the ML model
+CLASSICAL_MIN_CONF = float(os.getenv("VISION_CLASSICAL_MIN_CONF", 0.8))
+
+# Tiled inference for high-resolution photos of small parts
+TILE_SIZE = int(os.getenv("VISION_TILE_SIZE", 640))  # decoded px per tile side
+TILE_OVERLAP = float(os.getenv("VISION_TILE_OVERLAP", 0.2))  # fraction of a tile
+TILE_MAX = int(os.getenv("VISION_TILE_MAX", 16))  # image is downscaled to fit
+TILE_NMS_IOU = float(os.getenv("VISION_TILE_NMS_IOU", 0.5))
+
+# GroundedSAM segmentation service (async client, see grounded_sam.py)
+GROUNDED_SAM_URL = os.getenv("GROUNDED_SAM_URL", "http://groundedsam:9000/infer")
+GROUNDED_SAM_TIMEOUT_S = float(os.getenv("GROUNDED_SAM_TIMEOUT_S", 30))
+# concurrent requests the service can actually run (GPU slots); more wait here
+GROUNDED_SAM_MAX_CONCURRENCY = int(os.getenv("GROUNDED_SAM_MAX_CONCURRENCY", 2))
+GROUNDED_SAM_BREAKER_FAILURES = int(os.getenv("GROUNDED_SAM_BREAKER_FAILURES", 5))
+GROUNDED_SAM_BREAKER_RESET_S = float(os.getenv("GROUNDED_SAM_BREAKER_RESET_S", 30))
+
+# /count cascade: classical -> detector -> GroundedSAM, cheapest first
+CASCADE_DEADLINE_MS = float(os.getenv("VISION_CASCADE_DEADLINE_MS", 15000))
+CASCADE_YOLO_MIN_CONF = float(os.getenv("VISION_CASCADE_YOLO_MIN_CONF", 0.6))
+
+# Low-confidence "to-label" capture queue (Label Studio export)
+LABEL_QUEUE_ENABLED = os.getenv("VISION_LABEL_QUEUE", "1") == "1"
+LABEL_QUEUE_DIR = os.getenv(
+    "VISION_LABEL_QUEUE_DIR",
+    str(Path(__file__).resolve().parent.parent.parent / "label_queue"),
+)
+LABEL_QUEUE_MAX_CONF = float(os.getenv("VISION_LABEL_QUEUE_MAX_CONF", 0.5))
+LABEL_QUEUE_SAMPLE_RATE = float(os.getenv("VISION_LABEL_QUEUE_SAMPLE", 1.0))
+LABEL_QUEUE_MAX_MB = float(os.getenv("VISION_LABEL_QUEUE_MAX_MB", 2048))
+
+# Model registry: newest *.onnx in VISION_MODELS_DIR is served, hot-swapped
+MODELS_DIR = os.getenv(
+    "VISION_MODELS_DIR",
+    str(Path(__file__).resolve().parent.parent.parent / "models"),
+)
+MODEL_PIN = os.getenv("VISION_MODEL", "").strip()  # file stem; empty = newest
+MODEL_POLL_S = float(os.getenv("VISION_MODEL_POLL_S", 10))
+MODEL_CONF_THRESH = float(os.getenv("VISION_MODEL_CONF", 0.25))
+MODEL_NMS_IOU = float(os.getenv("VISION_MODEL_NMS_IOU", 0.45))
+MODEL_THREADS = int(os.getenv("VISION_MODEL_THREADS", 0))  # 0 = runtime default
+
+# CPU model variants (<version>.int8_dynamic.onnx / <version>.int8_static.onnx,
+# built by api/utils/quantize_vision_model.py) and the per-machine auto-tuner
+MODEL_VARIANT = os.getenv("VISION_MODEL_VARIANT", "auto")  # auto|fp32|int8_*
+AUTOTUNE_ENABLED = os.getenv("VISION_AUTOTUNE", "1") == "1"
+AUTOTUNE_DIR = os.getenv("VISION_AUTOTUNE_DIR", str(Path(MODELS_DIR) / "tuning"))
+AUTOTUNE_BUDGET_S = float(os.getenv("VISION_AUTOTUNE_BUDGET_S", 120))
+# a quantized variant must agree this well with fp32 (box F1) to be served
+AUTOTUNE_MIN_AGREEMENT = float(os.getenv("VISION_AUTOTUNE_MIN_AGREEMENT", 0.9))
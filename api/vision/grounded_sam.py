@@ -0,0 +1,184 @@
+"""
+Async client for the GroundedSAM segmentation service.
+
+- One pooled httpx.AsyncClient per API worker (keep-alive, no per-call setup).
+- A semaphore caps in-flight calls at the service's real capacity
+  (GROUNDED_SAM_MAX_CONCURRENCY); extra requests wait here instead of piling
+  up on the GPU box.
+- Every call has a deadline covering both the wait for a slot and the HTTP
+  call; the remaining budget is forwarded as `X-Deadline-Ms`.
+- A circuit breaker fails fast once the service keeps erroring or timing out.
+
+/infer contract (also served by api/utils/groundedsam_standin.py):
+
+    POST multipart: image=<file>, prompt=<text>
+    200 {"boxes": [[x1, y1, x2, y2], ...],   # decoded-image pixels
+         "scores": [...], "labels": [...],
+         "masks": [[[x, y], ...], ...] | null,  # one polygon per instance
+         "model": "<version>"}
+"""
+
+from __future__ import annotations
+
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import httpx
+
+from ..circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+
+class GroundedSamError(Exception):
+    """The service answered with an error or could not be reached."""
+
+
+@dataclass
+class Segmentation:
+    boxes: List[list]
+    scores: List[float]
+    labels: List[str] = field(default_factory=list)
+    masks: Optional[List[list]] = None
+    model: str = ""
+
+
+class GroundedSamClient:
+    def __init__(
+        self,
+        url: str,
+        *,
+        timeout_s: float = 30.0,
+        max_concurrency: int = 2,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        self.url = url
+        self.timeout_s = timeout_s
+        self.max_concurrency = max(1, max_concurrency)
+        self.breaker = breaker or CircuitBreaker("groundedsam")
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+        self._in_flight = 0
+        self._waiting = 0
+        self.calls = 0
+        self.errors = 0
+        self.deadline_exceeded = 0
+        self._latency_total = 0.0
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout_s),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+            )
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._slots = None
+
+    async def infer(
+        self, img_bytes: bytes, prompt: str, deadline_s: Optional[float] = None
+    ) -> Segmentation:
+        """
+        Segment one image. Raises CircuitOpen (fail fast), TimeoutError
+        (deadline passed) or GroundedSamError.
+        """
+        budget = min(deadline_s or self.timeout_s, self.timeout_s)
+        deadline = time.monotonic() + budget
+        client = self._http()
+
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), budget)
+        except asyncio.TimeoutError:
+            self.deadline_exceeded += 1
+            raise
+        finally:
+            self._waiting -= 1
+
+        ticket = None
+        try:
+            ticket = self.breaker.before_call()
+            self._in_flight += 1
+            self.calls += 1
+            remaining = max(0.001, deadline - time.monotonic())
+            t0 = time.perf_counter()
+            try:
+                resp = await asyncio.wait_for(
+                    client.post(
+                        self.url,
+                        files={"image": ("img.jpg", img_bytes, "image/jpeg")},
+                        data={"prompt": prompt},
+                        headers={"X-Deadline-Ms": str(int(remaining * 1000))},
+                    ),
+                    remaining,
+                )
+            except asyncio.TimeoutError:
+                self.deadline_exceeded += 1
+                self.breaker.record_failure()
+                raise
+            except httpx.HTTPError as e:
+                self.errors += 1
+                self.breaker.record_failure()
+                raise GroundedSamError(f"GroundedSAM unreachable: {e!r}") from e
+            finally:
+                self._in_flight -= 1
+                self._latency_total += time.perf_counter() - t0
+
+            if resp.status_code >= 500:
+                self.errors += 1
+                self.breaker.record_failure()
+                raise GroundedSamError(f"GroundedSAM returned {resp.status_code}")
+            self.breaker.record_success()  # a 4xx still means the service is up
+            if resp.status_code != 200:
+                self.errors += 1
+                raise GroundedSamError(
+                    f"GroundedSAM rejected the request ({resp.status_code}): "
+                    f"{resp.text[:200]}"
+                )
+            try:
+                body = resp.json()
+            except ValueError as e:  # not a bad upload: the service misbehaved
+                self.errors += 1
+                raise GroundedSamError(f"GroundedSAM sent invalid JSON: {e}") from e
+            if not isinstance(body, dict):
+                self.errors += 1
+                raise GroundedSamError("GroundedSAM sent an unexpected response")
+        finally:
+            self.breaker.release(ticket)  # cancelled: give back a trial slot
+            self._slots.release()
+
+        return Segmentation(
+            boxes=body.get("boxes") or [],
+            scores=body.get("scores") or [],
+            labels=body.get("labels") or [],
+            masks=body.get("masks"),
+            model=body.get("model", ""),
+        )
+
+    def snapshot(self) -> dict:
+        return {
+            "url": self.url,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "calls": self.calls,
+            "errors": self.errors,
+            "deadline_exceeded": self.deadline_exceeded,
+            "avg_latency_ms": (
+                self._latency_total * 1000 / self.calls if self.calls else 0.0
+            ),
+            "breaker": self.breaker.snapshot(),
+        }
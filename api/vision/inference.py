@@ -0,0 +1,320 @@
+"""
+Batched detector inference.
+
+- Images are letterboxed straight into one preallocated (B, S, S, 3) array
+  (see preprocess.py) and run as a single forward pass. Geometry-only images
+  are draft-decoded; an image to draw on is decoded at full resolution, so
+  the annotated JPEG keeps the upload's size.
+- Boxes come back in model-input pixels and are mapped back onto the decoded
+  image before drawing.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import List, Optional, Union
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from .config import JPEG_QUALITY, JPEG_SUBSAMPLING, MAX_BATCH_SIZE, MODEL_THREADS
+from .preprocess import decode_into, open_for_model, letterbox_into, new_batch
+
+
+@dataclass
+class Detections:
+    boxes: np.ndarray  # (N, 4) xyxy
+    scores: np.ndarray  # (N,)
+
+    @property
+    def count(self) -> int:
+        return int(self.scores.shape[0])
+
+    @property
+    def mean_conf(self) -> float:
+        return float(self.scores.mean()) if self.scores.size else 0.0
+
+
+@dataclass
+class InferenceResult:
+    jpeg: bytes
+    count: int
+    mean_conf: float
+    image_size: tuple
+    timings_ms: dict = field(default_factory=dict)
+    boxes: list = field(default_factory=list)  # xyxy in full-resolution pixels
+    scores: list = field(default_factory=list)
+    masks: Optional[list] = None  # polygons, when the model segments
+    model_version: str = ""
+    engine: str = ""  # which pipeline answered (classical / yolo / dino_sam)
+    cached: bool = False
+
+
+def encode_jpeg(img: Image.Image) -> bytes:
+    """
+    Single JPEG encode of a rendered image, fast settings: baseline, no
+    Huffman optimisation pass, chroma subsampled (VISION_JPEG_SUBSAMPLING).
+    """
+    buf = BytesIO()
+    img.save(
+        buf,
+        "JPEG",
+        quality=JPEG_QUALITY,
+        subsampling=JPEG_SUBSAMPLING,
+        optimize=False,
+        progressive=False,
+    )
+    return buf.getvalue()
+
+
+def _flags(render: Union[bool, List[bool]], n: int) -> List[bool]:
+    """Per-image render flags from one flag or a list (batched requests)."""
+    return [render] * n if isinstance(render, bool) else list(render)
+
+
+def draw_boxes(img: Image.Image, boxes: np.ndarray) -> Image.Image:
+    """Draw bounding boxes on image"""
+    draw = ImageDraw.Draw(img)
+    for xyxy in boxes.tolist():  # [x1,y1,x2,y2]
+        draw.rectangle(xyxy, outline="red", width=4)
+    return img
+
+
+# ---------------------------------------------------------------------------- #
+class PlaceholderDetector:
+    """Served when no ONNX model is available (see registry.py)."""
+
+    version = "placeholder"
+
+    def forward(self, batch: np.ndarray) -> List[Detections]:
+        # Placeholder results: one detection covering the frame per image
+        size = batch.shape[1]
+        return [
+            Detections(
+                boxes=np.array([[0, 0, size - 1, size - 1]], dtype=np.float32),
+                scores=np.array([0.75], dtype=np.float32),
+            )
+            for _ in range(batch.shape[0])
+        ]
+
+
+# One model per process: vision worker processes each load their own copy
+_DETECTOR = None
+_WARMUP_MS = 0.0
+
+
+def detector_version() -> str:
+    return get_detector().version
+
+
+def get_detector():
+    global _DETECTOR
+    if _DETECTOR is None:
+        _DETECTOR = PlaceholderDetector()
+    return _DETECTOR
+
+
+def load_detector(model_path: Optional[str] = None, options: Optional[dict] = None):
+    """
+    ONNX detector for `model_path`, or the placeholder when there is none.
+    `options` are session settings (threads, execution mode; see autotune.py).
+    """
+    if not model_path:
+        return PlaceholderDetector()
+    from .onnx_detector import OnnxDetector  # onnxruntime is optional
+
+    return OnnxDetector(
+        model_path, **(options or {"intra_op_threads": MODEL_THREADS or None})
+    )
+
+
+def set_detector(detector) -> None:
+    """Swap this process's model; calls already running keep the old one."""
+    global _DETECTOR
+    _DETECTOR = detector
+
+
+def init_worker(model_path: Optional[str] = None, options: Optional[dict] = None):
+    """Process-pool initializer: load this process's model before first use."""
+    set_detector(load_detector(model_path, options))
+
+
+def warm_up(batch_sizes=(1, MAX_BATCH_SIZE)) -> dict:
+    """
+    Run synthetic batches through this process's model so the first real
+    request does not pay for lazy allocations, then report model_info().
+    """
+    global _WARMUP_MS
+    detector = get_detector()
+    rng = np.random.default_rng(0)
+    t0 = time.perf_counter()
+    for n in sorted(set(batch_sizes)):
+        detector.forward(rng.integers(0, 255, new_batch(n).shape, dtype=np.uint8))
+    _WARMUP_MS = (time.perf_counter() - t0) * 1000
+    return model_info()
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource  # peak RSS where /proc is unavailable (KiB on Linux, B on macOS)
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def model_info() -> dict:
+    detector = get_detector()
+    return {
+        "pid": os.getpid(),
+        "version": detector.version,
+        "variant": getattr(detector, "variant", None),
+        "options": getattr(detector, "options", None),
+        "path": getattr(detector, "path", None),
+        "load_ms": round(getattr(detector, "load_ms", 0.0), 1),
+        "warmup_ms": round(_WARMUP_MS, 1),
+        "file_mb": round(getattr(detector, "file_bytes", 0) / (1024 * 1024), 1),
+        "rss_mb": round(_rss_mb(), 1),
+    }
+
+
+def forward_batch(batch: np.ndarray, detector=None) -> List[Detections]:
+    """
+    One forward pass over a (B, S, S, 3) uint8 batch.
+    Returns one Detections per image, boxes in model-input pixels.
+    """
+    return (detector or get_detector()).forward(batch)
+
+
+def _decode(img_bytes: bytes, pixels: bool = True):
+    """RGB image, or with `pixels` False just the parsed header (size only)."""
+    try:
+        img = Image.open(BytesIO(img_bytes))
+        return img.convert("RGB") if pixels else img
+    except Exception as e:
+        return ValueError(f"Could not decode image: {e}")
+
+
+def _decode_for_model(img_bytes: bytes, slot: np.ndarray, full: bool):
+    """(image to draw on or None, Letterbox) with `slot` filled, or the error."""
+    try:
+        if not full:
+            return None, decode_into(img_bytes, slot)
+        img, source_size = open_for_model(img_bytes, full=True)
+        return img, letterbox_into(img, slot, source_size)
+    except Exception as e:
+        return ValueError(f"Could not decode image: {e}")
+
+
+def run_yolo_batch(
+    images: List[bytes], render: Union[bool, List[bool]] = True
+) -> List[Union[InferenceResult, Exception]]:
+    """
+    Decode, batch, infer, annotate and JPEG-encode a list of uploads.
+    Images with `render` False skip drawing and encoding (geometry only).
+    Undecodable images get an exception in their slot instead of failing the
+    whole batch. Blocking; call from a worker thread, never on the event loop.
+    """
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    batch = new_batch(len(images))
+    decoded, n = [], 0
+    for b, draw in zip(images, _flags(render, len(images))):
+        decoded.append(_decode_for_model(b, batch[n], draw))
+        n += not isinstance(decoded[-1], Exception)  # failures leave no slot
+    if not n:
+        return decoded
+    t1 = time.perf_counter()
+
+    detector = get_detector()  # keep one model for the batch across a hot swap
+    dets = iter(forward_batch(batch[:n], detector))
+    t2 = time.perf_counter()
+
+    results: List[Union[InferenceResult, Exception]] = []
+    for d in decoded:
+        if isinstance(d, Exception):
+            results.append(d)
+            continue
+        img, lb = d
+        det = next(dets)
+        jpeg = b""
+        if img is not None:
+            jpeg = encode_jpeg(draw_boxes(img, lb.to_image(det.boxes)))
+        results.append(
+            InferenceResult(
+                jpeg=jpeg,
+                count=det.count,
+                mean_conf=det.mean_conf,
+                image_size=lb.source_size,
+                boxes=lb.to_source(det.boxes).round(1).tolist(),
+                scores=det.scores.round(3).tolist(),
+                model_version=detector.version,
+                engine="yolo",
+            )
+        )
+    t3 = time.perf_counter()
+
+    timings = {
+        "decode": (t1 - t0) * 1000,
+        "forward": (t2 - t1) * 1000,
+        "encode": (t3 - t2) * 1000,
+        # a worker process runs one job at a time, so its CPU time is this batch's
+        "cpu": (time.process_time() - cpu0) * 1000 / n,
+    }
+    for r in results:
+        if isinstance(r, InferenceResult):
+            r.timings_ms = dict(timings)
+    return results
+
+
+def run_annotate_batch(
+    images: List[bytes],
+    boxes: Optional[list] = None,
+    scores: Optional[list] = None,
+    masks: Optional[list] = None,
+    model_version: str = "",
+    render: bool = True,
+) -> List[Union[InferenceResult, Exception]]:
+    """
+    Draw detections a remote model returned (GroundedSAM) onto each upload
+    and JPEG-encode it. The same boxes / polygons are drawn on every image;
+    callers send one image per call. Without `render` only the header is read.
+    """
+    cpu0 = time.process_time()
+    boxes = boxes or []
+    scores = scores or []
+    results: List[Union[InferenceResult, Exception]] = []
+    for img in (_decode(b, pixels=render) for b in images):
+        if isinstance(img, Exception):
+            results.append(img)
+            continue
+        if render:
+            draw = ImageDraw.Draw(img)
+            for poly in masks or []:
+                if len(poly) >= 3:
+                    draw.polygon([tuple(pt) for pt in poly], outline="lime", width=3)
+            if boxes:
+                draw_boxes(img, np.asarray(boxes, dtype=np.float32).reshape(-1, 4))
+        results.append(
+            InferenceResult(
+                jpeg=encode_jpeg(img) if render else b"",
+                count=len(boxes),
+                mean_conf=float(np.mean(scores)) if scores else 0.0,
+                image_size=img.size,
+                boxes=boxes,
+                scores=scores,
+                masks=masks,
+                model_version=model_version,
+                engine="dino_sam",
+                timings_ms={"cpu": (time.process_time() - cpu0) * 1000},
+            )
+        )
+    return results
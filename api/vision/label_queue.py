@@ -0,0 +1,258 @@
+"""
+Low-confidence capture queue ("to-label" queue, see TODO.txt).
+
+Frames the models were unsure about are kept for human labelling:
+
+    <dir>/images/<sha256>.jpg   content-addressed upload (deduplicated)
+    <dir>/index.jsonl           one line per capture: predictions + metadata
+
+- `offer()` never blocks the response: it filters (confidence, sampling) and
+  drops the capture onto a bounded in-memory queue; a background task writes
+  it from a thread. When the queue is full or the directory is over its size
+  cap, captures are dropped and counted.
+- index.jsonl is append-only; each line goes out in a single O_APPEND write,
+  so all uvicorn workers can share the directory.
+- `iter_label_studio()` turns the index into Label Studio tasks with the
+  model output as pre-annotations (rectanglelabels, percent coordinates).
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from io import BytesIO
+from pathlib import Path
+from typing import Iterator, Optional
+
+from PIL import Image
+
+from .inference import InferenceResult, encode_jpeg
+
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+_JPEG_MAGIC = b"\xff\xd8\xff"
+
+
+class LabelQueue:
+    def __init__(
+        self,
+        root: str,
+        *,
+        enabled: bool = True,
+        max_conf: float = 0.5,
+        sample_rate: float = 1.0,
+        max_bytes: int = 2 * 1024 * 1024 * 1024,
+        max_pending: int = 64,
+    ) -> None:
+        self.enabled = enabled
+        self.root = Path(root)
+        self.images_dir = self.root / "images"
+        self.index_path = self.root / "index.jsonl"
+        self.max_conf = max_conf
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.max_pending = max(1, max_pending)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._bytes: Optional[int] = None  # lazily measured
+
+        self.captured = 0
+        self.skipped = 0
+        self.dropped = 0
+
+    # --- producer side (request path) ---
+    def wants(self, res: InferenceResult, confident: bool = True) -> bool:
+        if not self.enabled or res.cached:
+            return False
+        if confident and res.mean_conf >= self.max_conf:
+            return False
+        return random.random() < self.sample_rate
+
+    def offer(
+        self,
+        img_bytes: bytes,
+        res: InferenceResult,
+        *,
+        confident: bool = True,
+        **meta,
+    ) -> None:
+        """Queue a capture if it qualifies; O(1), never awaits."""
+        if not self.wants(res, confident):
+            self.skipped += 1
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((img_bytes, res, meta, time.time()))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def _ensure_started(self) -> None:
+        if self._writer is None or self._writer.done():
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._writer = asyncio.create_task(self._drain())
+
+    async def stop(self) -> None:
+        """Flush what is queued, then stop the writer."""
+        if self._writer is None:
+            return
+        await self._queue.join()
+        self._writer.cancel()
+        try:
+            await self._writer
+        except asyncio.CancelledError:
+            pass
+        self._writer = None
+
+    async def _drain(self) -> None:
+        while True:
+            item = await self._queue.get()
+            try:
+                await asyncio.to_thread(self._write, *item)
+            except Exception as e:
+                logger.warning(f"[VISION] label queue write failed: {e!r}")
+            finally:
+                self._queue.task_done()
+
+    # --- writer side (thread) ---
+    def _size(self) -> int:
+        if self._bytes is None:
+            total = 0
+            if self.root.exists():
+                for p in self.root.rglob("*"):
+                    try:
+                        total += p.stat().st_size if p.is_file() else 0
+                    except OSError:
+                        pass
+            self._bytes = total
+        return self._bytes
+
+    def _write(self, img_bytes: bytes, res: InferenceResult, meta: dict, ts: float):
+        if self._size() >= self.max_bytes:
+            self.dropped += 1
+            return
+        if not img_bytes.startswith(_JPEG_MAGIC):
+            img_bytes = encode_jpeg(Image.open(BytesIO(img_bytes)).convert("RGB"))
+
+        sha = hashlib.sha256(img_bytes).hexdigest()
+        self.images_dir.mkdir(parents=True, exist_ok=True)
+        img_path = self.images_dir / f"{sha}.jpg"
+        added = 0
+        if not img_path.exists():
+            tmp = img_path.with_suffix(".tmp")
+            tmp.write_bytes(img_bytes)
+            os.replace(tmp, img_path)
+            added += len(img_bytes)
+
+        record = {
+            "id": sha,
+            "ts": round(ts, 3),
+            "engine": res.engine,
+            "model_version": res.model_version,
+            "count": res.count,
+            "mean_conf": round(res.mean_conf, 4),
+            "image_size": list(res.image_size),
+            "boxes": res.boxes,
+            "scores": res.scores,
+            **meta,
+        }
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+        fd = os.open(self.index_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+        self._bytes += added + len(line)
+        self.captured += 1
+
+    # --- export ---
+    def image_path(self, sha: str) -> Optional[Path]:
+        if len(sha) != 64 or not all(c in "0123456789abcdef" for c in sha):
+            return None
+        p = self.images_dir / f"{sha}.jpg"
+        return p if p.is_file() else None
+
+    def iter_records(self, since: float = 0.0) -> Iterator[dict]:
+        try:
+            f = open(self.index_path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # torn last line while another worker appends
+                if rec.get("ts", 0) >= since:
+                    yield rec
+
+    def iter_label_studio(
+        self, image_url: str, since: float = 0.0, label: str = "object"
+    ) -> Iterator[dict]:
+        """
+        Label Studio tasks, one per capture. `image_url` is a template whose
+        `{id}` is replaced by the capture id (other braces are left as they
+        are), e.g. "/data/local-files/?d=label_queue/images/{id}.jpg".
+        """
+        for rec in self.iter_records(since):
+            w, h = (rec.get("image_size") or [0, 0])[:2]
+            results = []
+            for i, (box, score) in enumerate(
+                zip(rec.get("boxes") or [], rec.get("scores") or [])
+            ):
+                if not w or not h:
+                    break
+                x1, y1, x2, y2 = box
+                results.append(
+                    {
+                        "id": f"{rec['id'][:8]}_{i}",
+                        "from_name": "label",
+                        "to_name": "image",
+                        "type": "rectanglelabels",
+                        "original_width": w,
+                        "original_height": h,
+                        "score": score,
+                        "value": {
+                            "x": 100.0 * x1 / w,
+                            "y": 100.0 * y1 / h,
+                            "width": 100.0 * (x2 - x1) / w,
+                            "height": 100.0 * (y2 - y1) / h,
+                            "rotation": 0,
+                            "rectanglelabels": [label],
+                        },
+                    }
+                )
+            yield {
+                "data": {
+                    "image": image_url.replace("{id}", rec["id"]),
+                    "capture": {
+                        k: rec.get(k)
+                        for k in ("ts", "engine", "count", "mean_conf", "endpoint")
+                    },
+                },
+                "predictions": [
+                    {
+                        "model_version": rec.get("model_version") or "",
+                        "score": rec.get("mean_conf", 0.0),
+                        "result": results,
+                    }
+                ],
+            }
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "dir": str(self.root),
+            "max_conf": self.max_conf,
+            "sample_rate": self.sample_rate,
+            "pending": self._queue.qsize() if self._queue else 0,
+            "captured": self.captured,
+            "skipped": self.skipped,
+            "dropped": self.dropped,
+            "bytes": self._bytes,
+        }
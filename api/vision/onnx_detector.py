@@ -0,0 +1,147 @@
+"""
+ONNX Runtime detector for YOLO-style exports.
+
+- Input: the (B, S, S, 3) uint8 letterboxed batch from preprocess.py; it is
+  converted to NCHW float32 in [0, 1] here.
+- Output: Ultralytics layout (B, 4 + classes, anchors) with cx, cy, w, h in
+  model pixels; boxes above the confidence threshold go through NMS.
+- Models exported with a fixed batch size of 1 are run image by image.
+
+Variants of one model sit next to it (see quantize.py):
+
+    <version>.onnx                 fp32 export, what the registry watches
+    <version>.int8_dynamic.onnx    dynamically quantized
+    <version>.int8_static.onnx     statically quantized (calibrated)
+
+A quantized variant reports its version as "<version>+<variant>", so results,
+captures and the cache all say which file answered.
+
+onnxruntime is optional: without it (or without a model file) the registry
+keeps serving the placeholder detector.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .boxes import nms
+from .config import MODEL_CONF_THRESH, MODEL_NMS_IOU
+from .inference import Detections
+
+try:
+    import onnxruntime as ort
+except ImportError:  # optional dependency
+    ort = None
+
+VARIANTS = ("fp32", "int8_dynamic", "int8_static")
+
+
+def gpu_available() -> bool:
+    return ort is not None and "CUDAExecutionProvider" in ort.get_available_providers()
+
+
+def split_variant(stem: str) -> Tuple[str, str]:
+    """'yolo-v3.int8_static' -> ('yolo-v3', 'int8_static'); plain stems are fp32."""
+    for variant in VARIANTS[1:]:
+        if stem.endswith("." + variant):
+            return stem[: -len(variant) - 1], variant
+    return stem, "fp32"
+
+
+def variant_path(model_path: str, variant: str) -> Path:
+    p = Path(model_path)
+    base, _ = split_variant(p.stem)
+    name = f"{base}.onnx" if variant == "fp32" else f"{base}.{variant}.onnx"
+    return p.with_name(name)
+
+
+def available_variants(model_path: str) -> Dict[str, Path]:
+    """Variants of `model_path` present on disk, fp32 first."""
+    found = {}
+    for variant in VARIANTS:
+        p = variant_path(model_path, variant)
+        if p.is_file():
+            found[variant] = p
+    return found
+
+
+def to_input(batch: np.ndarray) -> np.ndarray:
+    """(B, S, S, 3) uint8 -> (B, 3, S, S) float32 in [0, 1]."""
+    x = np.ascontiguousarray(batch.transpose(0, 3, 1, 2), dtype=np.float32)
+    x *= 1.0 / 255.0
+    return x
+
+
+class OnnxDetector:
+    def __init__(
+        self,
+        path: str,
+        intra_op_threads: Optional[int] = None,
+        inter_op_threads: Optional[int] = None,
+        execution_mode: str = "sequential",
+    ) -> None:
+        if ort is None:
+            raise RuntimeError("onnxruntime is not installed")
+        t0 = time.perf_counter()
+        self.path = str(path)
+        base, self.variant = split_variant(Path(path).stem)
+        self.version = base if self.variant == "fp32" else f"{base}+{self.variant}"
+        self.options = {
+            "intra_op_threads": intra_op_threads,
+            "inter_op_threads": inter_op_threads,
+            "execution_mode": execution_mode,
+        }
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            opts.intra_op_num_threads = intra_op_threads
+        if inter_op_threads:
+            opts.inter_op_num_threads = inter_op_threads
+        opts.execution_mode = (
+            ort.ExecutionMode.ORT_PARALLEL
+            if execution_mode == "parallel"
+            else ort.ExecutionMode.ORT_SEQUENTIAL
+        )
+        self.session = ort.InferenceSession(
+            self.path, sess_options=opts, providers=["CPUExecutionProvider"]
+        )
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self.fixed_batch = inp.shape[0] if isinstance(inp.shape[0], int) else None
+        self.load_ms = (time.perf_counter() - t0) * 1000
+        self.file_bytes = os.path.getsize(self.path)
+
+    def _run(self, x: np.ndarray) -> np.ndarray:
+        if self.fixed_batch == 1 and x.shape[0] > 1:
+            return np.concatenate(
+                [
+                    self.session.run(None, {self.input_name: x[i : i + 1]})[0]
+                    for i in range(x.shape[0])
+                ]
+            )
+        return self.session.run(None, {self.input_name: x})[0]
+
+    def forward(self, batch: np.ndarray) -> List[Detections]:
+        out = self._run(to_input(batch))  # (B, 4 + C, N)
+
+        dets: List[Detections] = []
+        for pred in out:
+            pred = pred.T  # (N, 4 + C)
+            scores = pred[:, 4:].max(axis=1)
+            keep = scores >= MODEL_CONF_THRESH
+            pred, scores = pred[keep], scores[keep]
+            cx, cy, w, h = pred[:, 0], pred[:, 1], pred[:, 2], pred[:, 3]
+            boxes = np.stack(
+                [cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1
+            ).astype(np.float32)
+            idx = nms(boxes, scores, MODEL_NMS_IOU)
+            dets.append(
+                Detections(boxes=boxes[idx], scores=scores[idx].astype(np.float32))
+            )
+        return dets
@@ -0,0 +1,153 @@
+"""
+Fast decode + preprocess for model input.
+
+- JPEGs are decoded with `Image.draft`, so libjpeg scales by 1/2, 1/4 or 1/8
+  in the DCT domain and a 12 MP photo never materialises at full resolution.
+- EXIF orientation is applied (phone/tablet photos). `decode_into` drafts
+  for the letterboxed size and rotates the already resized pixels, so a
+  ~2 MP photo still decodes at half size and nothing rotates at full size.
+- The letterboxed pixels are written straight into the caller's slot of a
+  preallocated (B, S, S, 3) uint8 batch; no per-image array is stacked later.
+- `Letterbox` maps model-space boxes back onto the decoded image.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from .config import MODEL_INPUT_SIZE
+
+PAD_VALUE = 114  # YOLO letterbox grey
+
+# EXIF orientations that swap width and height
+_TRANSPOSED = (5, 6, 7, 8)
+# EXIF orientation -> transpose that uprights the image (as ImageOps.exif_transpose)
+_UPRIGHT = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+_SWAPS = {_UPRIGHT[o] for o in _TRANSPOSED}
+
+
+@dataclass
+class Letterbox:
+    scale: float  # decoded px -> model px
+    pad_x: int
+    pad_y: int
+    decoded_size: Tuple[int, int]  # size of the (drafted, oriented) image
+    source_size: Tuple[int, int]  # full-resolution size, after orientation
+
+    def to_image(self, boxes: np.ndarray) -> np.ndarray:
+        """Model-space xyxy -> decoded-image xyxy, clipped to the image."""
+        out = boxes.astype(np.float32, copy=True).reshape(-1, 4)
+        xs, ys = out[:, 0::2], out[:, 1::2]  # views: x1,x2 / y1,y2
+        xs -= self.pad_x
+        ys -= self.pad_y
+        out /= self.scale
+        w, h = self.decoded_size
+        np.clip(xs, 0, w - 1, out=xs)
+        np.clip(ys, 0, h - 1, out=ys)
+        return out
+
+    def to_source(self, boxes: np.ndarray) -> np.ndarray:
+        """Model-space xyxy -> full-resolution (oriented) image xyxy."""
+        out = self.to_image(boxes)
+        out[:, 0::2] *= self.source_size[0] / self.decoded_size[0]
+        out[:, 1::2] *= self.source_size[1] / self.decoded_size[1]
+        return out
+
+
+def oriented_size(img: Image.Image) -> Tuple[int, int]:
+    """Full-resolution size after EXIF orientation, from the header alone."""
+    if img.getexif().get(0x0112) in _TRANSPOSED:
+        return img.size[::-1]
+    return img.size
+
+
+def open_for_model(img_bytes: bytes, size: int = MODEL_INPUT_SIZE, full=False):
+    """
+    Decode just enough pixels for a `size` model input (every pixel with
+    `full`, e.g. to draw on). Returns (RGB image, full-resolution oriented size).
+    """
+    img = Image.open(BytesIO(img_bytes))
+    source_size = oriented_size(img)
+
+    if img.format == "JPEG" and not full:
+        # Picks the largest DCT scale that still keeps both sides >= size
+        img.draft("RGB", (size, size))
+
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return img, source_size
+
+
+def _fit(w: int, h: int, size: int) -> Tuple[float, int, int]:
+    """Letterbox scale and resized (w, h) of a w x h image in a size square."""
+    scale = min(size / w, size / h)
+    return scale, max(1, round(w * scale)), max(1, round(h * scale))
+
+
+def _paste(resized: Image.Image, out: np.ndarray) -> Tuple[int, int]:
+    """Centre `resized` in `out`, pad the rest; returns (pad_x, pad_y)."""
+    size = out.shape[0]
+    nw, nh = resized.size
+    pad_x, pad_y = (size - nw) // 2, (size - nh) // 2
+    out.fill(PAD_VALUE)
+    out[pad_y : pad_y + nh, pad_x : pad_x + nw] = np.asarray(resized)
+    return pad_x, pad_y
+
+
+def letterbox_into(img: Image.Image, out: np.ndarray, source_size=None) -> Letterbox:
+    """
+    Resize `img` to fit `out` (S, S, 3) keeping aspect ratio and pad the rest.
+    `out` is typically one slot of a preallocated batch array.
+    """
+    w, h = img.size
+    scale, nw, nh = _fit(w, h, out.shape[0])
+    resized = img.resize((nw, nh), Image.BILINEAR) if (nw, nh) != (w, h) else img
+    pad_x, pad_y = _paste(resized, out)
+    return Letterbox(scale, pad_x, pad_y, (w, h), source_size or (w, h))
+
+
+def decode_into(img_bytes: bytes, out: np.ndarray) -> Letterbox:
+    """
+    Model input only (nothing to draw on): open_for_model + letterbox_into,
+    with the draft sized for the letterboxed image rather than the whole
+    square (a 4:3 photo needs 640x480, not 640x640), and resized before the
+    EXIF rotation, so only model-sized pixels move.
+    """
+    img = Image.open(BytesIO(img_bytes))
+    source_size = oriented_size(img)
+    upright = _UPRIGHT.get(img.getexif().get(0x0112))
+    swap = upright in _SWAPS
+
+    _, nw, nh = _fit(*source_size, out.shape[0])
+    target = (nh, nw) if swap else (nw, nh)  # before rotating
+    if img.format == "JPEG" and min(a // b for a, b in zip(img.size, target)) >= 2:
+        img.draft("RGB", target)  # only when libjpeg can scale by 1/2 or more
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+
+    w, h = img.size[::-1] if swap else img.size  # decoded, upright
+    scale = _fit(w, h, out.shape[0])[0]
+    resized = img.resize(target, Image.BILINEAR) if target != img.size else img
+    if upright is not None:
+        resized = resized.transpose(upright)
+    pad_x, pad_y = _paste(resized, out)
+    return Letterbox(scale, pad_x, pad_y, (w, h), source_size)
+
+
+def new_batch(n: int, size: int = MODEL_INPUT_SIZE) -> np.ndarray:
+    """C-contiguous uint8 (n, S, S, 3) buffer to letterbox images into."""
+    return np.empty((n, size, size, 3), dtype=np.uint8)
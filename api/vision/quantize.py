@@ -0,0 +1,163 @@
+"""
+INT8 variants of an ONNX detector, for CPU serving.
+
+- int8_dynamic: weights quantized offline, activation ranges computed at run
+  time. No calibration data, smaller file, modest speed-up on conv nets.
+- int8_static: weights and activations quantized (QDQ format, per-channel
+  weights), activation ranges calibrated on representative photos. Fastest
+  on CPUs with VNNI, but only as good as its calibration set.
+
+Calibration photos come from the low-confidence capture queue (the hard cases
+the plant actually sees), from the synthetic set (synthetic.py), or from any
+directory of JPEG/PNG files. The variants are written next to the fp32 model
+(naming in onnx_detector.py); which one a machine serves is decided by
+autotune.py.
+
+Needs onnxruntime and onnx (imported lazily; the API runs without them).
+"""
+
+from __future__ import annotations
+
+import os
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .config import LABEL_QUEUE_DIR
+from .onnx_detector import to_input, variant_path
+from .preprocess import letterbox_into, new_batch, open_for_model
+
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+CALIBRATION_SOURCES = ("label_queue", "synthetic")  # or a directory path
+
+
+def calibration_images(source: str, limit: int = 200) -> List[bytes]:
+    """Up to `limit` encoded photos from a calibration source, newest first."""
+    if source == "synthetic":
+        from .synthetic import DENSITIES, SCENES, generate
+
+        resolutions = [(1600, 1200), (2592, 1944)]
+        per_scene = -(-limit // (len(SCENES) * len(resolutions) * len(DENSITIES)))
+        images = generate(resolutions=resolutions, per_scene=per_scene, seed=1)
+        return [img.jpeg for img in images][:limit]
+
+    root = Path(LABEL_QUEUE_DIR) / "images" if source == "label_queue" else Path(source)
+    if not root.is_dir():
+        raise FileNotFoundError(f"No calibration images in {root}")
+    files = [p for p in root.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png")]
+    files.sort(key=lambda p: p.stat().st_mtime, reverse=True)
+    return [p.read_bytes() for p in files[:limit]]
+
+
+class CalibrationReader:
+    """onnxruntime CalibrationDataReader: one preprocessed photo per call."""
+
+    def __init__(self, input_name: str, images: Iterable[bytes]) -> None:
+        self.input_name = input_name
+        self.images = list(images)
+        self._it = iter(self.images)
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        for img_bytes in self._it:
+            try:
+                img, src = open_for_model(img_bytes)
+            except Exception as e:
+                logger.warning(f"[VISION] skipping calibration image: {e!r}")
+                continue
+            batch = new_batch(1)
+            letterbox_into(img, batch[0], src)
+            return {self.input_name: to_input(batch)}
+        return None
+
+    def rewind(self) -> None:
+        self._it = iter(self.images)
+
+
+def _input_name(model_path: str) -> str:
+    import onnxruntime as ort
+
+    session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+    return session.get_inputs()[0].name
+
+
+def _write_atomically(out: Path, build) -> Path:
+    """Build into a temp file beside `out`, then rename (the registry polls)."""
+    tmp = out.with_name(out.name + ".tmp")
+    try:
+        build(str(tmp))
+        os.replace(tmp, out)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return out
+
+
+def quantize_dynamic_variant(model_path: str) -> Path:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    out = variant_path(model_path, "int8_dynamic")
+    return _write_atomically(
+        out,
+        lambda tmp: quantize_dynamic(
+            model_path, tmp, weight_type=QuantType.QUInt8  # ConvInteger needs u8
+        ),
+    )
+
+
+def quantize_static_variant(model_path: str, images: List[bytes]) -> Path:
+    from onnxruntime.quantization import (
+        CalibrationMethod,
+        QuantFormat,
+        QuantType,
+        quantize_static,
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    if not images:
+        raise ValueError("Static quantization needs calibration images")
+    reader = CalibrationReader(_input_name(model_path), images)
+    out = variant_path(model_path, "int8_static")
+
+    def build(tmp: str) -> None:
+        with tempfile.TemporaryDirectory() as work:
+            prepared = os.path.join(work, "prepared.onnx")
+            quant_pre_process(model_path, prepared)  # shape inference + folding
+            quantize_static(
+                prepared,
+                tmp,
+                reader,
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                per_channel=True,
+                calibrate_method=CalibrationMethod.MinMax,
+            )
+
+    return _write_atomically(out, build)
+
+
+def build_variants(
+    model_path: str,
+    variants: Iterable[str] = ("int8_dynamic", "int8_static"),
+    source: str = "label_queue",
+    limit: int = 200,
+) -> Dict[str, Path]:
+    """Write the requested variants of `model_path`; returns their paths."""
+    built: Dict[str, Path] = {}
+    for variant in variants:
+        if variant == "int8_dynamic":
+            built[variant] = quantize_dynamic_variant(model_path)
+        elif variant == "int8_static":
+            images = calibration_images(source, limit)
+            logger.info(
+                f"[VISION] calibrating {Path(model_path).name} on "
+                f"{len(images)} images from {source}"
+            )
+            built[variant] = quantize_static_variant(model_path, images)
+        else:
+            raise ValueError(f"Unknown variant '{variant}'")
+    return built
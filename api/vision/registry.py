@@ -0,0 +1,213 @@
+"""
+Model registry: hot-reload of ONNX detectors without restarting uvicorn.
+
+- Watches MODELS_DIR (polling, no extra dependency). The served model is the
+  newest `*.onnx` by mtime, or the file named by VISION_MODEL when pinned.
+  The file stem is the model version.
+- A new version is loaded and warmed with synthetic batches on a fresh
+  generation of worker processes in the background; only then are new
+  requests switched over (`VisionWorkerPool.swap`). In-flight requests finish
+  on the old generation, which shuts down once drained.
+- A file that fails to load is remembered and skipped until it changes, so
+  a half-copied model does not take the detector down (copy the file in
+  under a temporary name and rename it into place).
+- Quantized variants next to the model (`<version>.int8_*.onnx`) are not
+  models of their own: autotune.py picks the variant and session settings
+  that serve fastest on this machine, and adding or replacing a variant file
+  re-tunes and swaps like a new model.
+- Without onnxruntime or without any model file the placeholder keeps
+  serving.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+import asyncio
+import logging
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from . import autotune
+from .onnx_detector import split_variant
+from .worker_pool import VisionWorkerPool
+
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+# (path, mtime, size, variant files): a model as last seen on disk
+_FileKey = Tuple[str, float, int, Tuple[Tuple[str, float], ...]]
+
+
+class ModelRegistry:
+    def __init__(
+        self,
+        pool: VisionWorkerPool,
+        models_dir: str,
+        *,
+        poll_s: float = 10.0,
+        pinned: str = "",
+        on_swap: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        self.pool = pool
+        self.models_dir = Path(models_dir)
+        self.poll_s = poll_s
+        self.pinned = pinned
+        self.on_swap = on_swap
+
+        self._active: Optional[_FileKey] = None
+        self._failed: Optional[_FileKey] = None
+        self._watcher: Optional[asyncio.Task] = None
+        self._swap_lock = asyncio.Lock()
+
+        self.loaded_at: Optional[float] = None
+        self.swap_ms = 0.0
+        self.history: List[dict] = []  # most recent last
+        self.tuning: Optional[dict] = None  # autotune record being served
+        self.errors = 0
+        self.last_error = ""
+
+    # --- discovery ---
+    def _runtime_available(self) -> bool:
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def resolve(self) -> Optional[_FileKey]:
+        """The model file that should be served, or None for the placeholder."""
+        if not self.models_dir.is_dir():
+            return None
+        candidates, variants = [], {}
+        for p in self.models_dir.glob("*.onnx"):
+            base, variant = split_variant(p.stem)
+            if self.pinned and base != self.pinned:
+                continue
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            if variant != "fp32":
+                variants.setdefault(base, []).append((variant, st.st_mtime))
+                continue
+            candidates.append((st.st_mtime, str(p), st.st_size))
+        if not candidates:
+            return None
+        mtime, path, size = max(candidates)
+        return (path, mtime, size, tuple(sorted(variants.get(Path(path).stem, []))))
+
+    async def _prepare(self, target: _FileKey) -> Tuple[str, dict, Optional[dict]]:
+        """Variant file, session options and tuning record for `target` (may tune)."""
+        return await asyncio.to_thread(autotune.select, target[0], self.pool.workers)
+
+    # --- lifecycle ---
+    async def start(self) -> None:
+        """Initial load (blocking the startup, like before), then watch."""
+        target = self.resolve() if self._runtime_available() else None
+        if target is None and self.models_dir.is_dir():
+            logger.info(
+                "[VISION] no servable ONNX model in %s (onnxruntime %s); "
+                "serving placeholder",
+                self.models_dir,
+                "available" if self._runtime_available() else "missing",
+            )
+        t0 = time.perf_counter()
+        try:
+            path, options, record = (
+                await self._prepare(target) if target else (None, None, None)
+            )
+            await asyncio.to_thread(self.pool.start, path, options)
+            self.tuning = record
+        except Exception as e:
+            self._record_failure(target, e)
+            await asyncio.to_thread(self.pool.start, None)
+            target = None
+        self._record_swap(target, t0)
+
+        if self._runtime_available():
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_s)
+            try:
+                await self.reload()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:  # keep watching whatever happens
+                logger.error(f"[VISION] model watch error: {e!r}")
+
+    async def reload(self, force: bool = False) -> bool:
+        """Swap to the model resolve() picks if it changed. True if swapped."""
+        async with self._swap_lock:
+            target = self.resolve()
+            if target is None or target == self._failed:
+                return False
+            if target == self._active and not force:
+                return False
+
+            logger.info(f"[VISION] loading model {Path(target[0]).stem} ...")
+            t0 = time.perf_counter()
+            try:
+                path, options, record = await self._prepare(target)
+                await asyncio.to_thread(self.pool.swap, path, options)
+                self.tuning = record
+            except Exception as e:
+                self._record_failure(target, e)
+                return False
+            self._record_swap(target, t0)
+            return True
+
+    def _record_swap(self, target: Optional[_FileKey], t0: float) -> None:
+        self._active = target
+        self.loaded_at = time.time()
+        self.swap_ms = (time.perf_counter() - t0) * 1000
+        version = self.pool.model_version
+        self.history.append(
+            {
+                "version": version,
+                "loaded_at": self.loaded_at,
+                "swap_ms": round(self.swap_ms, 1),
+            }
+        )
+        del self.history[:-10]
+        logger.info(f"[VISION] serving model {version} ({self.swap_ms:.0f}ms)")
+        if self.on_swap:
+            self.on_swap(version)
+
+    def _record_failure(self, target: Optional[_FileKey], e: Exception) -> None:
+        self._failed = target
+        self.errors += 1
+        self.last_error = f"{Path(target[0]).name if target else '?'}: {e!r}"
+        logger.error(f"[VISION] model load failed, keeping current: {self.last_error}")
+
+    def snapshot(self) -> dict:
+        return {
+            "version": self.pool.model_version,
+            "path": self.pool.model_path,
+            "options": self.pool.model_options,
+            "models_dir": str(self.models_dir),
+            "pinned": self.pinned or None,
+            "loaded_at": self.loaded_at,
+            "swap_ms": round(self.swap_ms, 1),
+            "workers": self.pool.model_info,
+            "draining_pools": self.pool.snapshot()["draining_pools"],
+            "tuning": (
+                {k: v for k, v in self.tuning.items() if k != "trials"}
+                if self.tuning
+                else None
+            ),
+            "tuning_file": str(autotune.tune_path()),
+            "history": self.history,
+            "errors": self.errors,
+            "last_error": self.last_error or None,
+        }
@@ -0,0 +1,35 @@
+import os
+import asyncio
+import logging
+
+from .vision_routes import (
+    yolo_batcher,
+    vision_pool,
+    grounded_sam,
+    label_queue,
+    model_registry,
+)
+
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+
+async def start_vision() -> None:
+    """Called from the app lifespan on startup."""
+    # spawn workers (and load + warm their models) before the first request,
+    # then watch the models dir for new versions
+    await model_registry.start()
+    logger.info(
+        "Vision batching %s (max_batch=%d, deadline=%.0fms)",
+        "enabled" if yolo_batcher.enabled else "disabled",
+        yolo_batcher.max_batch_size,
+        yolo_batcher.max_delay * 1000,
+    )
+
+
+async def stop_vision() -> None:
+    """Called from the app lifespan on shutdown."""
+    await model_registry.stop()
+    await yolo_batcher.stop()
+    await grounded_sam.close()
+    await label_queue.stop()
+    await asyncio.to_thread(vision_pool.shutdown)
@@ -0,0 +1,245 @@
+"""
+Synthetic QC photos with known ground truth (benchmarks, calibration).
+
+Each scene is a product color profile from color_profiles.json: parts of the
+profile's color (foam rings, grippers) scattered over a placemat, at a chosen
+resolution and part count. Surface texture comes from the segmented reference
+photos in static/resources (their luminance detail, resized to the scene), so
+the JPEGs compress and decode like real photos instead of flat fills.
+
+Ground truth is exact: the boxes of the parts actually placed (a crowded
+scene may hold fewer parts than asked for). Parts keep a `gap` of a tenth of
+their length apart by default; a negative gap lets neighbours overlap.
+
+    for img in generate(["foam_orange"], [(2592, 1944)], [10]):
+        img.jpeg, img.count, img.boxes
+"""
+
+from __future__ import annotations
+
+import json
+import math
+from dataclasses import dataclass, field
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from ..config import STATIC_DIR
+
+SEEDS_DIR = STATIC_DIR / "resources"
+
+RESOLUTIONS = [(1600, 1200), (2592, 1944), (4000, 3000)]  # ~2, 5, 12 MP
+DENSITIES = [3, 10, 25]  # parts per image
+
+
+@dataclass(frozen=True)
+class Scene:
+    mat_rgb: Tuple[int, int, int]
+    part_rgb: Tuple[int, int, int]
+    shape: str  # "ring" | "gripper"
+    size: Tuple[float, float]  # part length, fraction of the short image side
+    seed: str  # texture source in static/resources
+
+
+# Keyed by color profile name (api/vision/color_profiles.json)
+SCENES = {
+    "foam_orange": Scene(
+        (38, 36, 40), (236, 118, 34), "ring", (0.07, 0.12), "foam-segmented.png"
+    ),
+    "foam_black": Scene(
+        (182, 182, 178), (30, 29, 32), "ring", (0.07, 0.12), "foam-segmented.png"
+    ),
+    "gripper_silver": Scene(
+        (22, 22, 25), (188, 190, 196), "gripper", (0.16, 0.22), "grippers-segmented.png"
+    ),
+}
+
+
+@dataclass
+class SyntheticImage:
+    name: str
+    product: str
+    size: Tuple[int, int]  # (width, height)
+    boxes: List[List[float]]  # ground truth, x1 y1 x2 y2 in image pixels
+    jpeg: bytes = field(repr=False, default=b"")
+
+    @property
+    def count(self) -> int:
+        return len(self.boxes)
+
+    def record(self) -> dict:
+        return {
+            "name": self.name,
+            "product": self.product,
+            "size": list(self.size),
+            "count": self.count,
+            "boxes": self.boxes,
+        }
+
+
+# ---------------------------------------------------------------------------- #
+@lru_cache(maxsize=8)
+def _texture(seed: str, width: int, height: int) -> np.ndarray:
+    """Zero-mean luminance detail of a seed photo, resized to the scene."""
+    img = Image.open(SEEDS_DIR / seed).convert("L")
+    w, h = img.size
+    img = img.crop((w // 50, h // 50, w - w // 50, h - h // 50))  # drop the frame
+    img = img.resize((width, height), Image.BILINEAR)
+    lum = np.asarray(img, dtype=np.float32)
+    small = np.asarray(
+        img.resize((max(1, width // 32), max(1, height // 32)), Image.BILINEAR).resize(
+            (width, height), Image.BILINEAR
+        ),
+        dtype=np.float32,
+    )
+    detail = lum - small  # high-pass: keep grain and edges, drop the layout
+    return np.clip(detail * 0.5, -8, 8).astype(np.int16)
+
+
+def _ring(draw: ImageDraw.ImageDraw, cx, cy, length, angle, label) -> List[float]:
+    r = length / 2
+    draw.ellipse((cx - r, cy - r, cx + r, cy + r), fill=label)
+    ri = r * 0.45
+    draw.ellipse((cx - ri, cy - ri, cx + ri, cy + ri), fill=0)
+    return [cx - r, cy - r, cx + r, cy + r]
+
+
+def _gripper(draw: ImageDraw.ImageDraw, cx, cy, length, angle, label) -> List[float]:
+    """Rotated body with a few vacuum ports (profiles fill holes)."""
+    hw, hh = length / 2, length * 0.19
+    c, s = math.cos(angle), math.sin(angle)
+
+    def rot(x, y):
+        return (cx + x * c - y * s, cy + x * s + y * c)
+
+    corners = [rot(x, y) for x, y in ((-hw, -hh), (hw, -hh), (hw, hh), (-hw, hh))]
+    draw.polygon(corners, fill=label)
+    pr = hh * 0.3
+    for fx in (-0.55, 0.0, 0.55):
+        px, py = rot(fx * hw, 0)
+        draw.ellipse((px - pr, py - pr, px + pr, py + pr), fill=0)
+    xs, ys = [p[0] for p in corners], [p[1] for p in corners]
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+
+def _place(
+    rng: np.random.Generator,
+    width: int,
+    height: int,
+    lengths: Sequence[float],
+    gap: float = 0.1,
+    tries: int = 200,
+) -> List[Tuple[float, float, float]]:
+    """Non-overlapping (cx, cy, radius) slots; parts that do not fit are dropped."""
+    placed: List[Tuple[float, float, float]] = []
+    for length in lengths:
+        r = length / 2
+        for _ in range(tries):
+            cx = rng.uniform(r + 2, width - r - 2)
+            cy = rng.uniform(r + 2, height - r - 2)
+            if all(
+                (cx - x) ** 2 + (cy - y) ** 2 > (r + pr + gap * length) ** 2
+                for x, y, pr in placed
+            ):
+                placed.append((cx, cy, r))
+                break
+    return placed
+
+
+def render_scene(
+    product: str,
+    width: int,
+    height: int,
+    count: int,
+    rng: np.random.Generator,
+    quality: int = 90,
+    gap: float = 0.1,
+) -> Tuple[bytes, List[List[float]]]:
+    """One JPEG with up to `count` parts, and the boxes of those placed."""
+    scene = SCENES[product]
+    short = min(width, height)
+    lengths = rng.uniform(scene.size[0], scene.size[1], size=count) * short
+
+    label_img = Image.new("L", (width, height), 0)
+    draw = ImageDraw.Draw(label_img)
+    shape = _ring if scene.shape == "ring" else _gripper
+    boxes = []
+    for i, (cx, cy, r) in enumerate(_place(rng, width, height, lengths, gap), start=1):
+        box = shape(draw, cx, cy, 2 * r, rng.uniform(0, math.pi), i)
+        boxes.append([round(v, 1) for v in box])
+
+    # Per-part brightness jitter (no tint: neutral parts stay neutral)
+    colors = np.empty((len(boxes) + 1, 3), dtype=np.int16)
+    colors[0] = scene.mat_rgb
+    colors[1:] = np.asarray(scene.part_rgb) + rng.integers(
+        -10, 11, size=(len(boxes), 1)
+    )
+    labels = np.asarray(label_img)
+    arr = colors[labels]
+    arr += _texture(scene.seed, width, height)[..., None]
+    arr += rng.integers(-4, 5, size=(height, width, 1), dtype=np.int16)
+
+    buf = BytesIO()
+    Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8)).save(
+        buf, "JPEG", quality=quality
+    )
+    return buf.getvalue(), boxes
+
+
+def generate(
+    products: Iterable[str] = tuple(SCENES),
+    resolutions: Iterable[Tuple[int, int]] = RESOLUTIONS,
+    densities: Iterable[int] = DENSITIES,
+    per_scene: int = 1,
+    seed: int = 0,
+    gap: float = 0.1,
+) -> Iterator[SyntheticImage]:
+    """Every product x resolution x density combination, `per_scene` each."""
+    rng = np.random.default_rng(seed)
+    for product in products:
+        if product not in SCENES:
+            raise ValueError(f"No synthetic scene for product '{product}'")
+        for w, h in resolutions:
+            for n in densities:
+                for k in range(per_scene):
+                    jpeg, boxes = render_scene(product, w, h, n, rng, gap=gap)
+                    name = f"{product}_{w}x{h}_n{n}_{k}"
+                    yield SyntheticImage(name, product, (w, h), boxes, jpeg)
+
+
+# ---------------------------------------------------------------------------- #
+def save_set(images: Iterable[SyntheticImage], out_dir: str) -> int:
+    """images/<name>.jpg plus manifest.jsonl with the ground truth."""
+    root = Path(out_dir)
+    (root / "images").mkdir(parents=True, exist_ok=True)
+    n = 0
+    with open(root / "manifest.jsonl", "w", encoding="utf-8") as f:
+        for img in images:
+            (root / "images" / f"{img.name}.jpg").write_bytes(img.jpeg)
+            f.write(json.dumps(img.record(), separators=(",", ":")) + "\n")
+            n += 1
+    return n
+
+
+def load_set(in_dir: str, limit: Optional[int] = None) -> List[SyntheticImage]:
+    root = Path(in_dir)
+    images = []
+    with open(root / "manifest.jsonl", "r", encoding="utf-8") as f:
+        for line in f:
+            rec = json.loads(line)
+            images.append(
+                SyntheticImage(
+                    rec["name"],
+                    rec["product"],
+                    tuple(rec["size"]),
+                    rec["boxes"],
+                    (root / "images" / f"{rec['name']}.jpg").read_bytes(),
+                )
+            )
+            if limit and len(images) >= limit:
+                break
+    return images
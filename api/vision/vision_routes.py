@@ -1,107 +1,471 @@
 import os
+import json
+import time
+import asyncio
 import logging
-from io import BytesIO
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Literal, Optional, Union
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 
-from PIL import Image, ImageDraw
 from pathlib import Path
 
+from ..circuit_breaker import CircuitBreaker, CircuitOpen
+from ..tracing import add_span, span
+from .batching import MicroBatcher
+from .cache import ResultCache
+from .cascade import CascadeScheduler, Stage
+from .label_queue import LabelQueue
+from .onnx_detector import gpu_available
+from .registry import ModelRegistry
+from .classical import PROFILES
+from .grounded_sam import GroundedSamClient, GroundedSamError
+from .worker_pool import VisionWorkerPool, PoolSaturated
+from .config import (
+    BATCHING_ENABLED,
+    MAX_BATCH_SIZE,
+    BATCH_DEADLINE_MS,
+    VISION_WORKERS,
+    VISION_MAX_PENDING,
+    VISION_RETRY_AFTER_S,
+    CACHE_ENABLED,
+    CACHE_MAX_ENTRIES,
+    CACHE_MAX_MB,
+    CACHE_DIR,
+    CACHE_DISK_MAX_MB,
+    CLASSICAL_MIN_CONF,
+    GROUNDED_SAM_URL,
+    GROUNDED_SAM_TIMEOUT_S,
+    GROUNDED_SAM_MAX_CONCURRENCY,
+    GROUNDED_SAM_BREAKER_FAILURES,
+    GROUNDED_SAM_BREAKER_RESET_S,
+    CASCADE_DEADLINE_MS,
+    CASCADE_YOLO_MIN_CONF,
+    LABEL_QUEUE_ENABLED,
+    LABEL_QUEUE_DIR,
+    LABEL_QUEUE_MAX_CONF,
+    LABEL_QUEUE_SAMPLE_RATE,
+    LABEL_QUEUE_MAX_MB,
+    MODELS_DIR,
+    MODEL_PIN,
+    MODEL_POLL_S,
+)
+
 # Setup logging
 logger = logging.getLogger(os.getenv("APP_LOGGER"))
 
 # Router for vision endpoints
 router = APIRouter()
 
-# Constants
-GROUND_SAM_URL = "http://groundedsam:9000/infer"
+
+# Decode / inference / encode run in worker processes, off the event loop
+vision_pool = VisionWorkerPool(
+    workers=VISION_WORKERS,
+    max_pending=VISION_MAX_PENDING,
+    retry_after_s=VISION_RETRY_AFTER_S,
+)
+
+# Concurrent /yolo requests share one batched forward pass
+yolo_batcher = MicroBatcher(
+    "yolo",
+    vision_pool.batch_runner("yolo"),
+    max_batch_size=MAX_BATCH_SIZE,
+    max_delay_ms=BATCH_DEADLINE_MS,
+    max_concurrent_batches=max(1, VISION_WORKERS),
+    enabled=BATCHING_ENABLED,
+)
+
+
+# Retakes / resends / client retries of the same frame skip inference
+result_cache = ResultCache(
+    enabled=CACHE_ENABLED,
+    max_entries=CACHE_MAX_ENTRIES,
+    max_bytes=int(CACHE_MAX_MB * 1024 * 1024),
+    disk_dir=CACHE_DIR or None,
+    disk_max_bytes=int(CACHE_DISK_MAX_MB * 1024 * 1024),
+)
+
+
+# New ONNX versions dropped into MODELS_DIR are loaded, warmed and swapped in
+model_registry = ModelRegistry(
+    vision_pool,
+    MODELS_DIR,
+    poll_s=MODEL_POLL_S,
+    pinned=MODEL_PIN,
+    on_swap=result_cache.set_model_version,
+)
+
+# Low-confidence frames are kept for labelling, written off the request path
+label_queue = LabelQueue(
+    LABEL_QUEUE_DIR,
+    enabled=LABEL_QUEUE_ENABLED,
+    max_conf=LABEL_QUEUE_MAX_CONF,
+    sample_rate=LABEL_QUEUE_SAMPLE_RATE,
+    max_bytes=int(LABEL_QUEUE_MAX_MB * 1024 * 1024),
+)
+
+# Pooled async client for the remote segmentation service
+grounded_sam = GroundedSamClient(
+    GROUNDED_SAM_URL,
+    timeout_s=GROUNDED_SAM_TIMEOUT_S,
+    max_concurrency=GROUNDED_SAM_MAX_CONCURRENCY,
+    breaker=CircuitBreaker(
+        "groundedsam",
+        failure_threshold=GROUNDED_SAM_BREAKER_FAILURES,
+        reset_timeout_s=GROUNDED_SAM_BREAKER_RESET_S,
+    ),
+)
+
+
+def _saturated(e: Union[PoolSaturated, CircuitOpen]) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"error": str(e)},
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def _result_headers(res) -> dict:
+    headers = {
+        "X-Objects-Count": str(res.count),
+        "X-Mean-Conf": f"{res.mean_conf:.3f}",
+        "X-Cache": "HIT" if res.cached else "MISS",
+    }
+    if res.model_version:  # "<version>+<variant>" for quantized models
+        headers["X-Model-Version"] = res.model_version
+    if "cpu" in res.timings_ms:
+        headers["X-CPU-Time"] = f"{res.timings_ms['cpu']:.0f}ms"
+    return headers
+
+
+def _geometry(res) -> dict:
+    """Overlay geometry for client-side rendering (full-resolution pixels)."""
+    return {
+        "count": res.count,
+        "confidence": round(res.mean_conf, 3),
+        "engine": res.engine,
+        "model_version": res.model_version,
+        "image_size": res.image_size,
+        "boxes": res.boxes,
+        "scores": res.scores,
+        "masks": res.masks,
+        "cached": res.cached,
+    }
+
+
+def _trace_worker(res) -> None:
+    """The worker's own stage times (decode, forward, encode, cpu) as spans."""
+    for stage, ms in res.timings_ms.items():
+        add_span(f"vision.{stage}", ms)
+
+
+@span("vision.detect")
+async def _detect(img_bytes: bytes, tiled: bool, render: bool = True):
+    """Detector pass: batched single image, or one photo as a batch of tiles."""
+    if not tiled:
+        res = await yolo_batcher.submit((img_bytes, render))
+        _trace_worker(res)
+        return res
+    (res,) = await vision_pool.run("tiled", [img_bytes], render=render)
+    if isinstance(res, Exception):
+        raise res
+    _trace_worker(res)
+    return res
+
+
+@span("vision.classical")
+async def _classical(img_bytes: bytes, product: str, render: bool = True):
+    """Color-threshold counter for a known product profile."""
+    (res,) = await vision_pool.run(
+        "classical", [img_bytes], product=product, render=render
+    )
+    if isinstance(res, Exception):
+        raise res
+    _trace_worker(res)
+    return res
+
+
+async def _segment(
+    img_bytes: bytes, prompt: str, deadline_s: Optional[float], render: bool = True
+):
+    """GroundedSAM over the network, then draw its output in a worker process."""
+    async with span("vision.grounded_sam"):
+        seg = await grounded_sam.infer(img_bytes, prompt, deadline_s=deadline_s)
+    (res,) = await vision_pool.run(
+        "annotate",
+        [img_bytes],
+        boxes=seg.boxes,
+        scores=seg.scores,
+        masks=seg.masks,
+        model_version=seg.model,
+        render=render,
+    )
+    if isinstance(res, Exception):
+        raise res
+    _trace_worker(res)
+    return res
 
 
-def draw_boxes(img: Image.Image, boxes):
-    """Draw bounding boxes on image"""
-    draw = ImageDraw.Draw(img)
-    for b in boxes:
-        xyxy = b.xyxy[0].tolist()  # [x1,y1,x2,y2]
-        draw.rectangle(xyxy, outline="red", width=4)
-    return img
+# Cheapest first; GroundedSAM is the last resort and always answers
+cascade = CascadeScheduler(
+    [
+        Stage(
+            "classical",
+            lambda b, remaining, ctx: _classical(b, ctx["product"], render=False),
+            CLASSICAL_MIN_CONF,
+            applies=lambda ctx: bool(ctx.get("product")),
+        ),
+        Stage(
+            "yolo",
+            lambda b, remaining, ctx: _detect(b, ctx.get("tiled", False), False),
+            CASCADE_YOLO_MIN_CONF,
+        ),
+        Stage(
+            "grounded_sam",
+            lambda b, remaining, ctx: _segment(b, ctx["prompt"], remaining, False),
+            0.0,
+        ),
+    ]
+)
 
 
 # ---------------------------------------------------------------------------- #
 @router.post("/yolo")
-async def infer_yolo(file: UploadFile = File(...)):
-    """YOLO object detection endpoint"""
+async def infer_yolo(
+    file: UploadFile = File(...),
+    product: Optional[str] = Form(None),
+    tiled: bool = Form(False),
+    output: Literal["image", "json"] = Form("image"),
+):
+    """
+    YOLO object detection endpoint.
+    With a `product` color profile, the classical counter runs first and only
+    low-confidence results escalate to the detector.
+    `tiled` runs the detector over overlapping full-resolution tiles, for
+    high-resolution photos of small parts.
+    `output=json` returns overlay geometry only (nothing drawn or encoded).
+    """
     if not file.filename.lower().endswith((".png", ".jpg", ".jpeg")):
         return JSONResponse(status_code=400, content={"error": "Invalid file type"})
+    if product and product not in PROFILES:
+        return JSONResponse(
+            status_code=400, content={"error": f"Unknown product '{product}'"}
+        )
 
+    t0 = time.perf_counter()
     img_bytes = await file.read()
-    img = Image.open(BytesIO(img_bytes)).convert("RGB")
+    render = output == "image"
+    job = ("yolo_tiled" if tiled else "yolo") + ("" if render else ":json")
+    key = result_cache.key(img_bytes, job, prompt=product or "")
+    async with span("vision.cache"):
+        res = await result_cache.get(key)
+    if res is None:
+        try:
+            with vision_pool.admit():
+                if product:
+                    res = await _classical(img_bytes, product, render)
+                    if res.mean_conf < CLASSICAL_MIN_CONF:
+                        logger.debug(
+                            "Classical conf %.2f < %.2f; escalating to YOLO",
+                            res.mean_conf,
+                            CLASSICAL_MIN_CONF,
+                        )
+                        res = await _detect(img_bytes, tiled, render)
+                else:
+                    res = await _detect(img_bytes, tiled, render)
+        except PoolSaturated as e:
+            return _saturated(e)
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+        await result_cache.put(key, res)
+        label_queue.offer(img_bytes, res, endpoint="yolo", product=product)
 
-    logger.debug("YOLO inference on image size: %s", img.size)
+    logger.debug("YOLO inference on image size: %s", res.image_size)
 
-    # TODO: Replace with actual YOLO inference
+    # Return image (or geometry) with metadata in headers
+    headers = _result_headers(res)
+    headers["X-Processing-Time"] = f"{(time.perf_counter() - t0) * 1000:.0f}ms"
+    headers["X-Engine"] = res.engine
+    if not render:
+        return JSONResponse(content=_geometry(res), headers=headers)
+    return Response(content=res.jpeg, media_type="image/jpeg", headers=headers)
+
+
+# ---------------------------------------------------------------------------- #
+@router.post("/dino-sam")
+async def infer_dino_sam(
+    file: UploadFile = File(...),
+    prompt: str = Form("object"),
+    deadline_ms: Optional[int] = Form(None),
+    output: Literal["image", "json"] = Form("image"),
+):
     """
-    boxes, confs = run_onnx(img)
-    count = len(boxes)
-    mean_conf = float(np.mean(confs)) if confs.size else 0.0
+    DINO-SAM segmentation endpoint (remote GroundedSAM service).
+    `deadline_ms` bounds the whole call, including the wait for a free
+    service slot; past it the endpoint answers 504.
+    `output=json` returns boxes + mask polygons for client-side rendering.
     """
+    if not file.filename.lower().endswith((".png", ".jpg", ".jpeg")):
+        return JSONResponse(status_code=400, content={"error": "Invalid file type"})
 
-    # Placeholder results
-    count = 1
-    mean_conf = 0.75
-
-    # Return image with metadata in headers
-    buf = BytesIO()
-    img.save(buf, "JPEG", quality=85)
-    buf.seek(0)
+    img_bytes = await file.read()
+    render = output == "image"
+    job = "dino_sam" if render else "dino_sam:json"
+    key = result_cache.key(img_bytes, job, prompt=prompt)
+    async with span("vision.cache"):
+        res = await result_cache.get(key)
+    if res is None:
+        try:
+            with vision_pool.admit():
+                res = await _segment(
+                    img_bytes,
+                    prompt,
+                    deadline_ms / 1000 if deadline_ms else None,
+                    render,
+                )
+        except (PoolSaturated, CircuitOpen) as e:
+            return _saturated(e)
+        except asyncio.TimeoutError:
+            return JSONResponse(
+                status_code=504, content={"error": "GroundedSAM deadline exceeded"}
+            )
+        except GroundedSamError as e:
+            logger.warning(f"[VISION] {e}")
+            return JSONResponse(status_code=502, content={"error": str(e)})
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+        await result_cache.put(key, res)
+        label_queue.offer(img_bytes, res, endpoint="dino-sam", prompt=prompt)
 
-    headers = {
-        "X-Objects-Count": str(count),
-        "X-Mean-Conf": f"{mean_conf:.3f}",
-        "X-Processing-Time": "150ms",  # Add processing time
-    }
+    logger.debug("DINO-SAM inference on image size: %s", res.image_size)
 
-    return StreamingResponse(buf, media_type="image/jpeg", headers=headers)
+    headers = _result_headers(res)
+    headers["X-Segmentation-Quality"] = "high"
+    if not render:
+        return JSONResponse(content=_geometry(res), headers=headers)
+    return Response(content=res.jpeg, media_type="image/jpeg", headers=headers)
 
 
 # ---------------------------------------------------------------------------- #
-@router.post("/dino-sam")
-async def infer_dino_sam(file: UploadFile = File(...)):
-    """DINO-SAM segmentation endpoint"""
+@router.post("/count")
+async def count_objects(
+    file: UploadFile = File(...),
+    product: Optional[str] = Form(None),
+    prompt: str = Form("object"),
+    tiled: bool = Form(False),
+    deadline_ms: Optional[float] = Form(None),
+):
+    """
+    Count parts through the model cascade (classical -> YOLO -> GroundedSAM).
+    The first stage confident enough answers; `stage` says which one did and
+    `trace` lists every stage that ran. `deadline_ms` bounds the whole request;
+    when it runs out the most confident result so far is returned with
+    `confident: false`.
+    """
     if not file.filename.lower().endswith((".png", ".jpg", ".jpeg")):
         return JSONResponse(status_code=400, content={"error": "Invalid file type"})
+    if product and product not in PROFILES:
+        return JSONResponse(
+            status_code=400, content={"error": f"Unknown product '{product}'"}
+        )
 
+    t0 = time.perf_counter()
     img_bytes = await file.read()
-    img = Image.open(BytesIO(img_bytes)).convert("RGB")
+    key = result_cache.key(img_bytes, "count", prompt=f"{product}|{prompt}|{tiled}")
+    async with span("vision.cache"):
+        res = await result_cache.get(key)
+    if res is not None:
+        stage, confident, trace = res.engine, True, []
+    else:
+        try:
+            with vision_pool.admit():
+                outcome = await cascade.run(
+                    img_bytes,
+                    (deadline_ms or CASCADE_DEADLINE_MS) / 1000,
+                    product=product,
+                    prompt=prompt,
+                    tiled=tiled,
+                )
+        except (PoolSaturated, CircuitOpen) as e:
+            return _saturated(e)
+        except asyncio.TimeoutError:
+            return JSONResponse(
+                status_code=504, content={"error": "Count deadline exceeded"}
+            )
+        except GroundedSamError as e:
+            return JSONResponse(status_code=502, content={"error": str(e)})
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+        res, stage = outcome.result, outcome.stage
+        confident, trace = outcome.confident, outcome.trace
+        if confident:
+            await result_cache.put(key, res)
+        label_queue.offer(
+            img_bytes,
+            res,
+            confident=confident,
+            endpoint="count",
+            stage=stage,
+            product=product,
+            prompt=prompt,
+        )
+
+    logger.debug(f"[VISION] /count answered by {stage}: {res.count} objects")
+    return {
+        **_geometry(res),
+        "confident": confident,
+        "stage": stage,
+        "trace": trace,
+        "processing_ms": round((time.perf_counter() - t0) * 1000, 1),
+    }
 
-    logger.debug("DINO-SAM inference on image size: %s", img.size)
 
-    # TODO: Replace with actual GroundedSAM call
+# ---------------------------------------------------------------------------- #
+@router.get("/label-queue/export")
+async def export_label_queue(
+    since: float = 0.0,
+    image_url: str = "/api/vision/label-queue/images/{id}.jpg",
+    label: str = "object",
+):
     """
-    res = requests.post(
-        GROUND_SAM_URL,
-        files={"image": ("img.jpg", img_bytes, "image/jpeg")},
-        data={"prompt": prompt},
-        timeout=60
-    )
-    if res.status_code != 200:
-        raise HTTPException(500, "GroundedSAM service failed")
+    Stream captured low-confidence frames as a Label Studio task list (JSON
+    array), model output included as pre-annotations. `since` is a unix
+    timestamp; `image_url` a template with `{id}`, e.g. a Label Studio
+    local-files path when the queue directory is mounted there.
     """
+    if "{id}" not in image_url:
+        return JSONResponse(
+            status_code=400, content={"error": "image_url must contain {id}"}
+        )
 
-    # Placeholder results
-    count = 1
-    mean_conf = 0.75
+    def tasks():
+        yield b"["
+        for i, task in enumerate(
+            label_queue.iter_label_studio(image_url, since, label)
+        ):
+            yield (b",\n" if i else b"\n") + json.dumps(task).encode("utf-8")
+        yield b"\n]\n"
 
-    buf = BytesIO()
-    img.save(buf, "JPEG", quality=85)
-    buf.seek(0)
+    return StreamingResponse(
+        tasks(),
+        media_type="application/json",
+        headers={"Content-Disposition": "attachment; filename=label_queue.json"},
+    )
 
-    headers = {
-        "X-Objects-Count": str(count),
-        "X-Mean-Conf": f"{mean_conf:.3f}",
-        "X-Segmentation-Quality": "high",
-    }
 
-    return StreamingResponse(buf, media_type="image/jpeg", headers=headers)
+@router.get("/label-queue/images/{image_id}.jpg")
+async def label_queue_image(image_id: str):
+    """Captured frame by content hash"""
+    path = label_queue.image_path(image_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path, media_type="image/jpeg")
+
+
+# ---------------------------------------------------------------------------- #
+@router.get("/profiles")
+async def color_profiles():
+    """Products the classical counter has color profiles for"""
+    return {name: p.description for name, p in PROFILES.items()}
 
 
 # ---------------------------------------------------------------------------- #
@@ -111,9 +475,15 @@ async def vision_health():
     return {
         "status": "healthy",
         "models": {
-            "yolo": "loaded",  # TODO: Check actual model status
-            "dino_sam": "available",
+            "yolo": model_registry.snapshot(),
+            "dino_sam": grounded_sam.breaker.state,
         },
-        "gpu_available": False,  # TODO: Check GPU availability
-        "processing_queue": 0,
+        "gpu_available": gpu_available(),
+        "processing_queue": yolo_batcher.queue_depth,
+        "batching": {"yolo": yolo_batcher.snapshot()},
+        "workers": vision_pool.snapshot(),
+        "cache": result_cache.snapshot(),
+        "grounded_sam": grounded_sam.snapshot(),
+        "cascade": cascade.snapshot(),
+        "label_queue": label_queue.snapshot(),
     }
@@ -0,0 +1,276 @@
+"""
+Process-pool vision worker tier.
+
+- Decode, inference, drawing and JPEG encoding run in dedicated worker
+  processes, so a large image never stalls uploads / Genius lookups on the
+  API event loop.
+- Each worker process loads its own model once (`inference.init_worker`);
+  `swap()` brings up a new, warmed generation of workers for a new model and
+  drains the old one (see registry.py).
+- Uploads are handed over through `multiprocessing.shared_memory` instead of
+  being pickled through the executor pipe; the parent owns and unlinks them.
+  They stay encoded (decoding is the workers' job), so this is not zero-copy:
+  the parent copies each upload into a segment and the worker copies it out.
+- A crashed (broken) pool is replaced once, off the event loop; requests
+  caught in the crash fail, later ones run on the new workers.
+- Admission is bounded: past `max_pending` in-flight requests, `admit()`
+  raises PoolSaturated and the route answers 503 + Retry-After. A job whose
+  caller gave up (cascade deadline) still counts until its worker finishes.
+- `workers=0` keeps everything in-process on a thread (dev / debugging).
+"""
+
+from __future__ import annotations
+
+import os
+import asyncio
+import logging
+import threading
+import multiprocessing as mp
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, List, Optional, Tuple
+
+from . import inference, classical, tiling
+
+logger = logging.getLogger(os.getenv("APP_LOGGER"))
+
+# Jobs a worker may run, by name (module-level callables, picklable on spawn)
+_JOBS: dict[str, Callable[..., List[Any]]] = {
+    "yolo": inference.run_yolo_batch,
+    "annotate": inference.run_annotate_batch,
+    "classical": classical.run_classical_batch,
+    "tiled": tiling.run_tiled_batch,
+}
+
+
+class PoolSaturated(Exception):
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("Vision workers are saturated")
+        self.retry_after = retry_after
+
+
+# ------------------------ worker side ------------------------
+def _run_job(job: str, refs: List[Tuple[str, int]], kwargs: dict) -> List[Any]:
+    # Spawned workers share the parent's resource tracker, so attaching here
+    # does not double-track the segment; the parent alone unlinks it.
+    payloads: List[bytes] = []
+    for name, size in refs:
+        shm = SharedMemory(name=name)
+        try:
+            payloads.append(bytes(shm.buf[:size]))
+        finally:
+            shm.close()
+    return _JOBS[job](payloads, **kwargs)
+
+
+# ------------------------ parent side ------------------------
+class VisionWorkerPool:
+    def __init__(
+        self, workers: int = 1, max_pending: int = 32, retry_after_s: int = 2
+    ) -> None:
+        self.workers = max(0, workers)
+        self.max_pending = max(1, max_pending)
+        self.retry_after_s = retry_after_s
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.model_path: Optional[str] = None
+        self.model_options: Optional[dict] = None  # session settings (autotune)
+        self.model_version = ""
+        self.model_info: List[dict] = []  # one entry per worker process
+        self._draining = 0
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._pending = 0
+        self._rejected = 0
+        self._restarts = 0
+        self._abandoned = 0
+
+    # --- lifecycle ---
+    def start(
+        self, model_path: Optional[str] = None, options: Optional[dict] = None
+    ) -> None:
+        if self._executor is not None or (self.workers == 0 and self.model_info):
+            return
+        if model_path is None:  # restart with what was loaded last
+            model_path, options = self.model_path, self.model_options
+        if self.workers == 0:
+            inference.init_worker(model_path, options)
+            self._set_info([inference.warm_up()])
+        else:
+            self._executor = self._spawn(model_path, options)
+            logger.info(f"[VISION] worker pool started with {self.workers} process(es)")
+        self.model_path, self.model_options = model_path, options
+
+    def _spawn(
+        self, model_path: Optional[str], options: Optional[dict] = None
+    ) -> ProcessPoolExecutor:
+        """New executor whose workers have loaded and warmed `model_path`."""
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=inference.init_worker,
+            initargs=(model_path, options),
+        )
+        try:
+            # processes spawn lazily; touch each one so models load up front
+            futures = [executor.submit(inference.warm_up) for _ in range(self.workers)]
+            self._set_info([f.result() for f in futures])
+        except Exception:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        return executor
+
+    def _set_info(self, infos: List[dict]) -> None:
+        self.model_info = list({i["pid"]: i for i in infos}.values())
+        self.model_version = infos[-1]["version"]
+
+    def swap(self, model_path: str, options: Optional[dict] = None) -> None:
+        """
+        Load + warm `model_path` on a fresh set of workers, then switch new
+        requests over. Requests already running finish on the old workers,
+        which shut down in the background once drained. Blocking.
+        """
+        if self.workers == 0:
+            detector = inference.load_detector(model_path, options)
+            previous = inference.get_detector()
+            inference.set_detector(detector)
+            try:
+                self._set_info([inference.warm_up()])
+            except Exception:
+                inference.set_detector(previous)
+                raise
+            self.model_path, self.model_options = model_path, options
+            return
+
+        new = self._spawn(model_path, options)
+        old, self._executor = self._executor, new
+        self.model_path, self.model_options = model_path, options
+        if old is not None:
+            self._draining += 1
+            threading.Thread(
+                target=self._drain, args=(old,), name="vision-drain", daemon=True
+            ).start()
+
+    def _drain(self, executor: ProcessPoolExecutor) -> None:
+        try:
+            executor.shutdown(wait=True)  # queued + running jobs still complete
+        finally:
+            self._draining -= 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    # --- admission ---
+    @contextmanager
+    def admit(self):
+        """Reserve an in-flight slot for one request or raise PoolSaturated."""
+        if self._pending >= self.max_pending:
+            self._rejected += 1
+            raise PoolSaturated(self.retry_after_s)
+        self._pending += 1
+        try:
+            yield
+        finally:
+            self._pending -= 1
+
+    # --- execution ---
+    async def _current(
+        self, broken: Optional[ProcessPoolExecutor] = None
+    ) -> Optional[ProcessPoolExecutor]:
+        """
+        The current executor, (re)started in a thread if there is none or if
+        `broken` is still the current one. One caller at a time: the jobs that
+        failed with the same broken pool restart it once.
+        """
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if broken is not None and broken is self._executor:
+                logger.error("[VISION] worker pool broken; restarting")
+                self._restarts += 1
+                self._executor = None
+                broken.shutdown(wait=False, cancel_futures=True)
+            if self._executor is None:
+                await asyncio.to_thread(self.start)
+            return self._executor
+
+    async def run(self, job: str, images: List[bytes], **kwargs) -> List[Any]:
+        if self.workers == 0:
+            return await asyncio.to_thread(_JOBS[job], images, **kwargs)
+
+        executor = self._executor or await self._current()
+        segments: List[SharedMemory] = []
+        try:
+            for data in images:
+                shm = SharedMemory(create=True, size=max(1, len(data)))
+                shm.buf[: len(data)] = data
+                segments.append(shm)
+            refs = [(s.name, len(d)) for s, d in zip(segments, images)]
+            # bound to this generation; a swap lets it finish there
+            job_future = executor.submit(_run_job, job, refs, kwargs)
+            try:
+                return await asyncio.wrap_future(job_future)
+            except asyncio.CancelledError:
+                if not job_future.cancel() and not job_future.done():
+                    self._hold(job_future, segments)  # a worker is on it
+                    segments = []
+                raise
+            except BrokenProcessPool:
+                # a drained old generation breaking leaves the current one be
+                try:
+                    await self._current(broken=executor)
+                except Exception as e:
+                    logger.error(f"[VISION] worker pool restart failed: {e!r}")
+                raise RuntimeError("Vision worker crashed")
+        finally:
+            for shm in segments:
+                shm.close()
+                shm.unlink()
+
+    def _hold(self, job_future, segments: List[SharedMemory]) -> None:
+        """
+        Keep an abandoned job (caller cancelled, e.g. a cascade deadline)
+        counted in flight, with its uploads, until the worker is done with it:
+        cancelling the await does not stop a job already running.
+        """
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        self._abandoned += 1
+
+        def release() -> None:
+            self._pending -= 1
+            for shm in segments:
+                shm.close()
+                shm.unlink()
+
+        def done(_) -> None:  # executor thread
+            try:
+                loop.call_soon_threadsafe(release)
+            except RuntimeError:  # loop closed at shutdown
+                release()
+
+        job_future.add_done_callback(done)
+
+    def batch_runner(self, job: str):
+        """Async run_batch callable for a MicroBatcher of (bytes, render) items."""
+
+        async def run_batch(items: List[Tuple[bytes, bool]]) -> List[Any]:
+            images = [img for img, _ in items]
+            return await self.run(job, images, render=[r for _, r in items])
+
+        return run_batch
+
+    def snapshot(self) -> dict:
+        return {
+            "mode": "process" if self.workers else "thread",
+            "workers": self.workers,
+            "model_version": self.model_version,
+            "draining_pools": self._draining,
+            "in_flight": self._pending,
+            "max_pending": self.max_pending,
+            "rejected": self._rejected,
+            "abandoned": self._abandoned,
+            "restarts": self._restarts,
+        }